@@ -1,55 +1,332 @@
 ### IMPORTS #########
-from flask import Flask, send_from_directory, abort, request    # The Main Flask App thing, and send_from_directory to serve static files from local directory
+from flask import Flask, abort, request                         # The Main Flask App thing
+from io import BytesIO
+import os
+import threading
+import time
 
 import weather_report
-from flask import send_file
+from upstream import UpstreamUnavailable, CircuitOpen
+from quota import QuotaExceeded
+from render_engine import RenderQueueFull
+from prewarm import PrewarmScheduler
+from static_assets import StaticAssets
+from wttr import encode, timing
+from flask import send_file, Response, g
+import metrics
+import projection
 
 ### INITIALISING APP #########
 app = Flask(__name__)
 
+### CONSTANTS #########
+# Default card encoding per route, other encodings (see benchmarks/encoding.py) are only sent when asked for with ?format=
+CARD_FORMAT = {
+    'hourly':   os.getenv('WTTR_FORMAT', 'png'),
+    'tomorrow': os.getenv('TMRW_FORMAT', 'png'),
+    'week':     os.getenv('WEEK_FORMAT', 'png'),
+}
+
+# Background pre-warming of the most requested cities (PREWARM_TOP_N=0 turns it off)
+PREWARM_TOP_N       = int(os.getenv('PREWARM_TOP_N', 20))                   # how many of the most requested cities are kept warm
+PREWARM_INTERVAL    = float(os.getenv('PREWARM_INTERVAL', 30))              # seconds between passes, short enough to follow the progress marker
+PREWARM_MARGIN      = float(os.getenv('PREWARM_MARGIN', 20))                # refresh forecasts this many seconds before they expire
+PREWARM_BUDGET      = int(os.getenv('PREWARM_BUDGET', 120))                 # most upstream calls pre-warming may make per hour
+PREWARM_TRACKED     = int(os.getenv('PREWARM_TRACKED', 10_000))             # most cities whose popularity is tracked (any "lat,lon" counts as one)
+
+### PRE-WARMING #########
+PREWARM = PrewarmScheduler(PREWARM_TOP_N, {kind: [image_format] for kind, image_format in CARD_FORMAT.items()},
+                           interval=PREWARM_INTERVAL, margin=PREWARM_MARGIN, budget=PREWARM_BUDGET, max_tracked=PREWARM_TRACKED)
+
+### STATIC FILES #########
+STATIC = StaticAssets()                                                     # the whole Svelte app, read and compressed once
+
+### BACKGROUND WORK #########
+_started = False
+_start_lock = threading.Lock()
+
+def start_background_work() -> None:
+    '''
+    Starts the render workers, pre-warming, the on-disk store's writer and compaction, and static file reloading, once per serving process. Nothing starts on import, so whatever only imports the app
+    (scripts, tests, a render worker) never runs any of it. run.py calls this before serving, otherwise the first request does.
+    '''
+    global _started
+    with _start_lock:                                                       # the other first requests wait until it's all up
+        if _started:
+            return
+
+        weather_report.RENDER_ENGINE.start()
+        weather_report.STORE.start()
+        PREWARM.start()
+        STATIC.start()
+        _started = True
+
+### ERRORS #########
+# weatherapi.com being down or too slow isn't the same as the city not existing
+@app.errorhandler(UpstreamUnavailable)
+def upstream_unavailable(e):
+    headers = {}
+    if isinstance(e, CircuitOpen):
+        headers["Retry-After"] = str(max(1, round(weather_report.BREAKER.retry_after())))
+    elif isinstance(e, QuotaExceeded):
+        headers["Retry-After"] = str(max(1, round(weather_report.QUOTA.retry_after())))
+    return "weather service unavailable, try again in a bit :(", 503, headers
+
+# Every render worker is busy and the queue is full, so push back instead of piling up requests
+@app.errorhandler(RenderQueueFull)
+def render_queue_full(e):
+    return "too busy drawing weather cards, try again in a second", 503, {"Retry-After": "1"}
+
+### INSTRUMENTATION #########
+# Every request collects how long each stage took, sent back as a Server-Timing header and kept as /metrics histograms
+@app.before_request
+def start_timing():
+    start_background_work()                                                 # a no-op once started (e.g. by run.py)
+    g.started = time.perf_counter()
+    g.stages = timing.start()
+    weather_report.reset_staleness()
+
+@app.after_request
+def finish_timing(response):
+    if 'started' not in g:                                                  # failed before the timer even started
+        return response
+
+    total = time.perf_counter() - g.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'      # the rule, not the URL, so cities don't explode the label count
+    stages = timing.totals(g.stages)
+
+    for stage, seconds in stages.items():
+        metrics.STAGE_DURATION.observe(seconds, route, stage)
+    metrics.REQUEST_DURATION.observe(total, route, str(response.status_code))
+
+    stages['total'] = total
+    response.headers['Server-Timing'] = ', '.join(f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in stages.items())
+
+    stale = weather_report.staleness()
+    if stale:                                                               # answered from a last-known-good forecast while weatherapi is slow or down
+        response.headers['X-Forecast-Stale'] = str(round(stale))            # seconds past its expiry
+        response.headers['Warning'] = '110 - "Response is Stale"'
+    return response
+
+@app.teardown_request
+def stop_timing(error=None):
+    timing.stop()
+
+def cache_metrics() -> list:
+    '''/metrics lines for the forecast and card caches (and the on-disk store behind them), read from their stats() at scrape time'''
+    caches = {'forecast': weather_report.FORECAST_CACHE.stats(), 'card': weather_report.CARD_CACHE.stats(), 'api': weather_report.API_CACHE.stats(),
+              'not_found': weather_report.NOT_FOUND_CACHE.stats()}
+    store = weather_report.STORE.stats()
+    if store['enabled']:
+        caches['store'] = store
+    counters = {
+        'hits':         'Cache lookups answered from memory',
+        'misses':       'Cache lookups that had to fetch or render',
+        'coalesced':    'Lookups that waited on an identical fetch already in flight',
+        'evictions':    'Entries dropped to stay under the memory budget',
+        'stale':        'Lookups answered with an expired (last-known-good) entry',
+        'revalidations':'Background refreshes of expired entries',
+        'writes':       'Entries written to the on-disk store',
+        'dropped':      'Writes to the on-disk store dropped because the writer was behind',
+        'errors':       'On-disk store operations SQLite failed',
+    }
+
+    lines = []
+    for counter, description in counters.items():
+        samples = {name: stats[counter] for name, stats in caches.items() if counter in stats}
+        lines += metrics.stats_family(f'wttr_cache_{counter}_total', description, 'counter', samples, 'cache')
+
+    lines += metrics.stats_family('wttr_cache_entries', 'Entries currently cached', 'gauge', {name: stats['entries'] for name, stats in caches.items()}, 'cache')
+    lines += metrics.stats_family('wttr_cache_bytes', 'Bytes held by each cache (on disk for the store)', 'gauge', {name: stats['bytes'] for name, stats in caches.items() if 'bytes' in stats}, 'cache')
+    return lines
+
+metrics.REGISTRY.register_callback(cache_metrics)
+
+def upstream_metrics() -> list:
+    '''/metrics lines for the weatherapi.com circuit breaker and quota'''
+    breaker = weather_report.BREAKER.stats()
+    lines = metrics.stats_family('wttr_upstream_circuit_open', 'Whether calls to weatherapi.com are currently being skipped', 'gauge', {'weatherapi': int(breaker['state'] == 'open')}, 'upstream')
+    lines += metrics.stats_family('wttr_upstream_circuit_trips_total', 'Times the circuit breaker opened', 'counter', {'weatherapi': breaker['trips']}, 'upstream')
+
+    quota = weather_report.QUOTA.stats()                                    # shared by every worker, so any of them reports the same numbers
+    if quota['enabled']:
+        lines += metrics.stats_family('wttr_upstream_quota_tokens', 'Calls left in the per-minute bucket', 'gauge', {'weatherapi': quota['tokens']}, 'upstream')
+        lines += metrics.stats_family('wttr_upstream_quota_month_used', 'Calls made this calendar month', 'gauge', {'weatherapi': quota['used_this_month']}, 'upstream')
+        lines += metrics.stats_family('wttr_upstream_quota_granted_total', 'Calls the quota let through', 'counter', quota['granted'], 'priority')
+        lines += metrics.stats_family('wttr_upstream_quota_denied_total', 'Calls the quota refused', 'counter', quota['denied'], 'priority')
+    return lines
+
+metrics.REGISTRY.register_callback(upstream_metrics)
+
+### HELPERS #########
+def negotiate_format(kind: str) -> str:
+    '''
+    Picks the card encoding from ?format=, else SVG for clients that prefer it, else the route's default.
+    Accepting WebP isn't enough to get it: every browser does, and lossy WebP takes twice as long to encode as PNG8 for a bigger card.
+    '''
+    image_format = request.args.get('format')
+    if image_format is not None:
+        if image_format not in encode.FORMATS and image_format not in encode.VECTOR_FORMATS:
+            abort(400, f"unknown format, pick one of: {', '.join([*encode.FORMATS, *encode.VECTOR_FORMATS])}")
+        return image_format
+
+    accept = request.accept_mimetypes
+    if accept['image/svg+xml'] > max(accept['image/png'], accept['image/webp']):   # only clients that prefer it, browsers list SVG next to every raster format
+        return 'svg'
+
+    return CARD_FORMAT[kind]
+
+def send_card(kind: str, inputs: dict, image_format: str):
+    '''Sends a rendered card with its content hash as a strong ETag, or an empty 304 if the client already has it'''
+    etag = weather_report.card_key(kind, inputs, image_format)
+
+    if request.if_none_match.contains(etag):                                # skip rendering entirely, the browser's copy is still good
+        response = Response(status=304)
+    else:
+        weather_card = BytesIO(weather_report.render_card(kind, inputs, image_format, etag))
+        response = send_file(weather_card, mimetype=encode.mimetype(image_format))
+
+    response.set_etag(etag)
+    response.vary.add('Accept')                                             # the same URL can come back as PNG, WebP or SVG
+    return response
+
 ### ROUTES #########
 # SVELTE :: Path for our main Svelte page
 @app.route("/")
 def base():
-    return send_from_directory('../frontend/public', 'index.html')
+    return STATIC.send('index.html')
 
 # SVELTE :: Path for all the static files (compiled JS/CSS, etc.)
 @app.route("/<path:path>")
 def home(path):
-    return send_from_directory('../frontend/public', path)
+    return STATIC.send(path)
 
 # BACKEND :: Fetch current weather conditions and weather forecast for the day
 @app.route('/wttr/<city>')
 def wttr(city: str):
+    image_format = negotiate_format('hourly')                               # before fetching, a bad ?format= shouldn't cost an upstream call
+    PREWARM.record(city, 'hourly', image_format)
+
     try:
-        weather_card = weather_report.weather_report(city)
-        weather_card.seek(0)
-        return send_file(weather_card, mimetype='image/png')# as_attachment=True, attachment_filename='weather_card.png')
+        inputs = weather_report.weather_report_inputs(city)
 
     except ValueError:
         abort(404, "city not found :(")
 
+    return send_card('hourly', inputs, image_format)
+
 # BACKEND :: Fetch tomorrow's weather forecast and average condition
 @app.route('/tmrw/<city>')
 def tomorrow(city: str):
     transparent = request.args.get('transparent', default=False, type=lambda v: v.lower() == 'true')   # whether the card should be solid white or transparent (aka light vs dark mode)
+    image_format = negotiate_format('tomorrow')
+    PREWARM.record(city, 'tomorrow', image_format)
 
     try:
-        weather_card = weather_report.tomorrow(city, transparent)
-        weather_card.seek(0)
-        return send_file(weather_card, mimetype='image/png')
+        inputs = weather_report.tomorrow_inputs(city, transparent)
 
     except ValueError:
         abort(404, "city not found :(")
 
+    return send_card('tomorrow', inputs, image_format)
+
+# BACKEND :: Every forecasted day (today, tomorrow and the day after) in one strip, from a single fetch
+@app.route('/week/<city>')
+def week(city: str):
+    transparent = request.args.get('transparent', default=False, type=lambda v: v.lower() == 'true')   # same light/dark switch as /tmrw
+    image_format = negotiate_format('week')
+    PREWARM.record(city, 'week', image_format)
+
+    try:
+        inputs = weather_report.week_inputs(city, transparent)
+
+    except ValueError:
+        abort(404, "city not found :(")
+
+    return send_card('week', inputs, image_format)
+
+# BACKEND :: The weather data as JSON, optionally cut down -> /api/london?fields=current.temp,forecast.hour.temp&hours=12
 @app.route('/api/<city>')
 def api(city: str):
+    hours = request.args.get('hours', type=int)
+    if hours is not None and hours < 0:
+        abort(400, "hours can't be negative")
+
+    encodings = [e for e in ('br', 'gzip') if request.accept_encodings[e]]
+
     try:
-        return weather_report.get_weather_report_data(city).model_dump()
-    
+        body, encoding, etag = weather_report.get_api_payload(city, request.args.get('fields'), hours, encodings)
+
+    except projection.UnknownField as e:
+        abort(400, str(e))
+
     except ValueError:
         abort(500, "yikes")
 
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+# BACKEND :: City autocomplete for the search bar, straight from the offline gazetteer -> /api/suggest?q=lon
+@app.route('/api/suggest')
+def api_suggest():
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', default=8, type=int)
+
+    cities = weather_report.GAZETTEER.suggest(query, max(1, min(limit, 20)))
+    response = app.json.response({
+        "query":        query,
+        "suggestions":  [{"name": c.name, "country": c.country, "label": weather_report.GAZETTEER.label(c)} for c in cities],
+    })
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400                                  # the gazetteer only changes with a deploy
+    return response
+
+# BACKEND :: Fetch the weather data for many cities at once -> POST {"cities": ["london", "paris", ...]}
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    body = request.get_json(silent=True)
+    cities = body.get('cities') if isinstance(body, dict) else body
+
+    if not isinstance(cities, list) or not all(isinstance(c, str) and c.strip() for c in cities):
+        abort(400, "expected a list of city names")
+
+    if len(cities) > weather_report.BATCH_MAX_CITIES:
+        abort(400, f"too many cities, the limit is {weather_report.BATCH_MAX_CITIES}")
+
+    reports, errors = weather_report.get_weather_reports(cities)
+    return {
+        "reports":  {city: report.model_dump() for city, report in reports.items()},
+        "errors":   errors,
+    }
+
+# BACKEND :: Cache counters to keep an eye on how many upstream calls are being saved
+@app.route('/stats')
+def stats():
+    return {
+        "forecast_cache":   weather_report.FORECAST_CACHE.stats(),
+        "card_cache":       weather_report.CARD_CACHE.stats(),
+        "api_cache":        weather_report.API_CACHE.stats(),
+        "not_found_cache":  weather_report.NOT_FOUND_CACHE.stats(),
+        "upstream":         weather_report.BREAKER.stats(),
+        "quota":            weather_report.QUOTA.stats(),
+        "store":            weather_report.STORE.stats(),
+        "prewarm":          PREWARM.stats(),
+        "static":           STATIC.stats(),
+    }
+
+# BACKEND :: Prometheus scrape endpoint with request/stage latency histograms, upstream errors and cache counters
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.expose(), mimetype='text/plain; version=0.0.4')
+
 ### RUNNING THE WEBSITE #########
 if __name__ == '__main__':   
     app.run(debug=True)
\ No newline at end of file
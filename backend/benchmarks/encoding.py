@@ -0,0 +1,62 @@
+###### DESCRIPTION #################################################
+### Benchmarks every card encoding (encode time vs. payload size) so each route's default can be picked.
+### Run from the backend folder: python -m benchmarks.encoding [--repeat 10] [--json results.json]
+
+
+###### IMPORTS #################################################
+import argparse
+import json
+import time
+from statistics import median
+
+from wttr import pill
+from wttr.encode import FORMATS, encode_card
+
+
+###### SAMPLE CARDS #################################################
+FORECAST        = ['4º', '7º', '10º', '8º', '3º', '0º']
+FORECAST_CODES  = ['296', '116', '176', '200', '302', '999']
+
+def sample_canvases() -> dict:
+    '''One finished (not yet encoded) canvas per card type, drawn from fixed inputs'''
+    return {
+        'hourly':           pill.draw_weather_card_hourly('LONDON', '9º', '116', '10:07', FORECAST, FORECAST_CODES, 200),
+        'tomorrow':         pill.draw_tomorrow_forecast('TOKYO', '12º', '296', 'NOVEMBER 21', FORECAST, FORECAST_CODES, False),
+        'tomorrow-dark':    pill.draw_tomorrow_forecast('TOKYO', '12º', '296', 'NOVEMBER 21', FORECAST, FORECAST_CODES, True),
+    }
+
+
+###### BENCHMARK #################################################
+def run(repeat:int) -> list:
+    '''Times every format on every card, returning one row per (card, format)'''
+    results = []
+    for card, canvas in sample_canvases().items():
+        for image_format in FORMATS:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                size = len(encode_card(canvas, image_format).getbuffer())
+                timings.append(time.perf_counter() - start)
+
+            results.append({"card": card, "format": image_format, "encode_ms": round(median(timings) * 1000, 2), "bytes": size})
+
+    return results
+
+def print_table(results:list) -> None:
+    print(f"{'card':<15}{'format':<12}{'encode ms':>10}{'KiB':>9}")
+    for r in results:
+        print(f"{r['card']:<15}{r['format']:<12}{r['encode_ms']:>10}{r['bytes'] / 1024:>9.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark weather card encodings')
+    parser.add_argument('--repeat', type=int, default=10, help='encodes per card and format (the median is reported)')
+    parser.add_argument('--json', help='also save the results to this file')
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print_table(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,245 @@
+###### DESCRIPTION #################################################
+### Load test: starts fake_weatherapi.py (recorded payloads, optional latency and errors), starts the Flask app in its
+### own process pointed at it, then keeps `concurrency` requests in flight over a mix of routes and cities and reports
+### throughput, p50/p95/p99 latency and error rates for every concurrency level asked for.
+### Run from the backend folder:
+###     python -m benchmarks.load --concurrency 1 8 32 --duration 20 --json load.json
+###     python -m benchmarks.load --mix wttr=5,tmrw=2,api=3 --latency 0.15 --error-rate 0.05
+###     python -m benchmarks.load --url http://127.0.0.1:5000      (an instance that's already running, e.g. under gunicorn)
+
+
+###### IMPORTS #################################################
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from statistics import quantiles
+from typing import Dict, List
+
+import httpx
+
+from fake_weatherapi import FakeWeatherAPI
+
+
+###### CONSTANTS #################################################
+ROUTES = {
+    'wttr':     '/wttr/{city}',
+    'tmrw':     '/tmrw/{city}',
+    'week':     '/week/{city}',
+    'api':      '/api/{city}',
+    'api_lite': '/api/{city}?fields=current.temp,location.name&hours=6',
+}
+MIX         = 'wttr=5,tmrw=2,api=3'                                     # relative weight of each route
+CITIES      = ['London', 'Paris', 'Tokyo', 'Los Angeles']               # the recorded payloads fake_weatherapi serves
+BACKEND     = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVE       = ("import sys; from werkzeug.serving import run_simple; from app import app, start_background_work; "
+               "start_background_work(); run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=True)")
+STARTUP_TIMEOUT = 120                                                   # seconds the app gets to import (icons, gazetteer...) and start listening
+
+
+###### HELPERS #################################################
+def parse_mix(mix:str) -> Dict[str, float]:
+    '''"wttr=5,api=3" -> {"wttr": 5.0, "api": 3.0}'''
+    weights = {}
+    for part in mix.split(','):
+        route, _, weight = part.partition('=')
+        if route.strip() not in ROUTES:
+            raise SystemExit(f'unknown route {route.strip()!r}, pick from {", ".join(ROUTES)}')
+        weights[route.strip()] = float(weight or 1)
+
+    return weights
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def summarise(samples:List[tuple], duration:float) -> Dict:
+    '''Throughput, latency percentiles and errors of (route, status, seconds) samples'''
+    latencies = sorted(seconds for _, _, seconds in samples)
+    errors = sum(1 for _, status, _ in samples if not (200 <= status < 400))   # status 0 means the request itself failed
+
+    cuts = quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        "requests":         len(samples),
+        "throughput_rps":   round(len(samples) / duration, 1),
+        "errors":           errors,
+        "error_rate":       round(errors / len(samples), 4) if samples else 0,
+        "p50_ms":           round(cuts[49] * 1000, 2) if cuts else None,
+        "p95_ms":           round(cuts[94] * 1000, 2) if cuts else None,
+        "p99_ms":           round(cuts[98] * 1000, 2) if cuts else None,
+        "max_ms":           round(latencies[-1] * 1000, 2) if latencies else None,
+        "status":           {str(status): count for status, count in sorted(Counter(status for _, status, _ in samples).items())},
+    }
+
+
+###### APP UNDER TEST #################################################
+class AppServer:
+    '''
+    The Flask app in a child process (so the load generator doesn't share its GIL), on Werkzeug's threaded server.
+    It gets its own on-disk store and quota files, so every run starts cold and runs don't affect each other.
+
+    weatherapi: URL WEATHERAPI is set to
+    '''
+    def __init__(self, weatherapi:str) -> None:
+        self.port = free_port()
+        self._folder = tempfile.TemporaryDirectory(prefix='wttr-load-')
+        env = {**os.environ,
+               'WEATHERAPI':    weatherapi,
+               'STORE_FILE':    os.path.join(self._folder.name, 'store.sqlite3'),
+               'QUOTA_FILE':    os.path.join(self._folder.name, 'quota')}
+
+        self.process = subprocess.Popen([sys.executable, '-c', SERVE, str(self.port)], cwd=BACKEND, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def wait(self) -> None:
+        '''Blocks until the app answers, or raises if it died or took too long'''
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'the app exited with {self.process.returncode} before it started listening')
+            try:
+                httpx.get(f'{self.url}/stats', timeout=1)
+                return
+            except httpx.TransportError:
+                time.sleep(0.2)
+
+        raise RuntimeError(f'the app did not start listening within {STARTUP_TIMEOUT}s')
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._folder.cleanup()
+
+    def __enter__(self):
+        self.wait()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+###### LOAD GENERATOR #################################################
+async def drive(url:str, concurrency:int, duration:float, warmup:float, weights:Dict[str, float], cities:List[str], seed:int) -> Dict:
+    '''
+    Keeps `concurrency` requests in flight (each worker sends its next request as soon as the last one is answered)
+    for warmup + duration seconds, and summarises the ones sent after the warm-up.
+    '''
+    rng = random.Random(seed)
+    routes, route_weights = list(weights), list(weights.values())
+    samples = []
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        measured_from, deadline = start + warmup, start + warmup + duration
+
+        async def worker():
+            while True:
+                route = rng.choices(routes, route_weights)[0]
+                path = ROUTES[route].format(city=rng.choice(cities))
+
+                sent = time.perf_counter()
+                if sent >= deadline:
+                    return
+                try:
+                    response = await client.get(path)
+                    await response.aread()
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+
+                if sent >= measured_from:
+                    samples.append((route, status, time.perf_counter() - sent))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    routes_seen = sorted({route for route, _, _ in samples})
+    return {
+        "concurrency":  concurrency,
+        "total":        summarise(samples, duration),
+        "routes":       {route: summarise([s for s in samples if s[0] == route], duration) for route in routes_seen},
+    }
+
+def run(concurrency:List[int], duration:float, warmup:float, mix:str, cities:List[str], latency:float, error_rate:float,
+        seed:int, url:str=None) -> Dict:
+    '''Runs one load test per concurrency level, against url or (by default) a local app and fake weatherapi'''
+    weights = parse_mix(mix)
+    levels, upstream = [], None
+
+    if url:
+        for level in concurrency:
+            levels.append(asyncio.run(drive(url, level, duration, warmup, weights, cities, seed)))
+    else:
+        with FakeWeatherAPI(latency=latency, error_rate=error_rate, seed=seed) as fake, AppServer(fake.url) as server:
+            for level in concurrency:
+                levels.append(asyncio.run(drive(server.url, level, duration, warmup, weights, cities, seed)))
+            upstream = {"requests": fake.requests, "errors_injected": fake.errors}
+
+    return {
+        "meta": {
+            "python":       platform.python_version(),
+            "machine":      platform.machine(),
+            "cpus":         os.cpu_count(),
+            "time":         time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "target":       url or 'local',
+            "duration_s":   duration,
+            "warmup_s":     warmup,
+            "mix":          weights,
+            "cities":       cities,
+            "upstream_latency_s":   latency,
+            "upstream_error_rate":  error_rate,
+        },
+        "levels": levels,
+        "upstream": upstream,
+    }
+
+
+###### REPORTING #################################################
+def print_table(current:Dict) -> None:
+    print(f"{'concurrency':<12}{'route':<10}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>9}")
+    for level in current['levels']:
+        rows = [('all', level['total'])] + list(level['routes'].items())
+        for route, r in rows:
+            print(f"{level['concurrency']:<12}{route:<10}{r['requests']:>9}{r['throughput_rps']:>9}{r['p50_ms']!s:>9}{r['p95_ms']!s:>9}"
+                  f"{r['p99_ms']!s:>9}{r['max_ms']!s:>9}{r['error_rate'] * 100:>8.1f}%")
+
+    if current['upstream']:
+        print(f"fake weatherapi: {current['upstream']['requests']} requests, {current['upstream']['errors_injected']} injected errors")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the backend against a local fake weatherapi')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='requests kept in flight, one run per value')
+    parser.add_argument('--duration', type=float, default=10, help='seconds measured per concurrency level')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of load before measuring starts, per level')
+    parser.add_argument('--mix', default=MIX, help=f'route=weight pairs, from: {", ".join(ROUTES)}')
+    parser.add_argument('--cities', nargs='+', default=CITIES, help='cities to request (the fake only knows the recorded ones)')
+    parser.add_argument('--latency', type=float, default=0, help='seconds the fake weatherapi waits before answering')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of fake weatherapi calls that fail with a 503')
+    parser.add_argument('--seed', type=int, default=1, help='seed for the request mix and the injected errors')
+    parser.add_argument('--url', help='load test this running instance instead of starting one')
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+
+    current = run(args.concurrency, args.duration, args.warmup, args.mix, args.cities, args.latency, args.error_rate, args.seed, args.url)
+    print_table(current)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(current, f, indent=2)
@@ -0,0 +1,157 @@
+###### DESCRIPTION #################################################
+### Times every stage of the card pipeline separately (fetch, parse, recolour, icons, text, encoding) plus
+### each complete card builder, using the recorded weatherapi payloads served by fake_weatherapi.py.
+### Run from the backend folder:
+###     python -m benchmarks.pipeline --json before.json
+###     python -m benchmarks.pipeline --compare before.json [--threshold 10]    (exits with 1 on a regression)
+
+
+###### IMPORTS #################################################
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from statistics import median, quantiles
+from typing import Callable, Dict
+
+from fake_weatherapi import FakeWeatherAPI
+
+
+###### CONSTANTS #################################################
+CITY = 'london'                                                         # recorded payload the inputs are drawn from (see fixtures/weatherapi)
+
+
+###### TIMING #################################################
+def measure(fn:Callable, repeat:int, setup:Callable=None) -> Dict[str, float]:
+    '''Calls fn repeat times (after one untimed warm-up call), running setup untimed before each call'''
+    if setup: setup()
+    fn()
+
+    timings = []
+    for _ in range(repeat):
+        if setup: setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    p95 = quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+    return {
+        "median_ms":    round(median(timings) * 1000, 3),
+        "p95_ms":       round(p95 * 1000, 3),
+        "min_ms":       round(min(timings) * 1000, 3),
+        "repeat":       repeat,
+    }
+
+
+###### STAGES #################################################
+def stages(weather_report) -> Dict[str, tuple]:
+    '''Every stage to time -> (function, setup run before each call or None)'''
+    from wttr import pill, recolour
+    from wttr.encode import encode_card
+
+    hourly = weather_report.weather_report_inputs(CITY)
+    tomorrow = weather_report.tomorrow_inputs(CITY, False)
+    week = weather_report.week_inputs(CITY, False)
+    accent = pill.weather_codes.ACCENT_COLOUR[pill.weather_codes.WWO_CODE[hourly['current_code']]]
+    icon = pill.ICON_ATLAS.get(pill.weather_codes.WWO_CODE[str(tomorrow['condition_code'])], 128)
+    mask = recolour.RecolourMask(icon, pill.ICON_COLOUR)
+    canvas = pill.draw_weather_card_hourly(**hourly)
+    raw = weather_report.fetch_api_data(CITY).raw
+
+    def text():
+        elements = pill.create_text_elements(hourly['city'], hourly['current_temp'], hourly['time'], hourly['forecast'], accent, pill.forecast_pos_y, pill.forecast_colours)
+        pill.draw_text_elements(pill.TEMPLATE_IMG.convert('RGB'), elements)
+
+    return {
+        'fetch_api_data':           (lambda: weather_report.fetch_api_data(CITY), weather_report.FORECAST_CACHE.clear),
+        'parse_weather_report':     (lambda: weather_report.parse_weather_report(raw), None),
+        'recolour_mask':            (lambda: recolour.RecolourMask(icon, pill.ICON_COLOUR), None),
+        'recolour':                 (lambda: mask.tint((254, 192, 22)), None),
+        'paste_forecast_icons':     (lambda: pill.paste_forecast_icons(pill.TEMPLATE_IMG.convert('RGB'), hourly['forecast_codes'], pill.icons_pos_y), None),
+        'paste_forecast_icons_dark':(lambda: pill.paste_forecast_icons(pill.DARK_FORECAST_IMG.copy(), tomorrow['forecast_codes'], pill.tomorrow_icons_pos_y, coloured_icons=True), None),
+        'text_elements':            (text, None),
+        'png_encode':               (lambda: encode_card(canvas, 'png'), None),
+        'card_hourly':              (lambda: pill.create_weather_card_hourly(**hourly), None),
+        'card_tomorrow':            (lambda: pill.create_tomorrow_forecast(**tomorrow), None),
+        'card_tomorrow_dark':       (lambda: pill.create_tomorrow_forecast(**{**tomorrow, 'transparent': True}), None),
+        'card_week':                (lambda: pill.create_week_forecast(**week), None),
+    }
+
+def run(repeat:int, only:list=None) -> Dict:
+    '''Times every stage (or just the ones in only) against a local stub of weatherapi.com'''
+    with FakeWeatherAPI() as fake:
+        os.environ['WEATHERAPI'] = fake.url                             # must be set before weather_report reads its config
+        os.environ['STORE_FILE'] = ''                                   # fetch_api_data is timed against the fake, not the on-disk store
+        os.environ['QUOTA_PER_MINUTE'] = os.environ['QUOTA_PER_MONTH'] = '0'
+        import weather_report
+
+        results = {}
+        for name, (fn, setup) in stages(weather_report).items():
+            if only and name not in only:
+                continue
+            results[name] = measure(fn, repeat, setup)
+
+    return {
+        "meta": {
+            "python":   platform.python_version(),
+            "machine":  platform.machine(),
+            "time":     time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "repeat":   repeat,
+        },
+        "results": results,
+    }
+
+
+###### REPORTING #################################################
+def compare(baseline:Dict, current:Dict, threshold:float) -> list:
+    '''Stages whose median got slower than the baseline's by more than threshold percent, as (stage, before, after, change %)'''
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or not before['median_ms']:
+            continue
+
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100
+        if change > threshold:
+            regressions.append((name, before['median_ms'], result['median_ms'], round(change, 1)))
+
+    return regressions
+
+def print_table(current:Dict, baseline:Dict=None) -> None:
+    print(f"{'stage':<28}{'median ms':>10}{'p95 ms':>10}{'min ms':>10}{'vs base':>10}")
+    for name, r in current['results'].items():
+        before = (baseline or {}).get('results', {}).get(name)
+        change = f"{(r['median_ms'] - before['median_ms']) / before['median_ms'] * 100:+.1f}%" if before and before['median_ms'] else ''
+        print(f"{name:<28}{r['median_ms']:>10}{r['p95_ms']:>10}{r['min_ms']:>10}{change:>10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark each stage of the weather card pipeline')
+    parser.add_argument('--repeat', type=int, default=20, help='timed calls per stage (median and p95 are reported)')
+    parser.add_argument('--only', nargs='+', help='only time these stages')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=10, help='slowdown (in percent) of a median that counts as a regression')
+    args = parser.parse_args()
+
+    current = run(args.repeat, args.only)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print_table(current, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if baseline:
+        regressions = compare(baseline, current, args.threshold)
+        for name, before, after, change in regressions:
+            print(f'REGRESSION {name}: {before} ms -> {after} ms (+{change}%)')
+
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,330 @@
+###### DESCRIPTION #################################################
+### In-process caches so repeated requests for the same city don't hammer weatherapi.com
+
+
+###### IMPORTS #################################################
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+###### SINGLE-FLIGHT HELPER #################################################
+class _Flight:
+    '''An upstream call in progress that other threads asking for the same key can wait on'''
+    def __init__(self) -> None:
+        self.done   = threading.Event()
+        self.value  = None
+        self.error  = None
+
+    def result(self) -> Any:
+        '''Waits for the call to finish, returning its value or raising its error'''
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+###### TTL CACHE #################################################
+class TTLCache:
+    '''
+    Thread-safe cache where every entry carries its own expiry time.
+    Concurrent misses for the same key are collapsed into a single call to the loader.
+    Expired entries can be kept as last-known-good values for a while, served straight away while a fresh one loads (see get_or_revalidate).
+
+    ttl_for: Function that receives a freshly loaded value and returns how many seconds it stays valid
+    max_entries: Maximum amount of entries kept before the oldest ones are dropped
+    clock: Function returning the current time in seconds (swappable for testing)
+    keep_stale: Seconds an entry is kept after it expires, to be served stale while it's reloaded
+    '''
+    def __init__(self, ttl_for: Callable[[Any], float], max_entries: int = 1024, clock: Callable[[], float] = time.time, keep_stale: float = 0) -> None:
+        self.ttl_for        = ttl_for
+        self.max_entries    = max_entries
+        self.clock          = clock
+        self.keep_stale     = keep_stale
+
+        self._lock      = threading.Lock()
+        self._entries   = {}                                                # key -> (expires_at, value), in insertion order
+        self._flights   = {}                                                # key -> _Flight currently loading that key
+
+        self.hits       = 0
+        self.misses     = 0
+        self.coalesced  = 0
+        self.stale      = 0
+        self.revalidations = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        '''Returns the cached value for key, calling loader() to fetch it if it's missing or expired'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                return entry[1]
+
+            flight = self._flights.get(key)
+            leader = flight is None                                         # only the first thread to miss actually calls the loader
+            if leader:
+                self.misses += 1
+                flight = _Flight()
+                self._flights[key] = flight
+            else:
+                self.coalesced += 1
+
+        # Followers just wait for the leader's result (or error)
+        if not leader:
+            return flight.result()
+
+        return self._lead(key, flight, loader)
+
+    def _lead(self, key: Hashable, flight: _Flight, loader: Callable[[], Any]) -> Any:
+        '''Calls the loader for a flight this thread started, sharing the outcome with whoever waits on it'''
+        try:
+            value = loader()
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+
+        self.finish(key, flight, value)
+        return value
+
+    def join(self, key: Hashable) -> Tuple[_Flight, bool]:
+        '''
+        For callers that load a missing key themselves (e.g. from a coroutine): the flight loading key, and whether the caller
+        just started it, in which case it must finish() it. Otherwise its result() is what the other caller loaded
+        (or the cached value, if one was stored since the caller last looked).
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                flight = _Flight()
+                flight.value = entry[1]
+                flight.done.set()
+                return flight, False
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+
+            self.misses += 1
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def finish(self, key: Hashable, flight: _Flight, value: Any = None, error: BaseException = None) -> None:
+        '''Ends a flight, caching value and handing it to whoever waits on it (errors are shared with them but never cached)'''
+        try:
+            if error is None:
+                flight.value = value
+                self._store(key, value)
+            else:
+                flight.error = error
+
+        except BaseException as e:
+            flight.error = e
+            raise
+
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def get_or_revalidate(self, key: Hashable, loader: Callable[[], Any], submit: Callable, refresh: Callable[[], Any] = None) -> Tuple[Any, float]:
+        '''
+        Like get_or_load, but an expired value still within keep_stale is returned straight away while submit()
+        reloads it in the background (once, however many requests see it stale).
+        Returns the value and how many seconds past its expiry it is (0 when fresh).
+
+        submit: Function that runs a callable in the background, e.g. a ThreadPoolExecutor's submit
+        refresh: Loader used for the background reload, if it should differ from loader
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            now = self.clock()
+
+            if entry is not None and entry[0] <= now < entry[0] + self.keep_stale:
+                self.stale += 1
+                flight = self._claim(key)
+                stale = (entry[1], now - entry[0])
+            else:
+                stale = None
+
+        if stale is None:
+            return self.get_or_load(key, loader), 0
+
+        if flight is not None:
+            self._submit(key, flight, refresh or loader, submit)
+        return stale
+
+    def revalidate(self, key: Hashable, loader: Callable[[], Any], submit: Callable) -> bool:
+        '''Reloads key in the background unless it's already being loaded, returning whether a reload was started'''
+        with self._lock:
+            flight = self._claim(key)
+
+        return flight is not None and self._submit(key, flight, loader, submit)
+
+    def _claim(self, key: Hashable) -> Optional[_Flight]:
+        '''Registers a background reload of key (with the lock held), or returns None if one is already in flight'''
+        if key in self._flights:
+            return None
+
+        self.revalidations += 1
+        flight = self._flights[key] = _Flight()
+        return flight
+
+    def _submit(self, key: Hashable, flight: _Flight, loader: Callable[[], Any], submit: Callable) -> bool:
+        try:
+            submit(self._revalidate, key, flight, loader)
+            return True
+
+        except RuntimeError as e:                                           # the executor is shutting down
+            flight.error = e
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+            return False
+
+    def _revalidate(self, key: Hashable, flight: _Flight, loader: Callable[[], Any]) -> None:
+        try:
+            self._lead(key, flight, loader)
+        except Exception:                                                   # the stale value keeps being served, the loader reports its own errors
+            pass
+
+    def get(self, key: Hashable) -> Any:
+        '''Returns the cached value for key, or None if it's missing or expired (never loads anything)'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            return None
+
+    def get_stale(self, key: Hashable) -> Optional[Any]:
+        '''Returns the cached value for key even if it expired, as long as it's within keep_stale, or None'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() < entry[0] + self.keep_stale:
+                return entry[1]
+            return None
+
+    def expires_at(self, key: Hashable) -> Optional[float]:
+        '''When the entry for key expires (even if that's already in the past), or None if there's no entry'''
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def put(self, key: Hashable, value: Any, expires_at: float = None) -> None:
+        '''
+        Caches a value that was loaded somewhere else (e.g. by a batch of async fetches)
+
+        expires_at: When it expires, if that's already known (e.g. restored from disk), instead of asking ttl_for
+        '''
+        self._store(key, value, expires_at)
+
+    def _store(self, key: Hashable, value: Any, expires_at: float = None) -> None:
+        '''Saves a value with its expiry, dropping expired and then oldest entries when full'''
+        if expires_at is None:
+            expires_at = self.clock() + self.ttl_for(value)
+
+        with self._lock:
+            self._entries.pop(key, None)                                    # re-inserting moves the key to the end of the order
+            self._entries[key] = (expires_at, value)
+
+            if len(self._entries) > self.max_entries:
+                now = self.clock()
+                for k in [k for k, (exp, _) in self._entries.items() if exp + self.keep_stale <= now]:
+                    del self._entries[k]
+
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+    def clear(self) -> None:
+        '''Drops every cached entry (counters are kept)'''
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        '''Hit/miss/coalesce counters so the saving can be monitored'''
+        with self._lock:
+            return {
+                "hits":         self.hits,
+                "misses":       self.misses,
+                "coalesced":    self.coalesced,
+                "stale":        self.stale,
+                "revalidations": self.revalidations,
+                "entries":      len(self._entries),
+            }
+
+
+###### LRU BYTES CACHE #################################################
+class LRUBytesCache:
+    '''
+    Thread-safe least-recently-used cache of encoded bytes, bounded by their total size rather than a count.
+
+    max_bytes: Eviction budget, the sum of len() of every cached value never goes above it
+    '''
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes  = max_bytes
+
+        self._lock      = threading.Lock()
+        self._entries   = OrderedDict()                                     # key -> bytes, least recently used first
+        self.size       = 0
+
+        self.hits       = 0
+        self.misses     = 0
+        self.evictions  = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        '''Returns the cached bytes for key (marking them as recently used), or None'''
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return data
+
+    def __contains__(self, key: Hashable) -> bool:
+        '''Whether key is cached, without counting a hit or a miss or marking it as recently used'''
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key: Hashable, data: bytes) -> None:
+        '''Caches data under key, evicting the least recently used entries until it fits the budget'''
+        if len(data) > self.max_bytes:                                      # would evict everything and still not fit
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+
+            self._entries[key] = data
+            self.size += len(data)
+
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        '''Drops every cached entry (counters are kept)'''
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        '''Hit/miss/eviction counters and current memory use'''
+        with self._lock:
+            return {
+                "hits":         self.hits,
+                "misses":       self.misses,
+                "evictions":    self.evictions,
+                "entries":      len(self._entries),
+                "bytes":        self.size,
+                "max_bytes":    self.max_bytes,
+            }
@@ -0,0 +1,41 @@
+###### DESCRIPTION #################################################
+### Where the files every worker process shares are kept (the on-disk store, the quota's state) unless they're
+### pointed somewhere else: a folder only this user can read or write, rather than a predictable name in /tmp that
+### any other local user could create first and fill with whatever they want served.
+
+
+###### IMPORTS #################################################
+import os
+import stat
+
+
+###### CONSTANTS #################################################
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.getenv("XDG_DATA_HOME") or os.path.expanduser('~/.local/share'), 'weather-report'))
+
+
+###### HELPERS #################################################
+def data_path(name:str) -> str:
+    '''Path of a file in DATA_DIR (which is only created once something is written there)'''
+    return os.path.join(DATA_DIR, name)
+
+def private_dir(path:str=DATA_DIR) -> str:
+    '''
+    Creates path as a folder only this user can use, tightening it if it already exists with looser permissions.
+    Raises PermissionError if it exists but belongs to someone else (or isn't a folder).
+    '''
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or (hasattr(os, 'geteuid') and info.st_uid != os.geteuid()):
+        raise PermissionError(f'{path} is not a folder of this user')
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+def make_parent(path:str) -> None:
+    '''Creates the folder a shared file goes in: privately if it's DATA_DIR, like any other folder otherwise'''
+    parent = os.path.dirname(os.path.abspath(path))
+    if parent == os.path.abspath(DATA_DIR):
+        private_dir(parent)
+    else:
+        os.makedirs(parent, exist_ok=True)
@@ -0,0 +1,143 @@
+###### DESCRIPTION #################################################
+### A local stand-in for weatherapi.com's forecast endpoint that serves recorded JSON payloads,
+### so the backend can be exercised without an API key or network access.
+###
+### Run it with `python fake_weatherapi.py` and point the backend at it with
+### WEATHERAPI=http://127.0.0.1:8765/v1/forecast.json
+
+
+###### IMPORTS #################################################
+import argparse
+import glob
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import urlparse, parse_qs
+
+
+###### CONSTANTS #################################################
+FIXTURES    = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'weatherapi')
+NOT_FOUND   = json.dumps({"error": {"code": 1006, "message": "No matching location found."}}).encode()
+INTERNAL    = json.dumps({"error": {"code": 9999, "message": "Internal application error."}}).encode()
+
+
+###### HELPERS #################################################
+def load_fixtures(folder:str=FIXTURES) -> Dict[str, bytes]:
+    '''Recorded payloads keyed by lowercase city name (new_york_city.json -> "new york city")'''
+    payloads = {}
+    for path in glob.glob(os.path.join(folder, '*.json')):
+        city = os.path.basename(path)[:-5].replace('_', ' ')
+        with open(path, 'rb') as f:
+            payloads[city] = f.read()
+
+    return payloads
+
+
+###### SERVER #################################################
+class FakeWeatherAPI:
+    '''
+    Serves recorded forecasts over HTTP/1.1 with keep-alive, on a background thread.
+
+    port: Port to listen on (0 picks a free one)
+    latency: Seconds to wait before answering each request, to mimic the real network
+    fixtures: Dictionary of lowercase city -> JSON bytes (defaults to the recorded payloads)
+    error_rate: Fraction of requests answered with error_status instead (1 mimics an outage), can be changed while running
+    error_status: HTTP status of the injected errors
+    seed: Seed for picking which requests fail, for repeatable runs
+    '''
+    def __init__(self, port:int=0, latency:float=0, fixtures:Dict[str, bytes]=None, error_rate:float=0, error_status:int=503, seed:int=None) -> None:
+        self.latency    = latency
+        self.fixtures   = fixtures if fixtures is not None else load_fixtures()
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.errors     = 0                                                 # how many errors were injected
+        self._random    = random.Random(seed)
+        self.requests   = 0                                                 # how many forecasts have been asked for
+        self._lock      = threading.Lock()
+        self._thread    = None
+
+        fake = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'                                   # keep connections alive between requests
+            disable_nagle_algorithm = True                                  # headers and body are separate writes, don't let them wait on delayed ACKs
+
+            def do_GET(self):
+                failing = fake._count()
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if failing:
+                    self._send(fake.error_status, INTERNAL)
+                    return
+
+                query = parse_qs(urlparse(self.path).query)
+                city = ' '.join(query.get('q', [''])[0].split()).lower()
+                payload = fake.fixtures.get(city)
+
+                if payload is None:
+                    self._send(400, NOT_FOUND)
+                else:
+                    self._send(200, payload)
+
+            def _send(self, status:int, body:bytes):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):                           # keep test output quiet
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        '''What WEATHERAPI should be set to'''
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v1/forecast.json'
+
+    def _count(self) -> bool:
+        '''Counts a request and decides whether it gets an injected error'''
+        with self._lock:
+            self.requests += 1
+            failing = self.error_rate > 0 and self._random.random() < self.error_rate
+            self.errors += failing
+            return failing
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+###### RUNNING THE SERVER #################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve recorded weatherapi.com forecasts locally')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0, help='seconds to wait before every response')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests answered with an error (1 = outage)')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of those errors')
+    args = parser.parse_args()
+
+    fake = FakeWeatherAPI(args.port, args.latency, error_rate=args.error_rate, error_status=args.error_status)
+    print(f'Serving {len(fake.fixtures)} cities, set WEATHERAPI={fake.url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
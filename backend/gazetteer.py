@@ -0,0 +1,238 @@
+###### DESCRIPTION #################################################
+### Offline list of the world's cities (every GeoNames city with 15,000+ people) so a city name can be checked and
+### turned into one canonical spelling before anything is sent to weatherapi.com, and so the search bar can suggest
+### cities as you type without a network call. Towns that aren't in it, postcodes, airport codes and the like are
+### still sent to weatherapi as typed, unless GAZETTEER_STRICT=1 (which only lets through what isn't a place name).
+###
+### The data file is generated from the GeoNames dumps (https://download.geonames.org/export/dump/, CC BY 4.0):
+###     python gazetteer.py cities15000.txt countryInfo.txt
+
+
+###### IMPORTS #################################################
+import bisect
+import gzip
+import heapq
+import os
+import re
+import sys
+import unicodedata
+from typing import Dict, List, Optional
+
+
+###### CONSTANTS #################################################
+GAZETTEER_FILE      = os.getenv("GAZETTEER_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.tsv.gz'))
+GAZETTEER_STRICT    = os.getenv("GAZETTEER_STRICT", '0') == '1'             # 1 rejects place names that aren't in the gazetteer (towns under 15k people too), 0 passes them through as typed
+SUGGEST_LIMIT       = 8                                                     # suggestions returned by default
+SHORT_PREFIX        = 2                                                     # suggestions for prefixes this short are precomputed, they'd scan thousands of names
+ALTERNATES_MIN_POP  = 100_000                                               # only keep other spellings ("Londres", "NYC") of cities this big
+
+COORDINATES = re.compile(r'^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$')   # "51.51,-0.13" is sent to weatherapi as is
+NOT_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+NOT_A_PLACE_NAME = re.compile(r'^\s*(?:[a-z]+:\S+|[a-z]{3}|.*\d.*)\s*$', re.IGNORECASE)    # auto:ip, iata:LHR, "lhr", "10001", "SW1A 1AA"... always sent to weatherapi
+
+
+###### ERRORS #################################################
+class UnknownCity(ValueError):
+    '''The city isn't in the gazetteer, so there's no point asking weatherapi.com about it'''
+
+
+###### HELPERS #################################################
+def fold(text:str) -> str:
+    '''Lowercase ASCII with punctuation as single spaces, so "São  Paulo", "sao paulo" and "SAO-PAULO" look the same'''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+    return NOT_ALPHANUMERIC.sub(' ', text.lower()).strip()
+
+def is_exonym(name:str, population:int) -> bool:
+    '''Whether another name of a city is worth matching: a capitalised Latin-script name like "Londres" or "München",
+    not a transliteration like "lun dun" (nor an all-caps code like "NYC", unless the city is huge)'''
+    if not name[:1].isupper() or not all(not c.isalpha() or 'LATIN' in unicodedata.name(c, '') for c in name):
+        return False
+    return not name.isupper() or population >= 1_000_000
+
+
+###### GAZETTEER #################################################
+class City:
+    '''One city from the gazetteer'''
+    __slots__ = ('name', 'key', 'country', 'latitude', 'longitude', 'population')
+
+    def __init__(self, name:str, key:str, country:str, latitude:float, longitude:float, population:int) -> None:
+        self.name       = name
+        self.key        = key                                               # fold(name)
+        self.country    = country                                           # ISO 3166 alpha-2 code
+        self.latitude   = latitude
+        self.longitude  = longitude
+        self.population = population
+
+    def __repr__(self) -> str:
+        return f'City({self.name!r}, {self.country!r}, population={self.population})'
+
+
+class Gazetteer:
+    '''
+    Every city indexed by its folded name in one sorted array, which answers prefix searches with two binary searches,
+    plus a dictionary of folded names and other spellings for exact lookups.
+
+    cities: The cities, most populous first
+    alternates: Dictionary of index into cities -> other (already folded) names the city goes by
+    countries: Dictionary of ISO alpha-2 code -> country name
+    '''
+    def __init__(self, cities:List[City], alternates:Dict[int, List[str]], countries:Dict[str, str]) -> None:
+        self.cities     = cities
+        self.countries  = countries
+        self._country_codes = {fold(name): code for code, name in countries.items()} | {code.lower(): code for code in countries}
+
+        self._names = {}                                                    # folded name -> city indexes, most populous first
+        for i, city in enumerate(cities):
+            self._names.setdefault(city.key, []).append(i)
+        self._keys = sorted(self._names)                                    # main names only, for prefix searches
+        main_names = set(self._keys)
+
+        for i, others in alternates.items():
+            for key in others:
+                if key not in main_names:                                   # an actual city called that always wins over another's nickname
+                    self._names.setdefault(key, []).append(i)
+
+        self._short = {}                                                    # prefix of up to SHORT_PREFIX letters -> most populous cities
+        for i, city in enumerate(cities):                                  # most populous first, so the first ones in fill each prefix
+            for length in range(1, SHORT_PREFIX + 1):
+                best = self._short.setdefault(city.key[:length], [])
+                if len(best) < SUGGEST_LIMIT:
+                    best.append(i)
+
+    @classmethod
+    def load(cls, path:str=GAZETTEER_FILE) -> 'Gazetteer':
+        '''Reads the file written by build()'''
+        cities, alternates, countries = [], {}, {}
+
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+
+                fields = line.rstrip('\n').split('\t')
+                if fields[0] == 'country':
+                    countries[fields[1]] = fields[2]
+                    continue
+
+                name, key, country, latitude, longitude, population, others = fields
+                if others:
+                    alternates[len(cities)] = others.split('|')
+                cities.append(City(name, key, country, float(latitude), float(longitude), int(population)))
+
+        return cls(cities, alternates, countries)
+
+    def lookup(self, name:str) -> List[City]:
+        '''Every city called name (by any of its spellings), most populous first'''
+        return [self.cities[i] for i in self._names.get(fold(name), [])]
+
+    def find(self, query:str) -> Optional[City]:
+        '''
+        The city query refers to, or None if it's unknown (or coordinates).
+        "Name, Country" picks that country's city (by ISO code or country name), otherwise the most populous one wins.
+        '''
+        if COORDINATES.match(query):
+            return None
+
+        candidates = self.lookup(query)
+        if not candidates and ',' in query:
+            name, qualifier = query.rsplit(',', 1)
+            candidates = self.lookup(name)
+
+            country = self._country_codes.get(fold(qualifier))
+            if country is not None:
+                candidates = [c for c in candidates if c.country == country]
+
+        return candidates[0] if candidates else None
+
+    def canonical(self, query:str, strict:bool=GAZETTEER_STRICT) -> str:
+        '''
+        The one string every way of writing a city turns into, used both as the cache key and as weatherapi's q parameter:
+        the folded name for the most populous city with that name, its coordinates for any other one.
+
+        Anything else weatherapi understands that isn't a place name (postcodes, airport codes, auto:ip...) is passed through normalized.
+
+        strict: Raise UnknownCity for place names that aren't in the gazetteer, instead of passing them through normalized
+        '''
+        match = COORDINATES.match(query)
+        if match:
+            return f'{float(match.group(1)):.4f},{float(match.group(2)):.4f}'
+
+        city = self.find(query)
+        if city is None:
+            if strict and not NOT_A_PLACE_NAME.match(query):
+                raise UnknownCity(f'400 - City {query} was not found')
+            return ' '.join(query.split()).lower()
+
+        if self.cities[self._names[city.key][0]] is city:
+            return city.key
+
+        return f'{city.latitude:.4f},{city.longitude:.4f}'
+
+    def label(self, city:City) -> str:
+        return f'{city.name}, {self.countries.get(city.country, city.country)}'
+
+    def suggest(self, prefix:str, limit:int=SUGGEST_LIMIT) -> List[City]:
+        '''The most populous cities whose name starts with prefix'''
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+
+        if len(prefix) <= SHORT_PREFIX and limit <= SUGGEST_LIMIT:
+            return [self.cities[i] for i in self._short.get(prefix, [])[:limit]]
+
+        start = bisect.bisect_left(self._keys, prefix)
+        end = bisect.bisect_left(self._keys, prefix + '\x7f', lo=start)         # every key starting with prefix sorts before this
+
+        ids = heapq.nsmallest(limit, {i for key in self._keys[start:end] for i in self._names[key]})   # lower index = more people
+        return [self.cities[i] for i in ids]
+
+
+###### BUILD STEP #################################################
+def build(cities_dump:str, countries_dump:str, path:str=GAZETTEER_FILE) -> int:
+    '''
+    Writes the gazetteer file from GeoNames' citiesNNNNN.txt and countryInfo.txt dumps.
+    Returns how many cities were written.
+    '''
+    lines = ['# Cities from GeoNames (https://www.geonames.org), licensed under CC BY 4.0',
+             '# name\tfolded name\tcountry\tlatitude\tlongitude\tpopulation\tother|names (folded), most populous city first']
+
+    with open(countries_dump, encoding='utf-8') as f:
+        for line in f:
+            if not line.startswith('#'):
+                fields = line.rstrip('\n').split('\t')
+                lines.append(f'country\t{fields[0]}\t{fields[4]}')
+
+    rows = []
+    with open(cities_dump, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            name, alternates, latitude, longitude, country, population = fields[1], fields[3], fields[4], fields[5], fields[8], int(fields[14] or 0)
+
+            others = []
+            if population >= ALTERNATES_MIN_POP:
+                seen = {fold(name)}
+                for other in alternates.split(','):
+                    key = fold(other)
+                    if len(key) >= 2 and key not in seen and is_exonym(other, population):
+                        seen.add(key)
+                        others.append(key)
+
+            rows.append((population, f'{name}\t{fold(name)}\t{country}\t{float(latitude):.4f}\t{float(longitude):.4f}\t{population}\t{"|".join(others)}'))
+
+    rows.sort(key=lambda row: -row[0])                                      # the index order doubles as the population ranking
+    lines += [line for _, line in rows]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.GzipFile(path, 'wb', compresslevel=9, mtime=0) as f:
+        f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+    return len(rows)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python gazetteer.py cities15000.txt countryInfo.txt')
+
+    count = build(sys.argv[1], sys.argv[2])
+    print(f'Wrote {count} cities to {GAZETTEER_FILE} ({os.path.getsize(GAZETTEER_FILE) / 1024:.0f} KiB)')
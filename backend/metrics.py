@@ -0,0 +1,138 @@
+###### DESCRIPTION #################################################
+### Minimal Prometheus-style counters and histograms, exported in the text exposition format by /metrics.
+### Each observation is a bisect and a couple of additions under a lock, cheap enough to leave on.
+
+
+###### IMPORTS #################################################
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+
+###### CONSTANTS #################################################
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)   # seconds
+
+
+###### HELPERS #################################################
+def escape(value) -> str:
+    '''Escapes a label value the way the exposition format expects'''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names:Tuple[str], values:Tuple[str], extra:str='') -> str:
+    '''Turns label names and values into {name="value",...} (empty string when there are none)'''
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value:float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+###### METRICS #################################################
+class Counter:
+    '''
+    A number that only goes up, one per combination of label values.
+
+    name: Metric name (ending in _total by convention)
+    description: HELP text
+    labels: Names of the labels every increment must give values for
+    '''
+    def __init__(self, name:str, description:str, labels:Tuple[str]=()) -> None:
+        self.name           = name
+        self.description    = description
+        self.labels         = tuple(labels)
+        self._values        = {}                                            # label values -> count
+        self._lock          = threading.Lock()
+
+    def inc(self, *label_values:str, amount:float=1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def expose(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for values, count in sorted(self._values.items()):
+                lines.append(f'{self.name}{format_labels(self.labels, values)} {format_value(count)}')
+        return lines
+
+
+class Histogram:
+    '''
+    Counts observations into cumulative buckets, plus their sum and count, one set per combination of label values.
+
+    name: Metric name
+    description: HELP text
+    labels: Names of the labels every observation must give values for
+    buckets: Upper bounds of the buckets, in increasing order (+Inf is added automatically)
+    '''
+    def __init__(self, name:str, description:str, labels:Tuple[str]=(), buckets:Tuple[float]=DURATION_BUCKETS) -> None:
+        self.name           = name
+        self.description    = description
+        self.labels         = tuple(labels)
+        self.buckets        = tuple(buckets)
+        self._series        = {}                                            # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock          = threading.Lock()
+
+    def observe(self, value:float, *label_values:str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{format_value(bound)}"'
+                    lines.append(f'{self.name}_bucket{format_labels(self.labels, values, le)} {cumulative}')
+
+                lines.append(f'{self.name}_sum{format_labels(self.labels, values)} {total!r}')
+                lines.append(f'{self.name}_count{format_labels(self.labels, values)} {count}')
+        return lines
+
+
+class Registry:
+    '''Every metric /metrics exports, plus callbacks that produce lines at scrape time (e.g. from cache stats)'''
+    def __init__(self) -> None:
+        self.metrics    = []
+        self.callbacks  = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_callback(self, callback:Callable[[], List[str]]) -> None:
+        self.callbacks.append(callback)
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        for callback in self.callbacks:
+            lines.extend(callback())
+        return '\n'.join(lines) + '\n'
+
+
+def stats_family(name:str, description:str, kind:str, samples:Dict[str, float], label:str) -> List[str]:
+    '''Lines for one metric family whose samples come from a stats() dictionary, e.g. {"forecast": 12, "card": 3}'''
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+    for label_value, value in samples.items():
+        lines.append(f'{name}{{{label}="{label_value}"}} {format_value(value)}')
+    return lines
+
+
+###### APP METRICS #################################################
+REGISTRY = Registry()
+
+REQUEST_DURATION    = REGISTRY.register(Histogram('wttr_request_duration_seconds', 'Time spent answering a request', ('route', 'status')))
+STAGE_DURATION      = REGISTRY.register(Histogram('wttr_stage_duration_seconds', 'Time spent in each stage of answering a request', ('route', 'stage')))
+UPSTREAM_ERRORS     = REGISTRY.register(Counter('wttr_upstream_errors_total', 'Failed calls to weatherapi.com', ('reason',)))
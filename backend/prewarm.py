@@ -0,0 +1,199 @@
+###### DESCRIPTION #################################################
+### Keeps the most requested cities warm in the background: their forecasts are refreshed just before
+### they expire and their cards are re-rendered whenever something on them changes (e.g. the progress
+### marker), in every format their visitors asked for, so popular cities never wait on weatherapi.com or on Pillow.
+
+
+###### IMPORTS #################################################
+import heapq
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List
+
+import weather_report
+from upstream import UpstreamUnavailable
+from render_engine import RenderQueueFull
+
+
+###### SCHEDULER #################################################
+class PrewarmScheduler:
+    '''
+    Tracks how often each city is requested and keeps the top ones warm.
+
+    top_n: How many of the most requested cities to keep warm
+    formats: Dictionary of card kind -> image formats to always pre-render it in (others are once a city's visitors ask for them)
+    interval: Seconds between two passes over the top cities
+    margin: Refresh a forecast once it's this many seconds (or less) away from expiring
+    budget: Most upstream calls the scheduler may make per `budget_window` seconds
+    half_life: Seconds after which a request counts half as much towards a city's popularity
+    max_tracked: Most cities whose popularity is tracked, past which the least popular ones are forgotten
+    min_score: Popularity below which a city is forgotten (one request decays to this after ~4 half-lives at the default)
+    clock: Function returning the current time in seconds (swappable for testing)
+    '''
+    def __init__(self, top_n:int, formats:Dict[str, List[str]], interval:float=30, margin:float=20, budget:int=120, budget_window:float=3600,
+                 half_life:float=3600, max_tracked:int=10_000, min_score:float=0.05, clock:Callable[[], float]=time.time) -> None:
+        self.top_n          = top_n
+        self.formats        = formats
+        self.interval       = interval
+        self.margin         = margin
+        self.budget         = budget
+        self.budget_window  = budget_window
+        self.half_life      = half_life
+        self.max_tracked    = max_tracked
+        self.min_score      = min_score
+        self.clock          = clock
+
+        self._lock          = threading.Lock()
+        self._scores        = {}                                            # normalized city -> (popularity, when it was last updated)
+        self._served        = {}                                            # normalized city -> {(kind, format not in formats): when it was last asked for}
+        self._calls         = deque()                                       # when each upstream call within the budget window was made
+        self._stop          = threading.Event()
+        self._thread        = None
+
+        self.refreshes      = 0
+        self.renders        = 0
+        self.skipped        = 0                                             # refreshes not made because the budget ran out
+
+    ### Popularity
+    def _decayed(self, score:float, since:float, now:float) -> float:
+        return score * 0.5 ** ((now - since) / self.half_life)
+
+    def record(self, city:str, kind:str=None, image_format:str=None) -> None:
+        '''Counts one request for city (unknown cities are ignored), and for its kind of card in that image format'''
+        try:
+            key = weather_report.normalize_city(city)
+        except ValueError:
+            return
+
+        now = self.clock()
+
+        with self._lock:
+            score, since = self._scores.get(key, (0, now))
+            self._scores[key] = (self._decayed(score, since, now) + 1, now)
+            if kind is not None and image_format not in self.formats.get(kind, []):
+                self._served.setdefault(key, {})[(kind, image_format)] = now
+
+            if len(self._scores) > self.max_tracked:                        # e.g. a client sending random coordinates
+                self._prune(now)
+
+    def _prune(self, now:float) -> None:
+        '''Forgets the cities whose popularity faded below min_score, then the least popular until a quarter of max_tracked is free (with the lock held)'''
+        scores = {key: self._decayed(*entry, now) for key, entry in self._scores.items()}
+        keep = [key for key, score in scores.items() if score >= self.min_score]
+        keep = heapq.nlargest(self.max_tracked * 3 // 4, keep, key=scores.get)
+        self._scores = {key: self._scores[key] for key in keep}
+        self._served = {key: self._served[key] for key in keep if key in self._served}
+
+    def forget(self, city:str) -> None:
+        '''Stops tracking a city, given as normalized by record() (e.g. because weatherapi doesn't know it)'''
+        with self._lock:
+            self._scores.pop(city, None)
+            self._served.pop(city, None)
+
+    def top_cities(self) -> List[str]:
+        '''The top_n most requested cities right now, most popular first (forgetting the ones nobody asks for any more)'''
+        now = self.clock()
+        with self._lock:
+            scores = {key: self._decayed(*entry, now) for key, entry in self._scores.items()}
+            for key in [key for key, score in scores.items() if score < self.min_score]:
+                del self._scores[key], scores[key]
+                self._served.pop(key, None)
+
+        return heapq.nlargest(self.top_n, scores, key=scores.get)
+
+    ### Upstream budget
+    def _spend(self, now:float) -> bool:
+        '''Takes one upstream call from the budget, or returns False if there's none left in this window'''
+        while self._calls and self._calls[0] <= now - self.budget_window:
+            self._calls.popleft()
+
+        if len(self._calls) >= self.budget:
+            return False
+
+        self._calls.append(now)
+        return True
+
+    def _due(self, city:str, now:float) -> bool:
+        '''Whether city's forecast is missing or about to expire'''
+        expires_at = weather_report.FORECAST_CACHE.expires_at(city)
+        return expires_at is None or expires_at - now <= self.margin
+
+    ### Warming
+    def _formats(self, city:str, kind:str, now:float) -> List[str]:
+        '''The formats to pre-render a city's kind of card in: the default ones, plus any its visitors asked for within a half-life'''
+        with self._lock:
+            served = self._served.get(city, {})
+            extra = [image_format for (k, image_format), since in served.items() if k == kind and now - since < self.half_life]
+        return [*self.formats.get(kind, []), *extra]
+
+    def _prerender(self, city:str) -> None:
+        '''Renders every card the city's visitors are likely to ask for (a no-op for cards that are already cached)'''
+        cards = [
+            ('hourly',   weather_report.weather_report_inputs(city)),
+            ('tomorrow', weather_report.tomorrow_inputs(city, False)),
+            ('tomorrow', weather_report.tomorrow_inputs(city, True)),
+        ]
+
+        now = self.clock()
+        for kind, inputs in cards:
+            for image_format in self._formats(city, kind, now):
+                key = weather_report.card_key(kind, inputs, image_format)
+                if key not in weather_report.CARD_CACHE:                    # a peek, so warming doesn't count as hits or misses
+                    weather_report.render_card(kind, inputs, image_format, key)
+                    self.renders += 1
+
+    def run_once(self) -> None:
+        '''One pass over the top cities: refresh what's about to expire, then pre-render their cards'''
+        for city in self.top_cities():
+            now = self.clock()
+
+            if self._due(city, now):
+                if not self._spend(now):
+                    self.skipped += 1
+                    continue
+
+                try:
+                    weather_report.refresh_forecast(city)
+                    self.refreshes += 1
+                except ValueError:                                          # unknown city, stop trying
+                    self.forget(city)
+                    continue
+                except UpstreamUnavailable:
+                    continue
+
+            try:
+                self._prerender(city)
+            except (ValueError, UpstreamUnavailable, RenderQueueFull):     # never steal render capacity from real requests
+                continue
+
+    ### Background thread
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:                                          # keep warming even if one pass blows up
+                print(f'[PREWARM] pass failed: {e!r}')
+
+    def start(self) -> None:
+        if self._thread is None and self.top_n > 0:
+            self._thread = threading.Thread(target=self._loop, name='prewarm', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        now = self.clock()
+        with self._lock:
+            calls = sum(1 for t in self._calls if t > now - self.budget_window)
+            tracked = len(self._scores)
+
+        return {
+            "tracked":          tracked,
+            "refreshes":        self.refreshes,
+            "renders":          self.renders,
+            "skipped":          self.skipped,
+            "budget_used":      calls,
+            "budget":           self.budget,
+        }
@@ -0,0 +1,101 @@
+###### DESCRIPTION #################################################
+### Cuts a WeatherReport down to what an /api client asked for: ?fields= picks fields by their dotted path
+### (e.g. current.temp,location.name,forecast.hour.temp) and ?hours= keeps only the next N hourly forecasts,
+### so the 72 hours weatherapi returns aren't all sent to a client that shows three of them.
+
+
+###### IMPORTS #################################################
+import typing
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+from weather_classes import WeatherReport
+
+
+###### CONSTANTS #################################################
+MAX_FIELDS = 64                                                             # dotted paths accepted in one ?fields=
+
+
+###### ERRORS #################################################
+class UnknownField(ValueError):
+    '''A ?fields= path that doesn't exist in the report'''
+
+
+###### HELPERS #################################################
+def field_tree(fields:str) -> Dict:
+    '''Turns "current.temp,location" into {"current": {"temp": True}, "location": True} (True meaning the whole thing)'''
+    paths = [path.strip() for path in fields.split(',') if path.strip()]
+    if len(paths) > MAX_FIELDS:
+        raise UnknownField(f'too many fields, the limit is {MAX_FIELDS}')
+
+    tree = {}
+    for path in paths:
+        node = tree
+        names = path.split('.')
+        for name in names[:-1]:
+            if node.get(name) is True:                                      # the whole parent was already asked for
+                break
+            node = node.setdefault(name, {})
+        else:
+            node[names[-1]] = True
+
+    return tree
+
+def unwrap(annotation) -> tuple:
+    '''The model a field holds and whether it's a list of them, e.g. List[ForecastDay] -> (ForecastDay, True)'''
+    if typing.get_origin(annotation) in (list, typing.List):
+        return typing.get_args(annotation)[0], True
+    return annotation, False
+
+def include_for(model:type, tree:Dict, prefix:str='') -> Dict:
+    '''Translates a field tree into the include= argument pydantic's model_dump(_json) takes, checking every name exists'''
+    include = {}
+    for name, subtree in tree.items():
+        path = f'{prefix}{name}'
+        if name not in model.model_fields and name not in model.model_computed_fields:
+            raise UnknownField(f'unknown field: {path}')
+
+        if subtree is True:
+            include[name] = True
+            continue
+
+        inner, is_list = unwrap(model.model_fields[name].annotation) if name in model.model_fields else (None, False)
+        if not (isinstance(inner, type) and issubclass(inner, BaseModel)):
+            raise UnknownField(f'{path} has no fields to pick from')
+
+        nested = include_for(inner, subtree, f'{path}.')
+        include[name] = {'__all__': nested} if is_list else nested
+
+    return include
+
+
+###### PROJECTION #################################################
+def parse_fields(fields:Optional[str]) -> Optional[Dict]:
+    '''The include= for a ?fields= value, or None for everything (also when it doesn't name any field, like ",,"). Raises UnknownField'''
+    tree = field_tree(fields) if fields else {}
+    return include_for(WeatherReport, tree) if tree else None
+
+def next_hours(report:WeatherReport, hours:int, now:Optional[str]=None) -> WeatherReport:
+    '''
+    A copy of report with only the hourly forecasts from the current local hour onwards, at most hours of them.
+    Days left without any hours are dropped. Nothing is copied but the lists that get shorter.
+
+    now: The current local hour as "2025-11-20 14" (hour times sort the same way), the hour the forecast was fetched at if None
+    '''
+    now = now or report.location.localtime[:13]
+    days, left = [], hours
+
+    for day in report.forecast:
+        kept = [hour for hour in day.hour if hour.time[:13] >= now][:left]
+        if kept:
+            days.append(day.model_copy(update={'hour': kept}))
+            left -= len(kept)
+
+    return report.model_copy(update={'forecast': days})
+
+def project(report:WeatherReport, include:Optional[Dict]=None, hours:Optional[int]=None, now:Optional[str]=None) -> bytes:
+    '''The report as JSON bytes, cut down to the included fields and the next hours (counted from now, see next_hours)'''
+    if hours is not None:
+        report = next_hours(report, hours, now)
+    return report.__pydantic_serializer__.to_json(report, include=include)   # model_dump_json's serializer, minus decoding the bytes into a str
@@ -0,0 +1,179 @@
+###### DESCRIPTION #################################################
+### Keeps every worker process within the weatherapi.com key's allowance: a per-minute token bucket plus a
+### monthly counter, stored in one small file that all processes update under an exclusive lock.
+### Interactive requests (someone waiting on /wttr, /tmrw...) may use the whole allowance, background work
+### (pre-warming, refreshing stale forecasts, batches) has to leave a reserve for them.
+
+
+###### IMPORTS #################################################
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict
+
+from data_dir import data_path, make_parent
+from upstream import UpstreamUnavailable
+
+try:
+    import fcntl                                                            # POSIX only, without it the quota is only shared between threads
+except ImportError:
+    fcntl = None
+
+
+###### CONSTANTS #################################################
+QUOTA_FILE          = os.getenv("QUOTA_FILE", data_path('quota'))
+QUOTA_PER_MINUTE    = int(os.getenv("QUOTA_PER_MINUTE", 600))               # calls the key allows per minute (0 for no limit)
+QUOTA_PER_MONTH     = int(os.getenv("QUOTA_PER_MONTH", 1_000_000))          # calls the key allows per calendar month, UTC (0 for no limit)
+BACKGROUND_RESERVE  = float(os.getenv("QUOTA_BACKGROUND_RESERVE", 0.25))    # share of either allowance background work can't touch
+
+INTERACTIVE = 'interactive'                                                 # a visitor is waiting on this call
+BACKGROUND  = 'background'                                                  # nobody is, it can wait or be skipped
+PRIORITIES  = (INTERACTIVE, BACKGROUND)
+
+STATE = struct.Struct('<ddqq4q')                                            # tokens, last refill, month (YYYYMM), calls this month, granted/denied per priority
+
+
+###### ERRORS #################################################
+class QuotaExceeded(UpstreamUnavailable):
+    '''The call would go over the key's allowance (or eat into what's kept for interactive requests), so it isn't made'''
+
+
+###### HELPERS #################################################
+def month_of(timestamp:float) -> int:
+    '''The calendar month (UTC) a time falls in, as YYYYMM'''
+    t = time.gmtime(timestamp)
+    return t.tm_year * 100 + t.tm_mon
+
+
+###### QUOTA #################################################
+class UpstreamQuota:
+    '''
+    Token bucket (refilled continuously at per_minute/60 a second, holding at most a minute's worth) plus a
+    monthly call counter, shared through a file so every worker process draws from the same allowance.
+
+    path: File holding the shared state (created on first use)
+    per_minute / per_month: The key's allowances, 0 meaning unlimited
+    reserve: Share of each allowance that only INTERACTIVE calls may use
+    clock: Function returning the current time in seconds (swappable for testing)
+    '''
+    def __init__(self, path:str=QUOTA_FILE, per_minute:int=QUOTA_PER_MINUTE, per_month:int=QUOTA_PER_MONTH,
+                 reserve:float=BACKGROUND_RESERVE, clock:Callable[[], float]=time.time) -> None:
+        self.path       = path
+        self.per_minute = per_minute
+        self.per_month  = per_month
+        self.reserve    = reserve
+        self.clock      = clock
+
+        self._lock      = threading.Lock()                                  # flock doesn't keep this process's own threads apart
+        self._fd        = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0 or self.per_month > 0
+
+    ### Shared state
+    def _open(self) -> int:
+        if self._fd is None:
+            make_parent(self.path)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        return self._fd
+
+    def _update(self, change:Callable[[list, float], object]) -> object:
+        '''Runs change(state, now) on the shared state under both locks, writing it back afterwards'''
+        with self._lock:
+            fd = self._open()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+
+            try:
+                data = os.pread(fd, STATE.size, 0)
+                now = self.clock()
+                state = list(STATE.unpack(data)) if len(data) == STATE.size else [float(self.per_minute), now, month_of(now), 0, 0, 0, 0, 0]
+                self._refill(state, now)
+
+                result = change(state, now)
+                os.pwrite(fd, STATE.pack(*state), 0)
+                return result
+
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _refill(self, state:list, now:float) -> None:
+        '''Adds the tokens earned since the last update and starts a new month's count when it rolls over'''
+        tokens, updated, month = state[0], state[1], state[2]
+        if self.per_minute:
+            state[0] = min(float(self.per_minute), tokens + max(0.0, now - updated) * self.per_minute / 60)
+        state[1] = now
+
+        if month_of(now) != month:
+            state[2], state[3] = month_of(now), 0
+
+    ### Spending
+    def _allowed(self, state:list, priority:str) -> bool:
+        floor = self.reserve if priority == BACKGROUND else 0                  # background calls leave the reserve alone
+
+        if self.per_minute and state[0] - 1 < self.per_minute * floor:
+            return False
+        if self.per_month and state[3] + 1 > self.per_month * (1 - floor):
+            return False
+        return True
+
+    def acquire(self, priority:str=INTERACTIVE) -> None:
+        '''Takes one call from the allowance, or raises QuotaExceeded if there isn't one for this priority'''
+        if not self.enabled:
+            return
+
+        def spend(state:list, now:float) -> bool:
+            allowed = self._allowed(state, priority)
+            if allowed:
+                state[0] -= 1 if self.per_minute else 0
+                state[3] += 1
+            state[4 + PRIORITIES.index(priority) + (0 if allowed else 2)] += 1
+            return allowed
+
+        if not self._update(spend):
+            raise QuotaExceeded(f'weatherapi.com allowance used up for {priority} calls, next one in {self.retry_after(priority):.0f}s')
+
+    def refund(self) -> None:
+        '''Gives back a call that was acquired but never made (e.g. the circuit breaker stopped it)'''
+        if not self.enabled:
+            return
+
+        def give_back(state:list, now:float) -> None:
+            state[0] = min(float(self.per_minute), state[0] + 1) if self.per_minute else state[0]
+            state[3] = max(0, state[3] - 1)
+
+        self._update(give_back)
+
+    def exhaust(self) -> None:
+        '''Empties the bucket, because weatherapi.com itself said we're over the limit'''
+        if self.per_minute:
+            self._update(lambda state, now: state.__setitem__(0, 0.0))
+
+    ### Live numbers
+    def retry_after(self, priority:str=INTERACTIVE) -> float:
+        '''Seconds until the bucket holds a call for this priority again (ignores the monthly allowance)'''
+        if not self.per_minute:
+            return 0
+
+        floor = self.per_minute * (self.reserve if priority == BACKGROUND else 0) + 1
+        tokens = self._update(lambda state, now: state[0])
+        return max(0.0, (floor - tokens) * 60 / self.per_minute)
+
+    def stats(self) -> Dict:
+        if not self.enabled:
+            return {"enabled": False}
+
+        state = self._update(lambda state, now: list(state))
+        return {
+            "enabled":              True,
+            "per_minute":           self.per_minute,
+            "tokens":               round(state[0], 2),
+            "per_month":            self.per_month,
+            "used_this_month":      state[3],
+            "remaining_this_month": max(0, self.per_month - state[3]) if self.per_month else None,
+            "granted":              {INTERACTIVE: state[4], BACKGROUND: state[5]},
+            "denied":               {INTERACTIVE: state[6], BACKGROUND: state[7]},
+        }
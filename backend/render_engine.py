@@ -0,0 +1,150 @@
+###### DESCRIPTION #################################################
+### Renders weather cards in a pool of worker processes, so Pillow work doesn't fight over
+### the GIL with Flask's request threads and throughput grows with the number of cores.
+
+
+###### IMPORTS #################################################
+import atexit
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from wttr import pill   # My script to create pretty weather cards c:
+from wttr import vector
+from wttr import timing
+from wttr.encode import VECTOR_FORMATS
+
+
+###### CONSTANTS #################################################
+CARD_BUILDERS = {
+    "hourly":   pill.create_weather_card_hourly,
+    "tomorrow": pill.create_tomorrow_forecast,
+    "week":     pill.create_week_forecast,
+}
+VECTOR_BUILDERS = {                                                         # the same cards as SVG documents, for image_format='svg'
+    "hourly":   vector.create_weather_card_hourly,
+    "tomorrow": vector.create_tomorrow_forecast,
+    "week":     vector.create_week_forecast,
+}
+WORKER_START_TIMEOUT = 120                                                  # seconds every worker gets to start and load pill
+
+
+###### ERRORS #################################################
+class RenderQueueFull(Exception):
+    '''Too many cards are already waiting to be rendered, the client should try again shortly'''
+
+
+###### RENDERING #################################################
+def render_card_bytes(kind:str, inputs:Dict, image_format:str) -> Tuple[bytes, List]:
+    '''Draws and encodes one card (this is what runs inside the worker processes), returning it with the time each stage took'''
+    builders = VECTOR_BUILDERS if image_format in VECTOR_FORMATS else CARD_BUILDERS
+
+    with timing.collect() as stages:
+        weather_card = builders[kind](**inputs, image_format=image_format)
+
+    return weather_card.getvalue(), stages                                  # the BytesIO's own buffer, no copy is made here
+
+def warm_up_worker(started, workers:int) -> None:
+    '''
+    Runs once in each worker: importing this module (and only it, see hidden_main) already loaded pill's templates,
+    fonts and icon atlas, so all that's left is sizing its caches for its share of the memory and waiting for the
+    other workers to be started too.
+
+    started: Barrier shared with RenderEngine.start
+    workers: How many workers there are
+    '''
+    pill.share_base_layers(workers)
+    started.wait(WORKER_START_TIMEOUT)
+
+@contextmanager
+def hidden_main():
+    '''
+    Hides the __main__ module from multiprocessing while workers are started. Spawned workers otherwise run it again
+    (as __mp_main__) before anything else, and under `python app.py` that's the whole app, its caches and its clients.
+    Nothing the workers are sent is defined in __main__, so they never need it.
+    '''
+    main = sys.modules['__main__']
+    spec, path = getattr(main, '__spec__', None), main.__dict__.pop('__file__', None)
+    main.__spec__ = None
+
+    try:
+        yield
+    finally:
+        main.__spec__ = spec
+        if path is not None:
+            main.__file__ = path
+
+
+class RenderEngine:
+    '''
+    Dispatches card renders to worker processes, each of which loads templates and fonts once.
+
+    workers: Amount of worker processes (0 renders on the calling thread instead)
+    max_pending: Renders allowed to be queued or running at once, past which RenderQueueFull is raised
+    start_method: How worker processes are started ('spawn', 'forkserver' or 'fork')
+    '''
+    def __init__(self, workers:int, max_pending:int, start_method:str='spawn') -> None:
+        self.workers        = workers
+        self.max_pending    = max_pending
+        self.start_method   = start_method
+
+        self._pool      = None                                              # created by start(), so importing this module stays cheap
+        self._pool_lock = threading.Lock()
+        self._slots     = threading.BoundedSemaphore(max_pending)
+
+    def start(self) -> None:
+        '''
+        Starts every worker and waits until they've all loaded pill, so no request ever waits on that.
+        Each worker is handed one task that can't finish before the last one has started, which makes the pool start
+        them all now instead of one at a time as renders come in (when __main__ would no longer be hidden).
+        '''
+        with self._pool_lock:
+            if self._pool is not None or self.workers <= 0:
+                return
+
+            context = multiprocessing.get_context(self.start_method)
+            started = context.Barrier(self.workers + 1)
+            pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=warm_up_worker, initargs=(started, self.workers))
+
+            with hidden_main():
+                pings = [pool.submit(os.getpid) for _ in range(self.workers)]
+                started.wait(WORKER_START_TIMEOUT)
+            wait(pings)
+
+            self._pool = pool
+            atexit.register(self.shutdown)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:                                              # start() wasn't called, the first render pays for it
+            self.start()
+        return self._pool
+
+    def render(self, kind:str, inputs:Dict, image_format:str='png') -> bytes:
+        '''Renders a card on a worker, blocking until it's done (raises RenderQueueFull instead of queueing without limit)'''
+        if self.workers <= 0 or image_format in VECTOR_FORMATS:            # SVGs are only string formatting, quicker than a trip to a worker
+            weather_card, stages = render_card_bytes(kind, inputs, image_format)
+            timing.extend(stages)
+            return weather_card
+
+        if not self._slots.acquire(blocking=False):                         # backpressure: refuse rather than pile up work
+            raise RenderQueueFull(f'{self.max_pending} renders already pending')
+
+        try:
+            future = self._get_pool().submit(render_card_bytes, kind, inputs, image_format)
+            weather_card, stages = future.result()
+
+        finally:
+            self._slots.release()
+
+        timing.extend(stages)                                               # the worker's stage timings count towards this request
+        return weather_card
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -1,5 +1,5 @@
-from app import app
-
 ### RUNNING WEBSITE #############################
 if (__name__ == '__main__'):
+    from app import app, start_background_work    # imported here, so the render workers (which run this file again) don't load the whole app
+    start_background_work()
     app.run(host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,210 @@
+###### DESCRIPTION #################################################
+### Serves the Svelte frontend from memory: every file in frontend/public is read once, compressed once (gzip, and
+### brotli when it's installed) and sent with a content-hash ETag, so static requests never read files or
+### compress anything on a worker. index.html links to the other files with ?v=<hash>, which lets browsers cache
+### those URLs forever since a new build changes the hash. With STATIC_RELOAD set (during development) a background
+### thread reloads everything when a file changes, requests themselves never look at the disk.
+
+
+###### IMPORTS #################################################
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+from flask import Response, request, send_from_directory
+
+try:
+    import brotli                                                           # optional, gzip is used on its own without it
+except ImportError:
+    brotli = None
+
+
+###### CONSTANTS #################################################
+STATIC_ROOT         = os.getenv("STATIC_ROOT", '../frontend/public')         # the Svelte app (build/ is written by rollup)
+STATIC_MAX_MEMORY   = int(os.getenv("STATIC_MAX_MEMORY", 1024 * 1024))       # files bigger than this are streamed from disk instead
+STATIC_RELOAD       = float(os.getenv("STATIC_RELOAD", 0))                   # seconds between checks for changed files (e.g. rollup -w), 0 never checks
+COMPRESS_MIN_SIZE   = 512                                                   # smaller files aren't worth compressing
+COMPRESSIBLE        = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+
+IMMUTABLE           = 'public, max-age=31536000, immutable'                 # fingerprinted URLs never change
+REVALIDATE          = 'no-cache'                                            # anything else is cached but checked with its ETag
+FINGERPRINTED       = re.compile(r'\.[0-9a-f]{8,}\.[^./]+$')                 # e.g. bundle.3f2a9c1d.js
+LOCAL_LINK          = re.compile(r'''((?:href|src)=(['"]))/([^'"?#]+)(\2)''')   # href='/global.css', src="/build/bundle.js"...
+
+
+###### HELPERS #################################################
+def content_hash(body:bytes) -> str:
+    return hashlib.blake2b(body, digest_size=8).hexdigest()
+
+def guess_mimetype(path:str) -> str:
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    return f'{mimetype}; charset=utf-8' if mimetype.startswith('text/') or mimetype == 'application/javascript' else mimetype
+
+def compress(body:bytes, mimetype:str) -> Dict[str, bytes]:
+    '''Every encoding worth sending for body, keeping only the ones that actually came out smaller'''
+    if len(body) < COMPRESS_MIN_SIZE or not mimetype.startswith(COMPRESSIBLE):
+        return {}
+
+    variants = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+
+
+###### STATIC FILES #################################################
+class StaticAsset:
+    '''One file from the static folder, with its precompressed variants if it's small enough to keep in memory'''
+    __slots__ = ('path', 'mimetype', 'etag', 'body', 'variants', 'stamp')
+
+    def __init__(self, path:str, mimetype:str, etag:str, body:Optional[bytes], variants:Dict[str, bytes], stamp:tuple) -> None:
+        self.path       = path
+        self.mimetype   = mimetype
+        self.etag       = etag
+        self.body       = body                                              # None for big files served from disk
+        self.variants   = variants                                          # encoding -> compressed body
+        self.stamp      = stamp                                             # (mtime, size) it was loaded with
+
+
+class StaticAssets:
+    '''
+    Every file under root, loaded at startup and, once start() was called, reloaded in the background whenever
+    anything in it changes (e.g. rollup -w rebuilding the bundle).
+
+    root: Folder to serve
+    max_memory: Files up to this size are kept in memory (with their compressed variants)
+    reload_interval: Seconds between two checks for changed files, 0 to never check
+    '''
+    def __init__(self, root:str=STATIC_ROOT, max_memory:int=STATIC_MAX_MEMORY, reload_interval:float=STATIC_RELOAD) -> None:
+        self.root               = root
+        self.max_memory         = max_memory
+        self.reload_interval    = reload_interval
+        self._assets            = {}                                        # path relative to root -> StaticAsset
+        self._lock              = threading.Lock()                          # one load() at a time
+        self._stop              = threading.Event()
+        self._thread            = None
+        self.reloads            = 0
+        self.load()
+
+    def _stamp(self, path:str) -> Optional[tuple]:
+        try:
+            stat = os.stat(os.path.join(self.root, path))
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _read(self, path:str, stamp:tuple) -> StaticAsset:
+        full_path = os.path.join(self.root, path)
+        mimetype = guess_mimetype(path)
+
+        with open(full_path, 'rb') as f:
+            if stamp[1] > self.max_memory:
+                return StaticAsset(path, mimetype, content_hash(f.read()), None, {}, stamp)
+            body = f.read()
+
+        return StaticAsset(path, mimetype, content_hash(body), body, compress(body, mimetype), stamp)
+
+    def fingerprint_links(self, html:bytes, assets:Dict[str, StaticAsset]) -> bytes:
+        '''Adds ?v=<content hash> to every link to one of our files, so those URLs can be cached as immutable'''
+        def add_version(match):
+            asset = assets.get(match.group(3))
+            if asset is None:
+                return match.group(0)
+            return f'{match.group(1)}/{match.group(3)}?v={asset.etag}{match.group(4)}'
+
+        return LOCAL_LINK.sub(add_version, html.decode()).encode()
+
+    def _scan(self) -> Dict[str, tuple]:
+        '''Path -> (mtime, size) of every file under root'''
+        stamps = {}
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.relpath(os.path.join(folder, name), self.root).replace(os.sep, '/')
+                stamp = self._stamp(path)
+                if stamp is not None:
+                    stamps[path] = stamp
+
+        return stamps
+
+    def load(self) -> None:
+        '''(Re)reads, hashes and compresses every file under root'''
+        with self._lock:
+            assets = {path: self._read(path, stamp) for path, stamp in self._scan().items()}
+
+            for path, asset in assets.items():                               # only once every other file's hash is known
+                if asset.body is not None and path.endswith('.html'):
+                    body = self.fingerprint_links(asset.body, assets)
+                    assets[path] = StaticAsset(path, asset.mimetype, content_hash(body), body, compress(body, asset.mimetype), asset.stamp)
+
+            self._assets = assets
+
+    def reload_if_changed(self) -> bool:
+        '''Reloads everything if a file was added, removed or changed since the last load(), returning whether it did'''
+        if self._scan() == {path: asset.stamp for path, asset in self._assets.items()}:
+            return False
+
+        self.load()
+        self.reloads += 1
+        return True
+
+    def get(self, path:str) -> Optional[StaticAsset]:
+        '''The asset at path as it was last loaded'''
+        return self._assets.get(path)
+
+    ### Background reloading
+    def _loop(self) -> None:
+        while not self._stop.wait(self.reload_interval):
+            try:
+                self.reload_if_changed()
+            except OSError as e:                                            # e.g. a file deleted halfway through a rebuild, the next check gets it
+                print(f'[STATIC] reload failed: {e!r}')
+
+    def start(self) -> None:
+        '''Checks for changed files in a background thread every reload_interval seconds'''
+        if self._thread is None and self.reload_interval > 0:
+            self._thread = threading.Thread(target=self._loop, name='static-reload', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        assets = list(self._assets.values())
+        return {
+            "files":            len(assets),
+            "in_memory":        sum(1 for a in assets if a.body is not None),
+            "bytes":            sum(len(a.body) for a in assets if a.body is not None),
+            "compressed_bytes": sum(len(v) for a in assets for v in a.variants.values()),
+            "brotli":           brotli is not None,
+            "reloads":          self.reloads,
+        }
+
+    def send(self, path:str) -> Response:
+        '''Answers a request for path: a 304 if the ETag matches, else the best encoding the client accepts'''
+        asset = self.get(path)
+        if asset is None:                                                   # not something we loaded, let Flask 404 (or find a brand new file)
+            return send_from_directory(self.root, path)
+
+        if asset.body is None:
+            response = send_from_directory(self.root, path, etag=asset.etag)
+        else:
+            encoding = next((e for e in ('br', 'gzip') if e in asset.variants and request.accept_encodings[e]), None)
+            etag = f'{asset.etag}-{encoding}' if encoding else asset.etag   # every representation gets its own strong ETag
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = Response(asset.variants[encoding] if encoding else asset.body, content_type=asset.mimetype)
+                if encoding:
+                    response.headers['Content-Encoding'] = encoding
+
+            response.set_etag(etag)
+            response.vary.add('Accept-Encoding')
+
+        fingerprinted = FINGERPRINTED.search(path) or request.args.get('v') == asset.etag
+        response.headers['Cache-Control'] = IMMUTABLE if fingerprinted else REVALIDATE
+        return response
@@ -0,0 +1,256 @@
+###### DESCRIPTION #################################################
+### Persistent second level behind the in-memory caches: raw weatherapi forecasts and encoded cards are kept in one
+### SQLite file (in WAL mode, so every worker process can read while one writes) with their expiry times, so a
+### forecast fetched by one worker serves all of them, and a restart or deploy doesn't start every cache cold.
+### A background thread drops entries past their keep-until time and then the soonest to go until the file fits its cap,
+### and another one writes what put_later() hands it, so requests never wait on the disk.
+
+
+###### IMPORTS #################################################
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from data_dir import data_path, make_parent
+
+
+###### CONSTANTS #################################################
+STORE_FILE              = os.getenv("STORE_FILE", data_path('store.sqlite3'))  # empty to turn the store off
+STORE_MAX_BYTES         = int(os.getenv("STORE_MAX_BYTES", 256 * 1024 * 1024))     # the values kept never add up to more than this
+STORE_COMPACT_INTERVAL  = float(os.getenv("STORE_COMPACT_INTERVAL", 60))           # seconds between two compactions
+STORE_WRITE_QUEUE       = int(os.getenv("STORE_WRITE_QUEUE", 256))          # put_later() writes waiting for the writer, more are dropped
+STORE_BUSY_TIMEOUT      = 5000                                              # milliseconds a write waits for another process's write to finish
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    kind        TEXT NOT NULL,                      -- 'forecast', 'card'...
+    key         TEXT NOT NULL,
+    value       BLOB NOT NULL,
+    expires_at  REAL NOT NULL,                      -- served as fresh until then
+    keep_until  REAL NOT NULL,                      -- served as stale until then, dropped afterwards
+    size        INTEGER NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_keep_until ON entries (keep_until);
+'''
+
+
+###### STORE #################################################
+class DiskStore:
+    '''
+    Key/value store of bytes with expiry times, shared by every process that opens the same file.
+    Errors from SQLite (a locked or corrupted file, a full disk...) are counted and treated as misses, never raised:
+    the store only ever saves upstream calls and renders, it's never needed to answer.
+
+    path: SQLite file (created on first use), an empty path turns the store into one that never holds anything
+    max_bytes: Size cap on the stored values, enforced by compact()
+    compact_interval: Seconds between two compactions once start() was called
+    write_queue: How many put_later() writes may wait for the writer thread
+    clock: Function returning the current time in seconds (swappable for testing)
+    '''
+    def __init__(self, path:str=STORE_FILE, max_bytes:int=STORE_MAX_BYTES, compact_interval:float=STORE_COMPACT_INTERVAL,
+                 write_queue:int=STORE_WRITE_QUEUE, clock:Callable[[], float]=time.time) -> None:
+        self.path               = path
+        self.max_bytes          = max_bytes
+        self.compact_interval   = compact_interval
+        self.clock              = clock
+
+        self._local     = threading.local()                                 # sqlite3 connections can't be shared between threads
+        self._stop      = threading.Event()
+        self._thread    = None
+        self._pending   = queue.Queue(write_queue)                          # (kind, key, value, expires_at, keep_until) for the writer
+        self._writer    = None
+
+        self.hits       = 0
+        self.misses     = 0
+        self.writes     = 0
+        self.dropped    = 0                                                 # put_later() writes the writer was too far behind to take
+        self.evictions  = 0
+        self.errors     = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    ### Connections
+    def _connection(self) -> sqlite3.Connection:
+        '''This thread's connection, opened on first use (and again in a forked child, which can't use its parent's)'''
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+
+        make_parent(self.path)
+        connection = sqlite3.connect(self.path, timeout=STORE_BUSY_TIMEOUT / 1000, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA auto_vacuum=INCREMENTAL')                # only takes effect on a brand new file, before the table exists
+        connection.execute('PRAGMA journal_mode=WAL')                       # readers never wait on the writer
+        connection.execute('PRAGMA synchronous=NORMAL')                     # a power cut may lose the last writes, which are only cache anyway
+        connection.execute(f'PRAGMA busy_timeout={STORE_BUSY_TIMEOUT}')
+        connection.executescript(SCHEMA)
+
+        self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _execute(self, sql:str, parameters:tuple=()) -> Optional[sqlite3.Cursor]:
+        '''Runs one statement, counting an error and returning None if SQLite (or the folder it's in) fails'''
+        try:
+            return self._connection().execute(sql, parameters)
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+            return None
+
+    ### Entries
+    def get(self, kind:str, key:str) -> Optional[bytes]:
+        '''The value stored for key, or None if there's none (or it expired)'''
+        entry = self._fetch(kind, key, 'expires_at')
+        return entry[0] if entry is not None else None
+
+    def get_stale(self, kind:str, key:str) -> Optional[Tuple[bytes, float]]:
+        '''The value stored for key and when it expires (or expired), as long as it's before its keep_until time, or None'''
+        return self._fetch(kind, key, 'keep_until')
+
+    def _fetch(self, kind:str, key:str, column:str) -> Optional[Tuple[bytes, float]]:
+        if not self.enabled:
+            return None
+
+        cursor = self._execute(f'SELECT value, expires_at FROM entries WHERE kind = ? AND key = ? AND {column} > ?', (kind, key, self.clock()))
+        row = cursor.fetchone() if cursor is not None else None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return row
+
+    def put(self, kind:str, key:str, value:bytes, expires_at:float, keep_until:float=None) -> None:
+        '''
+        Stores value under key, replacing whatever was there.
+
+        expires_at: Time until which value is fresh
+        keep_until: Time until which value may still be served stale (defaults to expires_at)
+        '''
+        if not self.enabled or len(value) > self.max_bytes:
+            return
+
+        keep_until = max(expires_at, keep_until or expires_at)
+        if self._execute('INSERT OR REPLACE INTO entries (kind, key, value, expires_at, keep_until, size) VALUES (?, ?, ?, ?, ?, ?)',
+                         (kind, key, value, expires_at, keep_until, len(value))) is not None:
+            self.writes += 1
+
+    def put_later(self, kind:str, key:str, value:bytes, expires_at:float, keep_until:float=None) -> None:
+        '''
+        Like put(), but written by the writer thread so the caller doesn't wait on the disk.
+        Dropped if the writer is too far behind, written straight away if start() wasn't called.
+        '''
+        if not self.enabled:
+            return
+        if self._writer is None:
+            self.put(kind, key, value, expires_at, keep_until)
+            return
+
+        try:
+            self._pending.put_nowait((kind, key, value, expires_at, keep_until))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        '''Waits until every put_later() write so far is done'''
+        if self._writer is not None:
+            self._pending.join()
+
+    def _write_loop(self) -> None:
+        while True:
+            entry = self._pending.get()
+            try:
+                if entry is None:
+                    return
+                self.put(*entry)
+            finally:
+                self._pending.task_done()
+
+    ### Compaction
+    def compact(self) -> int:
+        '''
+        Drops every entry past its keep_until time, then the ones closest to it until the values fit max_bytes,
+        and gives the freed pages back to the filesystem. Returns how many entries were dropped.
+        '''
+        if not self.enabled:
+            return 0
+
+        try:
+            connection = self._connection()
+            dropped = connection.execute('DELETE FROM entries WHERE keep_until <= ?', (self.clock(),)).rowcount
+
+            size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if size > self.max_bytes:
+                over = connection.execute('SELECT kind, key, size FROM entries ORDER BY keep_until').fetchall()   # soonest to go first
+                victims = []
+                for kind, key, entry_size in over:
+                    if size <= self.max_bytes:
+                        break
+                    victims.append((kind, key))
+                    size -= entry_size
+
+                connection.executemany('DELETE FROM entries WHERE kind = ? AND key = ?', victims)
+                dropped += len(victims)
+
+            connection.execute('PRAGMA incremental_vacuum').fetchall()      # runs one step per row fetched
+            connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')            # writes it all back to the file, and keeps the -wal file from growing forever
+
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+            return 0
+
+        self.evictions += dropped
+        return dropped
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.compact_interval):
+            self.compact()
+
+    def start(self) -> None:
+        '''Starts the writer thread, and compacts in another one every compact_interval seconds'''
+        if not self.enabled:
+            return
+
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name='store-writer', daemon=True)
+            self._writer.start()
+        if self._thread is None and self.compact_interval > 0:
+            self._thread = threading.Thread(target=self._loop, name='store-compaction', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        '''Stops compacting, and the writer once it's written what it was given'''
+        self._stop.set()
+        if self._writer is not None:
+            self._pending.put(None)
+
+    def clear(self) -> None:
+        '''Drops every stored entry (counters are kept)'''
+        if self.enabled:
+            self._execute('DELETE FROM entries')
+
+    def stats(self) -> Dict:
+        '''Hit/miss/write counters plus what's stored (shared with every other worker, unlike the counters)'''
+        if not self.enabled:
+            return {"enabled": False}
+
+        cursor = self._execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries')
+        entries, size = cursor.fetchone() if cursor is not None else (0, 0)
+        return {
+            "enabled":      True,
+            "hits":         self.hits,
+            "misses":       self.misses,
+            "writes":       self.writes,
+            "dropped":      self.dropped,
+            "pending":      self._pending.qsize(),
+            "evictions":    self.evictions,
+            "errors":       self.errors,
+            "entries":      entries,
+            "bytes":        size,
+            "max_bytes":    self.max_bytes,
+        }
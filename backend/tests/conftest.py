@@ -0,0 +1,73 @@
+###### DESCRIPTION #################################################
+### Shared setup for the tests: one fake_weatherapi.py for the whole run (its latency and error rate can be
+### changed per test), and the backend pointed at it with nothing in the background and nothing on disk.
+### The environment has to be set before weather_report is imported, so it's done here rather than in a fixture.
+### Run from the backend folder (pytest is only needed to run them, the app doesn't depend on it): python -m pytest
+
+
+###### IMPORTS #################################################
+import os
+import tempfile
+
+import pytest
+
+from fake_weatherapi import FakeWeatherAPI
+
+
+###### ENVIRONMENT #################################################
+FAKE = FakeWeatherAPI().start()
+
+os.environ.update({
+    'WEATHERAPI':       FAKE.url,
+    'STORE_FILE':       '',                                                 # every forecast comes from the fake, not from an earlier run
+    'QUOTA_FILE':       os.path.join(tempfile.mkdtemp(prefix='wttr-tests-'), 'quota'),
+    'QUOTA_PER_MINUTE': '0',
+    'QUOTA_PER_MONTH':  '0',
+    'RENDER_WORKERS':   '0',                                                # cards are drawn on the test's own thread
+    'PREWARM_TOP_N':    '0',
+})
+
+import weather_report                                                       # noqa: E402, reads the environment above
+from upstream import CircuitBreaker                                         # noqa: E402
+
+
+###### FIXTURES #################################################
+class FakeClock:
+    '''A clock that only moves when told to'''
+    def __init__(self, now:float) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds:float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def fake():
+    '''The fake weatherapi.com, answering normally and straight away at the start of every test'''
+    FAKE.latency, FAKE.error_rate = 0, 0
+    yield FAKE
+    FAKE.latency, FAKE.error_rate = 0, 0
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''A FakeClock driving the forecast cache and a fresh circuit breaker'''
+    clock = FakeClock(weather_report.FORECAST_CACHE.clock())
+    monkeypatch.setattr(weather_report.FORECAST_CACHE, 'clock', clock)
+    monkeypatch.setattr(weather_report, 'BREAKER', CircuitBreaker(threshold=3, reset_timeout=30, clock=clock))
+    return clock
+
+@pytest.fixture(autouse=True)
+def cold_start(monkeypatch):
+    '''Every test starts without any forecast, "not found", card or /api response cached, and with a closed circuit breaker'''
+    for cache in (weather_report.FORECAST_CACHE, weather_report.NOT_FOUND_CACHE, weather_report.CARD_CACHE, weather_report.API_CACHE):
+        cache.clear()
+    weather_report.reset_staleness()
+    monkeypatch.setattr(weather_report, 'BREAKER', CircuitBreaker(threshold=3, reset_timeout=30))
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
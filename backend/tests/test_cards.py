@@ -0,0 +1,31 @@
+###### DESCRIPTION #################################################
+### Drawing the hourly card on its shared base layer
+
+
+###### IMPORTS #################################################
+from PIL import Image
+
+from wttr import pill
+
+
+###### HOURLY BASE LAYER #################################################
+FORECAST = dict(city='LONDON', current_temp='9º', current_code='116', forecast=['4º', '7º', '10º', '8º', '3º', '0º'],
+                forecast_codes=['296', '116', '176', '200', '302', '999'])
+
+def test_cards_drawn_on_the_shared_base_match_a_copy(monkeypatch):
+    monkeypatch.setattr(pill, '_BASE_LAYERS', type(pill._BASE_LAYERS)())
+    base = pill.hourly_base(**FORECAST)
+    pristine = base.image.tobytes()
+
+    for time, progress in [('9:05', 120), ('23:59', 700), ('0:00', -30), ('12:30', 820)]:   # marker off both edges too
+        card = Image.open(pill.create_weather_card_hourly(**FORECAST, time=time, progress=progress))
+        expected = pill.draw_weather_card_hourly(**FORECAST, time=time, progress=progress)
+
+        assert card.convert('RGB').tobytes() == expected.tobytes()
+        assert base.image.tobytes() == pristine                             # every pixel it drew on was put back
+
+def test_base_layers_are_split_between_workers(monkeypatch):
+    monkeypatch.setattr(pill, 'BASE_LAYER_MEMORY', 16 * pill.BASE_LAYER_BYTES)
+    monkeypatch.setattr(pill, '_base_layer_limit', pill._base_layer_limit)   # put back afterwards
+    pill.share_base_layers(4)
+    assert pill._base_layer_limit == 4
@@ -0,0 +1,21 @@
+import pytest
+
+from gazetteer import Gazetteer, UnknownCity
+
+GAZETTEER = Gazetteer.load()
+
+
+@pytest.mark.parametrize('query, canonical', [('London', 'london'), (' LONDRES ', 'london'), ('51.51, -0.13', '51.5100,-0.1300')])
+def test_known_places_are_canonical(query, canonical):
+    assert GAZETTEER.canonical(query, strict=True) == canonical
+
+
+@pytest.mark.parametrize('query', ['10001', 'SW1A 1AA', 'lhr', 'auto:ip', 'iata:DXB', 'metar:EGLL'])
+def test_queries_that_arent_place_names_pass_through(query):
+    assert GAZETTEER.canonical(query, strict=True) == ' '.join(query.split()).lower()
+
+
+def test_unknown_place_names():
+    assert GAZETTEER.canonical('Zermatt', strict=False) == 'zermatt'                    # under 15k people, still weatherapi's to answer
+    with pytest.raises(UnknownCity):
+        GAZETTEER.canonical('Zermatt', strict=True)
@@ -0,0 +1,107 @@
+###### DESCRIPTION #################################################
+### Pre-warming of the most requested cities, against fake_weatherapi.py and a clock that only moves when told to
+
+
+###### IMPORTS #################################################
+import pytest
+
+import weather_report
+from prewarm import PrewarmScheduler
+
+
+###### FIXTURES #################################################
+@pytest.fixture
+def scheduler(clock):
+    return PrewarmScheduler(2, {'hourly': ['png'], 'tomorrow': ['png']}, margin=20, budget=3, half_life=3600, clock=clock)
+
+
+###### POPULARITY #################################################
+def test_most_requested_cities_first(scheduler):
+    for city in ['Paris', 'London', 'London', 'Tokyo', 'London', 'Paris']:
+        scheduler.record(city)
+
+    assert scheduler.top_cities() == ['london', 'paris']
+
+def test_popularity_fades(scheduler, clock):
+    for _ in range(4):
+        scheduler.record('London')
+    clock.advance(3 * 3600)                                                 # London's 4 requests are now worth half of one
+    scheduler.record('Paris')
+
+    assert scheduler.top_cities() == ['paris', 'london']
+
+    clock.advance(10 * 3600)                                                # faded out altogether
+    assert scheduler.top_cities() == []
+    assert scheduler.stats()['tracked'] == 0
+
+def test_tracked_cities_are_capped(clock):
+    scheduler = PrewarmScheduler(2, {}, max_tracked=100, clock=clock)
+    for _ in range(5):
+        scheduler.record('London')
+    for i in range(1000):                                                   # a client sending random coordinates
+        scheduler.record(f'{i / 10:.1f},{i / 20:.1f}')
+
+    assert scheduler.stats()['tracked'] <= 100
+    assert scheduler.top_cities()[0] == 'london'
+
+
+###### WARMING #################################################
+def test_warms_forecasts_and_cards(fake, scheduler):
+    scheduler.record('London')
+    before = fake.requests
+
+    scheduler.run_once()
+    assert fake.requests - before == 1                                      # missing, so refreshed
+    assert scheduler.refreshes == 1 and scheduler.renders == 3              # hourly, light and dark tomorrow
+
+    hits, misses = weather_report.CARD_CACHE.hits, weather_report.CARD_CACHE.misses
+    scheduler.run_once()
+    assert fake.requests - before == 1 and scheduler.renders == 3           # still fresh and already rendered
+    assert (weather_report.CARD_CACHE.hits, weather_report.CARD_CACHE.misses) == (hits, misses)
+
+def test_warms_the_formats_visitors_ask_for(fake, scheduler, clock):
+    scheduler.record('London', 'hourly', 'svg')
+    scheduler.record('London', 'tomorrow', 'png')                           # already warmed
+    scheduler.run_once()
+    assert scheduler.renders == 4                                           # hourly in png and svg, light and dark tomorrow in png
+
+    clock.advance(3600)                                                     # nobody asked for SVG since
+    scheduler.record('London', 'hourly', 'png')
+    weather_report.CARD_CACHE.clear()
+    scheduler.run_once()
+    assert scheduler.renders == 7
+
+def test_refreshes_just_before_expiry(fake, scheduler, clock):
+    scheduler.record('Paris')
+    scheduler.run_once()
+    expires_at = weather_report.FORECAST_CACHE.expires_at('paris')
+
+    clock.advance(expires_at - clock() - 30)                                # not within the margin yet
+    scheduler.run_once()
+    assert scheduler.refreshes == 1
+
+    clock.advance(15)
+    scheduler.run_once()
+    assert scheduler.refreshes == 2
+    assert weather_report.FORECAST_CACHE.expires_at('paris') > expires_at
+
+def test_stays_within_budget(fake, scheduler, clock):
+    scheduler.record('London')
+    scheduler.record('Tokyo')
+
+    scheduler.run_once()                                                    # 2 of the 3 calls an hour
+    weather_report.FORECAST_CACHE.clear()
+    scheduler.run_once()                                                    # 1 left for 2 cities
+
+    assert scheduler.refreshes == 3 and scheduler.skipped == 1
+
+    clock.advance(3600)
+    weather_report.FORECAST_CACHE.clear()
+    scheduler.run_once()
+    assert scheduler.refreshes == 5
+
+def test_forgets_cities_weatherapi_does_not_know(fake, scheduler):
+    scheduler.record('Berlin')                                              # not one of the fake's recorded cities
+    scheduler.run_once()
+
+    assert scheduler.top_cities() == []
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from wttr import recolour
+
+
+OLD = (200, 200, 200)
+
+def tinted_pixel(pixel:tuple, new_colour:tuple) -> tuple:
+    image = Image.new('RGBA', (1, 1), pixel)
+    return recolour.recolour(image, OLD, new_colour).getpixel((0, 0))
+
+def test_exact_match_takes_the_new_colour():
+    assert tinted_pixel(OLD + (255,), (254, 192, 22)) == (254, 192, 22, 255)
+
+@pytest.mark.parametrize('grey, new_colour', [(176, (103, 61, 17)), (188, (254, 192, 22)), (164, (31, 97, 250)), (190, (7, 7, 7))])
+def test_edge_pixels_are_tinted_by_coverage(grey, new_colour):
+    weight = 1 - (OLD[0] - grey) / recolour.TOLERANCE
+    shade = grey / OLD[0]
+    expected = tuple(int(grey * (1 - weight) + weight * shade * c + 0.5) for c in new_colour)
+
+    assert tinted_pixel((grey, grey, grey, 128), new_colour) == expected + (128,)          # alpha is left alone
+
+@pytest.mark.parametrize('pixel', [(10, 20, 30, 255), (200, 200, 200, 0)])
+def test_far_and_transparent_pixels_are_untouched(pixel):
+    assert tinted_pixel(pixel, (254, 192, 22)) == pixel
+
+def test_batch_matches_one_at_a_time(monkeypatch):
+    monkeypatch.setattr(recolour, 'BATCH_PIXELS', 500)                      # several batches, and a mask bigger than one
+    rng = np.random.default_rng(7)
+    images = []
+    for size in [(8, 8), (30, 40), (16, 16), (1, 1)]:
+        data = rng.integers(150, 256, size=size[::-1] + (4,), dtype=np.uint8)
+        images.append(Image.fromarray(data, 'RGBA'))
+    colours = [(254, 192, 22), (0, 0, 0), (31, 97, 250)]
+
+    masks = [recolour.RecolourMask(image, OLD) for image in images]
+    batched = recolour.recolour_batch(masks, colours)
+
+    for image, tints in zip(images, batched):
+        assert [tint.tobytes() for tint in tints] == [recolour.recolour(image, OLD, colour).tobytes() for colour in colours]
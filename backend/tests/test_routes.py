@@ -0,0 +1,109 @@
+###### DESCRIPTION #################################################
+### What the card and /api routes answer, driven through fake_weatherapi.py
+
+
+###### IMPORTS #################################################
+import threading
+import time
+
+import pytest
+
+import weather_report
+from upstream import AsyncUpstreamClient, UpstreamUnavailable
+
+
+###### CARDS #################################################
+@pytest.mark.parametrize('path', ['/wttr/London', '/tmrw/London', '/week/London'])
+def test_bad_format_is_refused_before_fetching(fake, client, path):
+    before = fake.requests
+    response = client.get(f'{path}?format=bogus')
+
+    assert response.status_code == 400
+    assert fake.requests == before
+
+@pytest.mark.parametrize('image_format, mimetype', [('png', 'image/png'), ('webp-lossy', 'image/webp'), ('svg', 'image/svg+xml')])
+def test_card_formats(fake, client, image_format, mimetype):
+    response = client.get(f'/wttr/London?format={image_format}')
+
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+    assert 'Accept' in response.vary
+
+def test_accepting_webp_still_gets_the_default(fake, client):
+    response = client.get('/wttr/London', headers={'Accept': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8'})   # a browser's <img>
+    assert response.mimetype == 'image/png'
+
+
+###### API #################################################
+@pytest.mark.parametrize('fields', ['', ',,,', ' , '])
+def test_empty_field_list_is_everything(fake, client, fields):
+    response = client.get(f'/api/London?fields={fields}')
+
+    assert response.status_code == 200
+    assert response.json == client.get('/api/London').json
+    assert response.json['current']['temp_c'] is not None
+
+def test_unknown_field_is_refused(fake, client):
+    assert client.get('/api/London?fields=current.nope').status_code == 400
+
+def hour_times(response) -> list:
+    return [hour['time'] for day in response.json['forecast'] for hour in day['hour']]
+
+def test_hours_count_from_the_current_local_hour(fake, client, monkeypatch):
+    day = client.get('/api/London').json['forecast'][0]['date']
+
+    monkeypatch.setattr(weather_report, 'get_current_local_hour', lambda tz_id: f'{day} 14')
+    response = client.get('/api/London?hours=3&fields=forecast.hour.time')
+    assert hour_times(response) == [f'{day} 14:00', f'{day} 15:00', f'{day} 16:00']
+    etag = response.headers['ETag']
+
+    monkeypatch.setattr(weather_report, 'get_current_local_hour', lambda tz_id: f'{day} 23')   # same forecast, an hour that's later
+    response = client.get('/api/London?hours=3&fields=forecast.hour.time')
+    assert hour_times(response)[0] == f'{day} 23:00'                      # into the next day
+    assert response.headers['ETag'] != etag
+
+
+###### BATCH #################################################
+def test_batch_reports_each_city_on_its_own(fake, client, monkeypatch):
+    forecast = AsyncUpstreamClient.forecast
+
+    async def failing_for_tokyo(self, city, days=3):
+        if city == 'tokyo':
+            raise UpstreamUnavailable('weatherapi.com answered 503')
+        return await forecast(self, city, days)
+
+    monkeypatch.setattr(AsyncUpstreamClient, 'forecast', failing_for_tokyo)
+    response = client.post('/api/batch', json={'cities': ['London', 'Berlin', 'Tokyo', 'PARIS']})
+
+    assert response.status_code == 200
+    assert sorted(response.json['reports']) == ['London', 'PARIS']
+    assert response.json['errors'] == {'Berlin': 'city not found', 'Tokyo': 'weather service unavailable'}
+
+def test_batch_size_is_capped(fake, client, monkeypatch):
+    monkeypatch.setattr(weather_report, 'BATCH_MAX_CITIES', 2)
+    before = fake.requests
+
+    assert client.post('/api/batch', json=['London', 'Paris', 'Tokyo']).status_code == 400
+    assert fake.requests == before                                          # refused before anything is fetched
+    assert client.post('/api/batch', json=['London', 'Paris']).status_code == 200
+
+def test_batch_waits_for_a_fetch_already_in_flight(fake, client):
+    fake.latency = 0.3
+    before = fake.requests
+
+    single = threading.Thread(target=weather_report.fetch_api_data, args=('London',))
+    single.start()
+    time.sleep(0.1)                                                         # the single request is now waiting on weatherapi
+    response = client.post('/api/batch', json=['London'])
+    single.join()
+
+    assert list(response.json['reports']) == ['London']
+    assert fake.requests == before + 1
+
+
+###### STATIC #################################################
+@pytest.mark.parametrize('path, content_type', [('/', 'text/html; charset=utf-8'), ('/global.css', 'text/css; charset=utf-8'), ('/favicon.png', 'image/png')])
+def test_static_content_type(client, path, content_type):
+    response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == content_type
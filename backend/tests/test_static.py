@@ -0,0 +1,38 @@
+###### DESCRIPTION #################################################
+### The in-memory static files, and reloading them when they change on disk
+
+
+###### IMPORTS #################################################
+import os
+
+from static_assets import StaticAssets
+
+
+###### RELOADING #################################################
+def write(path, text:str, mtime:int) -> None:
+    path.write_text(text)
+    os.utime(path, ns=(mtime, mtime))                                       # filesystems with coarse timestamps would miss a quick edit
+
+def test_changes_are_only_picked_up_by_a_reload(tmp_path):
+    write(tmp_path / 'index.html', '<script src="/app.js"></script>', 1)
+    write(tmp_path / 'app.js', 'console.log(1)', 1)
+    assets = StaticAssets(str(tmp_path))
+    etag = assets.get('index.html').etag
+
+    write(tmp_path / 'app.js', 'console.log(2)', 2)
+    assert assets.get('app.js').body == b'console.log(1)'                   # requests never look at the disk
+
+    assert assets.reload_if_changed()
+    assert assets.get('app.js').body == b'console.log(2)'
+    assert assets.get('index.html').etag != etag                            # its link to app.js has a new ?v=
+    assert not assets.reload_if_changed()
+
+def test_added_and_removed_files_are_a_change(tmp_path):
+    write(tmp_path / 'a.css', 'a {}', 1)
+    assets = StaticAssets(str(tmp_path))
+
+    write(tmp_path / 'b.css', 'b {}', 1)
+    os.remove(tmp_path / 'a.css')
+    assert assets.reload_if_changed()
+    assert assets.get('a.css') is None and assets.get('b.css').body == b'b {}'
+    assert assets.stats()['reloads'] == 1
@@ -0,0 +1,59 @@
+###### DESCRIPTION #################################################
+### The on-disk store and the private folder it (and the quota's state) is kept in
+
+
+###### IMPORTS #################################################
+import os
+import stat
+
+import pytest
+
+import data_dir
+from store import DiskStore
+
+
+###### DATA FOLDER #################################################
+def mode_of(path:str) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+def test_data_dir_is_private(tmp_path, monkeypatch):
+    folder = tmp_path / 'weather-report'
+    monkeypatch.setattr(data_dir, 'DATA_DIR', str(folder))
+
+    store = DiskStore(str(folder / 'store.sqlite3'))
+    store.put('card', 'key', b'<svg/>', store.clock() + 60)
+    assert store.get('card', 'key') == b'<svg/>'
+    assert mode_of(folder) == 0o700
+
+def test_data_dir_left_open_is_tightened(tmp_path, monkeypatch):
+    folder = tmp_path / 'weather-report'
+    folder.mkdir()
+    os.chmod(folder, 0o777)                                                 # e.g. created by someone else's umask
+    monkeypatch.setattr(data_dir, 'DATA_DIR', str(folder))
+
+    data_dir.make_parent(data_dir.data_path('quota'))
+    assert mode_of(folder) == 0o700
+
+def test_data_dir_must_be_a_folder(tmp_path):
+    target = tmp_path / 'elsewhere'
+    target.mkdir()
+    link = tmp_path / 'weather-report'
+    link.symlink_to(target)
+
+    with pytest.raises(PermissionError):
+        data_dir.private_dir(str(link))
+
+
+###### BACKGROUND WRITES #################################################
+def test_put_later_writes_in_the_background(tmp_path):
+    store = DiskStore(str(tmp_path / 'store.sqlite3'), compact_interval=0)
+    store.start()
+    try:
+        for i in range(10):
+            store.put_later('card', f'key-{i}', b'card', store.clock() + 60)
+        store.flush()
+
+        assert store.writes == 10
+        assert store.get('card', 'key-9') == b'card'
+    finally:
+        store.stop()
@@ -0,0 +1,26 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from wttr.text import Font, Text, GlyphCache
+
+
+@pytest.mark.parametrize('mode, colour', [('RGB', (254, 192, 22)), ('RGBA', (30, 30, 30, 255)), ('RGB', '#FEC016'), ('L', 'white')])
+def test_cached_text_matches_draw_text(mode, colour):
+    t = Text('Zermatt 12º', (100, 148), Font.BOLD_CONDENSED, colour)
+    expected = Image.new(mode, (600, 300))
+    ImageDraw.Draw(expected).text(t.position, t.text, t.colour, t.font.value, t.anchor)
+
+    cached = Image.new(mode, (600, 300))
+    GlyphCache().draw(ImageDraw.Draw(cached), t)
+    assert cached.tobytes() == expected.tobytes()
+
+
+def test_falls_back_on_draw_text_without_pillows_internals():
+    t = Text('Zermatt 12º', (100, 148), Font.BOLD_CONDENSED, (254, 192, 22))
+    draw = ImageDraw.Draw(Image.new('RGB', (600, 300)))
+    draw.draw = object()                                                    # as if a Pillow release renamed what GlyphCache relies on
+    calls = []
+    draw.text = lambda *args: calls.append(args)
+
+    GlyphCache().draw(draw, t)
+    assert calls == [(t.position, t.text, t.colour, t.font.value, t.anchor)]
@@ -0,0 +1,200 @@
+###### DESCRIPTION #################################################
+### The forecast cache and the weatherapi.com client, driven through fake_weatherapi.py
+
+
+###### IMPORTS #################################################
+import threading
+import time
+
+import pytest
+
+import weather_report
+from upstream import UpstreamClient, UpstreamUnavailable
+from conftest import FakeClock
+
+
+###### SINGLE-FLIGHT #################################################
+def test_concurrent_misses_make_one_upstream_call(fake):
+    fake.latency = 0.2                                                      # long enough for every thread to miss while the first call is out
+    before, coalesced = fake.requests, weather_report.FORECAST_CACHE.coalesced
+
+    records = []
+    threads = [threading.Thread(target=lambda: records.append(weather_report.fetch_api_data('London'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fake.requests - before == 1
+    assert weather_report.FORECAST_CACHE.coalesced - coalesced == 7
+    assert len({id(record) for record in records}) == 1                     # every thread got the leader's record
+
+def test_errors_are_shared_but_not_cached(fake):
+    fake.latency, fake.error_rate = 0.2, 1
+    before = fake.requests
+
+    errors = []
+    def fetch():
+        try:
+            weather_report.fetch_api_data('Paris')
+        except UpstreamUnavailable as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fake.requests - before == 1 and len(errors) == 4
+
+    fake.latency, fake.error_rate = 0, 0
+    assert weather_report.fetch_api_data('Paris').raw                       # the next request tries again
+    assert fake.requests - before == 2
+
+
+###### TTL #################################################
+def test_forecast_is_reused_until_it_expires(fake, clock):
+    before = fake.requests
+    weather_report.fetch_api_data('Tokyo')
+    expires_at = weather_report.FORECAST_CACHE.expires_at('tokyo')
+
+    clock.advance(expires_at - clock() - 1)
+    weather_report.fetch_api_data('Tokyo')
+    assert fake.requests - before == 1
+
+    clock.advance(1 + weather_report.STALE_TTL)                             # past its expiry and past serving it stale
+    weather_report.fetch_api_data('Tokyo')
+    assert fake.requests - before == 2
+    assert weather_report.FORECAST_CACHE.expires_at('tokyo') > clock()
+
+def test_ttl_stays_within_bounds(clock):
+    record = weather_report.fetch_api_data('London')
+
+    clock.now = record.last_updated_epoch + 100                             # weatherapi refreshes it 800s from now
+    assert weather_report.forecast_ttl(record) == min(weather_report.UPSTREAM_INTERVAL - 100, weather_report.FORECAST_TTL)
+
+    clock.now = record.last_updated_epoch - weather_report.UPSTREAM_INTERVAL   # conditions newer than the clock: capped at FORECAST_TTL
+    assert weather_report.forecast_ttl(record) == weather_report.FORECAST_TTL
+
+    clock.now = record.last_updated_epoch + 10 * weather_report.UPSTREAM_INTERVAL   # long overdue: still kept for FORECAST_MIN_TTL
+    assert weather_report.forecast_ttl(record) == weather_report.FORECAST_MIN_TTL
+
+
+###### STALE-WHILE-REVALIDATE #################################################
+def test_expired_forecast_is_served_stale_while_weatherapi_is_down(fake, clock, client):
+    assert client.get('/wttr/London').status_code == 200
+    expires_at = weather_report.FORECAST_CACHE.expires_at('london')
+
+    fake.error_rate = 1
+    before, errors = fake.requests, fake.errors
+    clock.now = expires_at + 120
+    for _ in range(3):
+        response = client.get('/wttr/London')
+        assert response.status_code == 200
+        assert response.headers['X-Forecast-Stale'] == '120'
+        assert 'Warning' in response.headers
+
+    deadline = time.monotonic() + 5
+    while fake.errors == errors and time.monotonic() < deadline:           # the refresh runs in the background
+        time.sleep(0.01)
+    assert fake.requests - before == 1                                      # one refresh, however many requests saw it stale
+
+    clock.now = expires_at + weather_report.STALE_TTL                       # too old to serve any more
+    assert client.get('/wttr/London').status_code == 503
+
+
+###### CIRCUIT BREAKER #################################################
+def test_open_circuit_answers_503_without_calling_weatherapi(fake, clock, client):
+    fake.error_rate = 1
+    before = fake.requests
+    for _ in range(weather_report.BREAKER.threshold):
+        assert client.get('/wttr/Paris').status_code == 503
+    assert weather_report.BREAKER.state == 'open'
+
+    clock.advance(10)
+    response = client.get('/wttr/Paris')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '20'
+    assert fake.requests - before == weather_report.BREAKER.threshold
+
+def test_half_open_circuit_lets_one_probe_through(fake, clock):
+    fake.error_rate = 1
+    for _ in range(weather_report.BREAKER.threshold):
+        with pytest.raises(UpstreamUnavailable):
+            weather_report.fetch_api_data('Paris')
+
+    clock.advance(weather_report.BREAKER.reset_timeout)
+    fake.latency, fake.error_rate = 0.2, 0                                  # the probe is still out while the others arrive
+    before = fake.requests
+
+    outcomes = {}
+    def fetch(city):
+        try:
+            outcomes[city] = weather_report.fetch_api_data(city)
+        except UpstreamUnavailable as e:
+            outcomes[city] = e
+
+    cities = ['London', 'Paris', 'Tokyo', 'New York City', 'Los Angeles']   # different cities, so single-flight can't be what holds them back
+    threads = [threading.Thread(target=fetch, args=(city,)) for city in cities]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fake.requests - before == 1
+    assert sum(not isinstance(outcome, Exception) for outcome in outcomes.values()) == 1
+    assert weather_report.BREAKER.state == 'closed'                         # the probe worked
+
+    fake.latency = 0
+    assert weather_report.fetch_api_data('Tokyo').raw
+
+
+###### ERROR MAPPING #################################################
+def test_client_maps_weatherapi_errors(fake):
+    client = UpstreamClient(fake.url, 'key')
+    try:
+        assert client.forecast('london')
+
+        with pytest.raises(ValueError):                                     # weatherapi's 400, the city doesn't exist
+            client.forecast('atlantis')
+
+        fake.error_rate = 1
+        with pytest.raises(UpstreamUnavailable):
+            client.forecast('london')
+
+    finally:
+        client.close()
+
+def test_unknown_city_is_a_404(fake, client):
+    assert client.get('/wttr/Berlin').status_code == 404                    # in the gazetteer, but weatherapi (the fake) doesn't know it
+
+def test_unknown_city_is_only_asked_about_once(fake, client, monkeypatch):
+    clock = FakeClock(0)
+    monkeypatch.setattr(weather_report.NOT_FOUND_CACHE, 'clock', clock)
+    before = fake.requests
+
+    assert client.get('/wttr/Atlantis').status_code == 404                  # not in the gazetteer, passed through to weatherapi
+    assert client.get('/tmrw/ATLANTIS').status_code == 404
+    assert client.post('/api/batch', json=['atlantis']).json['errors'] == {'atlantis': 'city not found'}
+    assert fake.requests - before == 1
+
+    clock.advance(weather_report.NOT_FOUND_TTL)                             # it might have been added since
+    assert client.get('/wttr/Atlantis').status_code == 404
+    assert fake.requests - before == 2
+
+def test_upstream_failure_is_a_503(fake, client):
+    fake.error_rate = 1
+    response = client.get('/wttr/London')
+    assert response.status_code == 503
+
+    fake.error_status = 429
+    try:
+        assert client.get('/tmrw/London').status_code == 503               # over the key's allowance
+    finally:
+        fake.error_status = 503
+
+def test_cached_forecast_is_only_the_raw_body(fake):
+    record = weather_report.fetch_api_data('London')
+    assert not hasattr(record, '__dict__')                                  # slotted, nothing but the body and what's derived from it
+    assert record.report() == weather_report.get_weather_report_data('London')
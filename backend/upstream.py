@@ -0,0 +1,191 @@
+###### DESCRIPTION #################################################
+### Clients for weatherapi.com that keep a pool of keep-alive connections open instead of
+### paying DNS + TCP (+ TLS) setup on every call, and that never wait forever on a slow response.
+### A circuit breaker stops calling it altogether while it's down, so requests fail (or go stale) fast.
+
+
+###### IMPORTS #################################################
+import threading
+import time
+from typing import Callable, Dict
+
+import httpx
+
+
+###### ERRORS #################################################
+class UpstreamUnavailable(Exception):
+    '''weatherapi.com could not be reached, took too long or errored (as opposed to not knowing the city)'''
+
+class UpstreamRateLimited(UpstreamUnavailable):
+    '''weatherapi.com refused the call because the key is over its allowance (or disabled)'''
+
+class CircuitOpen(UpstreamUnavailable):
+    '''weatherapi.com failed too many times in a row, so it isn't being called until the breaker lets a probe through'''
+
+
+###### HELPERS #################################################
+def make_timeout(connect:float, read:float) -> httpx.Timeout:
+    '''Separate limits for opening a connection and for waiting on the response'''
+    return httpx.Timeout(read, connect=connect)
+
+def make_limits(max_connections:int, max_keepalive:int) -> httpx.Limits:
+    '''Size of the connection pool and how many idle connections are kept alive for reuse'''
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+
+def handle_response(response:httpx.Response, city:str) -> bytes:
+    '''Turns weatherapi's reply into the forecast JSON bytes (left undecoded), or the ValueError the routes expect for unknown cities'''
+    if response.status_code == 400:                                         # weatherapi's "No matching location found"
+        raise ValueError(f'400 - City {city} was not found')
+
+    if response.status_code in (403, 429):                                  # over the key's allowance, or the key was disabled
+        raise UpstreamRateLimited(f'weatherapi.com refused the call ({response.status_code}) while fetching {city}')
+
+    if not response.is_success:                                             # 5xx and the like, the city isn't the problem
+        raise UpstreamUnavailable(f'weatherapi.com answered {response.status_code} while fetching {city}')
+
+    return response.content
+
+
+###### CIRCUIT BREAKER #################################################
+class CircuitBreaker:
+    '''
+    Stops calling weatherapi.com after `threshold` failures in a row (open), then lets a single probe through every
+    `reset_timeout` seconds (half-open) until one succeeds and traffic flows again (closed).
+    An unknown city doesn't count as a failure, it means the service is working fine.
+
+    threshold: Consecutive failures that open the circuit
+    reset_timeout: Seconds to wait before probing an open circuit
+    clock: Function returning the current time in seconds (swappable for testing)
+    '''
+    def __init__(self, threshold:int=5, reset_timeout:float=30, clock:Callable[[], float]=time.monotonic) -> None:
+        self.threshold      = threshold
+        self.reset_timeout  = reset_timeout
+        self.clock          = clock
+
+        self._lock          = threading.Lock()
+        self._failures      = 0                                             # consecutive failures
+        self._opened_at     = None                                          # when the circuit opened, None while closed
+        self._probing       = False                                         # a half-open probe is in flight
+
+        self.trips          = 0
+        self.rejected       = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half-open' if self._probing or self.clock() - self._opened_at >= self.reset_timeout else 'open'
+
+    def retry_after(self) -> float:
+        '''Seconds until the next probe is allowed (0 when the circuit is closed)'''
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(0, self._opened_at + self.reset_timeout - self.clock())
+
+    def allow(self) -> bool:
+        '''Whether a call may go out now. A True on an open circuit makes the caller the probe, which must report back'''
+        with self._lock:
+            if self._opened_at is None:
+                return True
+
+            if not self._probing and self.clock() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures, self._opened_at, self._probing = 0, None, False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.threshold):
+                if self._opened_at is None:
+                    self.trips += 1
+                self._opened_at = self.clock()                              # a failed probe waits another reset_timeout
+            self._probing = False
+
+    def call(self, fetch:Callable[[], bytes]) -> bytes:
+        '''Runs fetch() if the circuit allows it, keeping score of how it went (raises CircuitOpen otherwise)'''
+        if not self.allow():
+            raise CircuitOpen(f'weatherapi.com is failing, next try in {self.retry_after():.0f}s')
+
+        try:
+            result = fetch()
+        except ValueError:                                                  # an unknown city still means weatherapi answered
+            self.record_success()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            failures, trips, rejected = self._failures, self.trips, self.rejected
+        return {"state": self.state, "consecutive_failures": failures, "trips": trips, "rejected": rejected}
+
+
+###### BLOCKING CLIENT #################################################
+class UpstreamClient:
+    '''
+    Blocking weatherapi.com client, safe to share between Flask's request threads.
+
+    base_url: URL of the forecast endpoint (can point at a local stand-in)
+    api_key: weatherapi.com key sent with every request
+    connect_timeout / read_timeout: Seconds to wait for a connection / for the response
+    max_connections / max_keepalive: Connection pool size / idle connections kept open
+    '''
+    def __init__(self, base_url:str, api_key:str, connect_timeout:float=3, read_timeout:float=10, max_connections:int=20, max_keepalive:int=10) -> None:
+        self.base_url   = base_url
+        self.api_key    = api_key
+        self._client    = httpx.Client(timeout=make_timeout(connect_timeout, read_timeout), limits=make_limits(max_connections, max_keepalive))
+
+    def forecast(self, city:str, days:int=3) -> bytes:
+        '''Fetches the raw forecast JSON for a city'''
+        try:
+            response = self._client.get(self.base_url, params={'key': self.api_key, 'q': city, 'days': days})
+        except httpx.TransportError as e:                                   # timeouts, refused connections, DNS failures...
+            raise UpstreamUnavailable(f'weatherapi.com unreachable while fetching {city}: {e!r}') from e
+
+        return handle_response(response, city)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+###### ASYNC CLIENT #################################################
+class AsyncUpstreamClient:
+    '''
+    asyncio flavour of UpstreamClient, so many forecasts can be in flight at once without a thread each.
+    The pool belongs to the event loop it was first used on, so use it as `async with` inside that loop.
+    '''
+    def __init__(self, base_url:str, api_key:str, connect_timeout:float=3, read_timeout:float=10, max_connections:int=20, max_keepalive:int=10) -> None:
+        self.base_url   = base_url
+        self.api_key    = api_key
+        self._client    = httpx.AsyncClient(timeout=make_timeout(connect_timeout, read_timeout), limits=make_limits(max_connections, max_keepalive))
+
+    async def forecast(self, city:str, days:int=3) -> bytes:
+        '''Fetches the raw forecast JSON for a city'''
+        try:
+            response = await self._client.get(self.base_url, params={'key': self.api_key, 'q': city, 'days': days})
+        except httpx.TransportError as e:
+            raise UpstreamUnavailable(f'weatherapi.com unreachable while fetching {city}: {e!r}') from e
+
+        return handle_response(response, city)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
@@ -1,5 +1,6 @@
+import hashlib
 from typing import List
-from pydantic import BaseModel, Field, field_validator, computed_field, ConfigDict
+from pydantic import BaseModel, Field, field_validator, computed_field, ConfigDict, AliasPath
 
 
 class Condition(BaseModel):
@@ -28,6 +29,7 @@ class WeatherCurrent(BaseModel):
     humidity: int
     is_day: int
     last_updated: str
+    last_updated_epoch: int = Field(0, exclude=True)    # only used to know when the cached forecast expires
     precip_mm: float
     temp_c: float
 
@@ -163,13 +165,37 @@ class ForecastDay(BaseModel):
 
 class WeatherReport(BaseModel):
     """Main weather report containing current weather, location, and forecasts."""
+    model_config = ConfigDict(populate_by_name=True)
+
     current: WeatherCurrent
     location: Location
-    forecast: List[ForecastDay]
+    forecast: List[ForecastDay] = Field(validation_alias=AliasPath('forecast', 'forecastday'))   # weatherapi nests the days one level deeper
+
+    @classmethod
+    def from_json(cls, raw: bytes):
+        """Validates weatherapi's JSON body directly, without decoding it into dictionaries first."""
+        return cls.model_validate_json(raw)
 
     def to_dict(self) -> dict:
         return {
             "current": self.current.to_dict(),
             "location": self.location.to_dict(),
             "forecast": [f.to_dict() for f in self.forecast]
-        }
\ No newline at end of file
+        }
+
+
+class ForecastRecord:
+    """Compact form a forecast is cached in: weatherapi's undecoded JSON body (what gets stored and hashed), parsed again on demand."""
+    __slots__ = ('raw', 'last_updated_epoch', 'tz_id', 'version')
+
+    def __init__(self, raw: bytes, last_updated_epoch: int = 0, tz_id: str = '') -> None:
+        self.raw = raw
+        self.last_updated_epoch = last_updated_epoch
+        self.tz_id = tz_id                                                  # the location's timezone, to know its current hour without parsing
+        self.version = hashlib.blake2b(raw, digest_size=8).hexdigest()     # changes whenever the forecast does, so anything derived from it can be cached by it
+
+    def report(self) -> WeatherReport:
+        return WeatherReport.from_json(self.raw)
+
+    def __repr__(self) -> str:
+        return f"ForecastRecord(bytes={len(self.raw)}, last_updated_epoch={self.last_updated_epoch})"
\ No newline at end of file
@@ -4,20 +4,71 @@
 
 ###### IMPORTS #################################################
 from typing import Dict, List, Tuple
-import requests
+import time
+import json
+import asyncio
+import hashlib
+from io import BytesIO
 from datetime import datetime
-from wttr import pill   # My script to create pretty weather cards c:
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from wttr import timing
 from dotenv import load_dotenv
 import os
 from weather_classes import *
+from cache import TTLCache, LRUBytesCache
+from upstream import UpstreamClient, AsyncUpstreamClient, UpstreamUnavailable, UpstreamRateLimited, CircuitBreaker, CircuitOpen
+from quota import UpstreamQuota, QuotaExceeded, INTERACTIVE, BACKGROUND
+from store import DiskStore
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from pydantic import ValidationError
+from render_engine import RenderEngine
+from metrics import UPSTREAM_ERRORS
+from gazetteer import Gazetteer, UnknownCity
+import projection
+import gzip
+
+try:
+    import brotli                                                           # optional, /api responses are only gzipped without it
+except ImportError:
+    brotli = None
 
 ###### CONSTANTS #################################################
 load_dotenv()
 
 API_KEY = os.getenv("WEATHERAPI_KEY")
-WEATHERAPI  = 'http://api.weatherapi.com/v1/forecast.json?key={}&q={}&days=3'
+WEATHERAPI  = os.getenv("WEATHERAPI", 'http://api.weatherapi.com/v1/forecast.json')    # forecast endpoint, can be pointed at fake_weatherapi.py
 HOURS = [9, 12, 15, 18, 21, 23]
 
+FORECAST_TTL        = float(os.getenv("FORECAST_TTL", 900))                 # longest time (seconds) a fetched forecast is reused for
+FORECAST_MIN_TTL    = float(os.getenv("FORECAST_MIN_TTL", 60))              # shortest time (seconds) a fetched forecast is reused for
+UPSTREAM_INTERVAL   = 900                                                   # weatherapi.com refreshes current conditions every 15 minutes
+CARD_CACHE_BYTES    = int(os.getenv("CARD_CACHE_BYTES", 64 * 1024 * 1024))  # memory budget for encoded weather cards
+
+UPSTREAM_CONNECT_TIMEOUT    = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3))   # seconds to wait for a connection to weatherapi.com
+UPSTREAM_READ_TIMEOUT       = float(os.getenv("UPSTREAM_READ_TIMEOUT", 10))     # seconds to wait for its response
+UPSTREAM_MAX_CONNECTIONS    = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 20))    # size of the keep-alive connection pool
+UPSTREAM_BREAKER_THRESHOLD  = int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", 5))   # failures in a row before weatherapi.com stops being called
+UPSTREAM_BREAKER_RESET      = float(os.getenv("UPSTREAM_BREAKER_RESET", 30))    # seconds between probes while it's failing
+
+NOT_FOUND_TTL       = float(os.getenv("NOT_FOUND_TTL", 600))                # seconds a city weatherapi didn't know is answered "not found" without asking again
+STALE_TTL           = float(os.getenv("STALE_TTL", 6 * 3600))               # how long an expired forecast is still served (flagged stale) while refreshing
+REFRESH_WORKERS     = int(os.getenv("REFRESH_WORKERS", 4))                  # threads refreshing stale forecasts in the background
+
+RENDER_WORKERS      = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))   # processes drawing cards (0 draws them on the request thread)
+RENDER_QUEUE_DEPTH  = int(os.getenv("RENDER_QUEUE_DEPTH", 4 * max(RENDER_WORKERS, 1)))  # renders allowed in flight before answering 503
+RENDER_START_METHOD = os.getenv("RENDER_START_METHOD", "spawn")             # how the render processes are started
+
+BATCH_CONCURRENCY   = int(os.getenv("BATCH_CONCURRENCY", 10))               # how many upstream fetches a batch request keeps in flight
+BATCH_MAX_CITIES    = int(os.getenv("BATCH_MAX_CITIES", 200))               # largest batch accepted in one request
+
+API_CACHE_BYTES     = int(os.getenv("API_CACHE_BYTES", 16 * 1024 * 1024))   # memory budget for encoded /api responses
+API_COMPRESS_MIN_SIZE = 1024                                                # smaller /api responses are sent uncompressed
+API_GZIP_LEVEL      = 6                                                     # each version is only compressed once, but on a request thread
+API_BROTLI_QUALITY  = 5
+
+STORED_CARD_TTL     = float(os.getenv("STORED_CARD_TTL", 3600))             # seconds a rendered card is kept on disk (its key changes with its contents)
+
 ###### HELPERS #################################################
 def get_code_from_json(forecast) -> str:
     '''Gets the URL to the icon from weatherapi.com and extracts only the 3 digit icon code'''
@@ -40,6 +91,22 @@ def get_local_time(local_time:str) -> datetime:
     
     return local_datetime
 
+def get_current_local_time(location:Location) -> str:
+    '''Current wall-clock time at the location (H:MM like weatherapi), so cached forecasts still show the live time'''
+    try:
+        now = datetime.now(ZoneInfo(location.tz_id))
+    except (ZoneInfoNotFoundError, ValueError):                                                             # unknown timezone, fall back on the time the forecast was fetched
+        return location.time
+
+    return f'{now.hour}:{now.minute:02d}'
+
+def get_current_local_hour(tz_id:str) -> str:
+    '''Current hour at the location as "YYYY-MM-DD HH" (how weatherapi's hourly times start), or None for an unknown timezone'''
+    try:
+        return datetime.now(ZoneInfo(tz_id)).strftime('%Y-%m-%d %H')
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
 def get_daily_progress(local_datetime:datetime) -> int:
     '''Translates minutes elapsed into corresponding X-Position in the daily timeline'''
     minutes_elapsed = local_datetime.minute + (local_datetime.hour * 60)                                    # gets the total amount of minutes elapsed this day thus far
@@ -67,33 +134,379 @@ def get_formatted_date(date_str:str) -> str:
 ###
 
 ###### WEATHER API #################################################
-def fetch_api_data(city:str) -> Dict:
-    response = requests.get(WEATHERAPI.format(API_KEY, city))
+GAZETTEER = Gazetteer.load()                                               # every city weatherapi could be asked about, offline
 
-    if not response.ok:
-        raise ValueError(f'400 - City {city} was not found')
-    
-    return response.json()
+def normalize_city(city:str) -> str:
+    '''Resolves the city through the gazetteer so "London ", "LONDON" and "Londres" share one cache entry (raises UnknownCity instead of calling weatherapi)'''
+    return GAZETTEER.canonical(city)
+
+def city_name(city:str, wr:WeatherReport) -> str:
+    '''The name printed on the cards: the gazetteer's spelling, or weatherapi's for coordinates and cities passed through'''
+    known = GAZETTEER.find(city)
+    return (known.name if known else wr.location.name).upper()
+
+def forecast_ttl(record:ForecastRecord) -> float:
+    '''Seconds until weatherapi publishes newer conditions than the ones in record, clamped to the configured TTLs'''
+    if not record.last_updated_epoch:
+        return FORECAST_TTL
+
+    remaining = record.last_updated_epoch + UPSTREAM_INTERVAL - FORECAST_CACHE.clock()    # the cache's clock, so tests can move time for both
+    return max(FORECAST_MIN_TTL, min(FORECAST_TTL, remaining))
+
+FORECAST_CACHE = TTLCache(forecast_ttl, keep_stale=STALE_TTL)              # normalized city -> ForecastRecord (raw weatherapi JSON), kept as last-known-good once expired
+STORE = DiskStore()                                                         # on-disk second level shared by every worker and kept across restarts
+REFRESH_POOL = ThreadPoolExecutor(REFRESH_WORKERS, thread_name_prefix='forecast-refresh')
+
+# How stale the forecasts used while answering the current request were, so the response can say so
+_STALENESS = ContextVar('staleness', default=0.0)
+
+def reset_staleness() -> None:
+    _STALENESS.set(0.0)
+
+def staleness() -> float:
+    '''Seconds past its expiry of the stalest forecast used in the current context (0 if they were all fresh)'''
+    return _STALENESS.get()
+
+def mark_stale(seconds:float) -> None:
+    _STALENESS.set(max(_STALENESS.get(), seconds, 1e-3))
+
+def upstream_options() -> Dict:
+    '''Keyword arguments shared by the blocking and the async weatherapi.com clients'''
+    return {
+        "base_url":         WEATHERAPI,
+        "api_key":          API_KEY,
+        "connect_timeout":  UPSTREAM_CONNECT_TIMEOUT,
+        "read_timeout":     UPSTREAM_READ_TIMEOUT,
+        "max_connections":  UPSTREAM_MAX_CONNECTIONS,
+    }
+
+UPSTREAM = UpstreamClient(**upstream_options())                             # pooled keep-alive connections shared by every request thread
+BREAKER = CircuitBreaker(UPSTREAM_BREAKER_THRESHOLD, UPSTREAM_BREAKER_RESET)  # shared by the blocking and the async clients
+QUOTA = UpstreamQuota()                                                     # the key's allowance, shared with the other worker processes
+
+NOT_FOUND_CACHE = TTLCache(lambda message: NOT_FOUND_TTL, max_entries=4096)   # normalized city -> weatherapi's "not found", so typos don't spend the quota
+
+def raise_if_not_found(city:str) -> None:
+    '''Raises UnknownCity for a city weatherapi.com recently said it doesn't know, instead of asking it again'''
+    message = NOT_FOUND_CACHE.get(city)
+    if message is not None:
+        raise UnknownCity(message)
+
+def count_upstream_error(e:Exception) -> None:
+    '''Counts a failed weatherapi.com call by what went wrong'''
+    if isinstance(e, CircuitOpen):
+        UPSTREAM_ERRORS.inc('circuit_open')
+    elif isinstance(e, QuotaExceeded):
+        UPSTREAM_ERRORS.inc('quota')
+    elif isinstance(e, UpstreamRateLimited):
+        UPSTREAM_ERRORS.inc('rate_limited')
+    elif isinstance(e, UpstreamUnavailable):
+        UPSTREAM_ERRORS.inc('unavailable')
+    elif isinstance(e, ValidationError):
+        UPSTREAM_ERRORS.inc('invalid')
+    else:
+        UPSTREAM_ERRORS.inc('not_found')
+
+def fetch_upstream(city:str, priority:str=INTERACTIVE) -> bytes:
+    '''
+    Always calls weatherapi.com (unless the circuit breaker is open or the quota is used up), bypassing the cache,
+    and returns the undecoded JSON body.
+
+    priority: INTERACTIVE when a visitor is waiting on it, BACKGROUND otherwise (see quota.py)
+    '''
+    raise_if_not_found(city)
+    try:
+        QUOTA.acquire(priority)
+        try:
+            with timing.stage('upstream'):
+                return BREAKER.call(lambda: UPSTREAM.forecast(city))
+
+        except CircuitOpen:                                                 # never actually called
+            QUOTA.refund()
+            raise
+        except UpstreamRateLimited:                                         # weatherapi's count disagrees with ours, stop until the bucket refills
+            QUOTA.exhaust()
+            raise
+
+    except (ValueError, UpstreamUnavailable) as e:
+        if isinstance(e, ValueError):                                       # weatherapi doesn't know the city
+            NOT_FOUND_CACHE.put(city, str(e))
+        count_upstream_error(e)
+        raise
+
+def make_record(raw:bytes) -> ForecastRecord:
+    '''Validates a freshly fetched forecast once and keeps it in its compact cached form'''
+    try:
+        with timing.stage('parse'):
+            report = parse_weather_report(raw)
+
+    except ValidationError as e:
+        count_upstream_error(e)
+        raise
+
+    return ForecastRecord(raw, report.current.last_updated_epoch, report.location.tz_id)
+
+def save_forecast(key:str, record:ForecastRecord) -> None:
+    '''Writes a freshly fetched forecast to the store, for the other workers (and the next restart)'''
+    expires_at = FORECAST_CACHE.clock() + forecast_ttl(record)
+    STORE.put('forecast', key, record.raw, expires_at, expires_at + STALE_TTL)
+
+def load_forecast(key:str, priority:str=INTERACTIVE) -> ForecastRecord:
+    '''The forecast another worker (or an earlier run) stored while it's still fresh, else a new one from weatherapi.com'''
+    raw = STORE.get('forecast', key)
+    if raw is not None:
+        return make_record(raw)
+
+    record = make_record(fetch_upstream(key, priority))
+    save_forecast(key, record)
+    return record
+
+def restore_forecast(key:str) -> None:
+    '''Copies a stored forecast this worker doesn't have yet (even an expired one) into the in-memory cache, so it can be served stale'''
+    if FORECAST_CACHE.expires_at(key) is None:
+        stored = STORE.get_stale('forecast', key)
+        if stored is not None:
+            raw, expires_at = stored
+            FORECAST_CACHE.put(key, make_record(raw), expires_at)
+
+def fetch_api_data(city:str) -> ForecastRecord:
+    '''
+    Returns the forecast for a city, only calling weatherapi.com once per city (across every worker) until it expires.
+    An expired forecast is still returned straight away (and flagged, see staleness) while it's refreshed in the background.
+    '''
+    key = normalize_city(city)
+    restore_forecast(key)
+    record, stale = FORECAST_CACHE.get_or_revalidate(key, lambda: load_forecast(key), REFRESH_POOL.submit,
+                                                     refresh=lambda: load_forecast(key, BACKGROUND))   # serving stale, nobody waits on the refresh
+
+    if stale:
+        mark_stale(stale)
+    return record
+
+def refresh_forecast(city:str) -> ForecastRecord:
+    '''Fetches a city's forecast from weatherapi.com even if a cached one is still valid, and caches it'''
+    key = normalize_city(city)
+    record = make_record(fetch_upstream(key, BACKGROUND))
+    FORECAST_CACHE.put(key, record)
+    save_forecast(key, record)
+    return record
+
+async def fetch_api_data_many(cities:List[str], concurrency:int=BATCH_CONCURRENCY) -> Dict[str, ForecastRecord]:
+    '''
+    Fetches the forecasts for many cities at once, keeping at most `concurrency` upstream calls in flight.
+    A city another request is already fetching isn't fetched again, the batch waits for that fetch instead (and vice versa).
+    Returns a dictionary of normalized city -> ForecastRecord, or the exception raised while fetching it.
+    '''
+    results = {}
+    missing = []
+
+    keys = []
+    for city in cities:
+        try:
+            keys.append(normalize_city(city))
+        except UnknownCity:                                                 # never sent upstream, the caller reports it
+            continue
+
+    for key in dict.fromkeys(keys):                                         # de-duplicated, in order
+        restore_forecast(key)
+        record = FORECAST_CACHE.get(key)
+        if record is None:
+            record = FORECAST_CACHE.get_stale(key)                          # last-known-good, refreshed in the background like fetch_api_data does
+            if record is not None:
+                FORECAST_CACHE.revalidate(key, lambda key=key: load_forecast(key, BACKGROUND), REFRESH_POOL.submit)
+
+        if record is None:
+            missing.append(key)
+        else:
+            results[key] = record
+
+    if not missing:
+        return results
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async with AsyncUpstreamClient(**upstream_options()) as client:
+        async def download(key:str) -> bytes:
+            '''One upstream call, like fetch_upstream but awaiting weatherapi (the quota's file lock is taken on a thread)'''
+            raise_if_not_found(key)
+            try:
+                await asyncio.to_thread(QUOTA.acquire, BACKGROUND)         # batches leave the reserve to interactive requests
+                if not BREAKER.allow():
+                    await asyncio.to_thread(QUOTA.refund)
+                    raise CircuitOpen(f'weatherapi.com is failing, next try in {BREAKER.retry_after():.0f}s')
+
+                try:
+                    raw = await client.forecast(key)
+                except UpstreamUnavailable as e:
+                    BREAKER.record_failure()
+                    if isinstance(e, UpstreamRateLimited):
+                        await asyncio.to_thread(QUOTA.exhaust)
+                    raise
+                except ValueError as e:                                     # weatherapi answered, it just doesn't know the city
+                    BREAKER.record_success()
+                    NOT_FOUND_CACHE.put(key, str(e))
+                    raise
+                BREAKER.record_success()
+                return raw
+
+            except (ValueError, UpstreamUnavailable) as e:
+                count_upstream_error(e)
+                raise
+
+        async def fetch(key:str):
+            flight, leader = FORECAST_CACHE.join(key)
+            try:
+                if not leader:                                              # a request (or another batch) is already fetching it
+                    results[key] = await asyncio.to_thread(flight.result)
+                    return
+
+                try:
+                    async with semaphore:
+                        record = make_record(await download(key))
+                except BaseException as e:
+                    FORECAST_CACHE.finish(key, flight, error=e)
+                    raise
+
+                FORECAST_CACHE.finish(key, flight, record)
+                await asyncio.to_thread(save_forecast, key, record)
+                results[key] = record
+
+            except (ValueError, UpstreamUnavailable) as e:                  # pydantic's ValidationError is a ValueError too, already counted
+                results[key] = e
+
+        await asyncio.gather(*(fetch(key) for key in missing))
+
+    return results
+
+def parse_weather_report(raw:bytes) -> WeatherReport:
+    """Turn weatherapi's forecast JSON into a Pydantic WeatherReport model, validating straight from the bytes"""
+    return WeatherReport.from_json(raw)
 
 def get_weather_report_data(city: str) -> WeatherReport:
     """Fetch weather data and return a Pydantic WeatherReport model"""
-    data = fetch_api_data(city)
-    current_weather = WeatherCurrent.from_dict(data['current'])
-    loc = Location.from_dict(data['location'])
-    
-    forecasts = [ForecastDay.from_dict(fd) for fd in data['forecast']['forecastday']]
+    record = fetch_api_data(city)
+    with timing.stage('parse'):
+        return record.report()
+
+def get_weather_reports(cities:List[str]) -> Tuple[Dict[str, WeatherReport], Dict[str, str]]:
+    '''
+    Fetches and parses the weather for many cities concurrently.
+    Returns the reports and the errors separately, both keyed by the city as it was given,
+    so one bad city doesn't fail the whole batch.
+    '''
+    results = asyncio.run(fetch_api_data_many(cities))
+    reports, errors = {}, {}
+
+    for city in cities:
+        try:
+            record = results[normalize_city(city)]
+        except UnknownCity as e:
+            record = e
+
+        if isinstance(record, ValidationError):
+            errors[city] = "unexpected weather data"
+        elif isinstance(record, ValueError):
+            errors[city] = "city not found"
+        elif isinstance(record, UpstreamUnavailable):
+            errors[city] = "weather service unavailable"
+        else:
+            reports[city] = record.report()
+
+    return reports, errors
+
+
+###### API RESPONSES #################################################
+API_CACHE = LRUBytesCache(API_CACHE_BYTES)                                 # api_key (+ encoding) -> JSON body
+
+def api_key(record:ForecastRecord, fields:str, hours:int, hour:str=None) -> str:
+    '''
+    Hash of the forecast version and the projection, used both as the cache key and as the ETag.
+
+    hour: The location's current hour ?hours= counts from, so the window moves on even while the forecast doesn't
+    '''
+    blob = json.dumps([record.version, fields or '', hours, hour], separators=(',', ':'))
+    return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+def compress_api(body:bytes, encoding:str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=API_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=API_GZIP_LEVEL, mtime=0)
+
+def get_api_payload(city:str, fields:str=None, hours:int=None, encodings:List[str]=()) -> Tuple[bytes, str, str]:
+    '''
+    The /api JSON for a city, serialized once per forecast version and projection, and compressed once per encoding.
+    Returns the body, its Content-Encoding (None when uncompressed) and its ETag.
+
+    fields: Comma separated dotted paths to keep (see projection.py), everything if empty
+    hours: Only keep this many hourly forecasts from the current hour on, all of them if None
+    encodings: Content codings the client accepts, best first ('br', 'gzip')
+    '''
+    include = projection.parse_fields(fields)                               # before fetching, a typo shouldn't cost an upstream call
+    record = fetch_api_data(city)
+    hour = get_current_local_hour(record.tz_id) if hours is not None else None
+    key = api_key(record, fields, hours, hour)
+
+    body = API_CACHE.get(key)
+    if body is None:
+        with timing.stage('parse'):
+            report = record.report()
+        with timing.stage('serialize'):
+            body = projection.project(report, include, hours, hour)
+        API_CACHE.put(key, body)
+
+    if len(body) < API_COMPRESS_MIN_SIZE:
+        return body, None, key
+
+    for encoding in encodings:
+        if encoding == 'br' and brotli is None:
+            continue
+
+        compressed = API_CACHE.get(f'{key}-{encoding}')
+        if compressed is None:
+            with timing.stage('compress'):
+                compressed = compress_api(body, encoding)
+            API_CACHE.put(f'{key}-{encoding}', compressed)
+
+        return compressed, encoding, f'{key}-{encoding}'
+
+    return body, None, key
 
-    return WeatherReport(current=current_weather, location=loc, forecast=forecasts)
+
+###### RENDERED CARDS #################################################
+CARD_CACHE = LRUBytesCache(CARD_CACHE_BYTES)                               # card_key -> encoded card bytes
+RENDER_ENGINE = RenderEngine(RENDER_WORKERS, RENDER_QUEUE_DEPTH, RENDER_START_METHOD)
+
+def card_key(kind:str, inputs:Dict, image_format:str='png') -> str:
+    '''Content hash of everything drawn on a card and how it's encoded, used both as the cache key and as the ETag'''
+    blob = json.dumps([kind, inputs, image_format], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+def render_card(kind:str, inputs:Dict, image_format:str='png', key:str=None) -> bytes:
+    '''Renders a card, reusing the encoded bytes if the exact same inputs were rendered before (by any worker)'''
+    key = key or card_key(kind, inputs, image_format)
+    weather_card = CARD_CACHE.get(key)
+    if weather_card is not None:
+        return weather_card
+
+    weather_card = STORE.get('card', key)
+    if weather_card is None:
+        weather_card = RENDER_ENGINE.render(kind, inputs, image_format)
+        STORE.put_later('card', key, weather_card, time.time() + STORED_CARD_TTL)   # written in the background, the visitor is waiting
+
+    CARD_CACHE.put(key, weather_card)
+    return weather_card
 
 
 ###### WEATHER FUNCTIONS #################################################
 
 ### 2.0 version with hourly forecasts
-def weather_report(city:str):
+def weather_report_inputs(city:str) -> Dict:
+    '''Everything create_weather_card_hourly draws on the current conditions card'''
     wr = get_weather_report_data(city)
-    local_datetime = get_local_time(wr.location.time)
+    local_time = get_current_local_time(wr.location)
+    local_datetime = get_local_time(local_time)
     
     # Checking if it's nighttime
+    current_code = str(wr.current.condition.code)
     if not wr.current.is_day:
         current_code = '999'
     
@@ -104,28 +517,72 @@ def weather_report(city:str):
     hourly_codes[-1] = '999'
     progress = get_daily_progress(local_datetime)
 
+    return {
+        "city":             city_name(city, wr),
+        "current_temp":     wr.current.temp,
+        "current_code":     current_code,
+        "time":             local_time,
+        "forecast":         hourly_temps,
+        "forecast_codes":   hourly_codes,
+        "progress":         progress,
+    }
+
+def weather_report(city:str):
     # FINALLY creates the image and saves it to memory!
-    weather_card = pill.create_weather_card_hourly(city.upper(), wr.current.temp, current_code, wr.location.time, hourly_temps, hourly_codes, progress)
-    return weather_card
+    weather_card = render_card("hourly", weather_report_inputs(city))
+    return BytesIO(weather_card)
 
 
 ###############################
-def tomorrow(city:str, transparent:bool):
-    wr = get_weather_report_data(city)
-    tomorrow_forecast = wr.forecast[1]
-
-    avg_temp = round(tomorrow_forecast.day.avgtemp_c)
+def day_inputs(day:ForecastDay) -> Dict:
+    '''Everything about one ForecastDay that create_tomorrow_forecast draws (all but the city and the colour scheme)'''
+    avg_temp = round(day.day.avgtemp_c)
     avg_temp = f'{avg_temp}º'
-    condition_code = tomorrow_forecast.day.condition.code
+    condition_code = day.day.condition.code
     
-    date = tomorrow_forecast.date
+    date = day.date
     date_formatted = get_formatted_date(date)
 
-    hourly_temps = [(tomorrow_forecast.hour[x]).temp for x in HOURS]
-    hourly_codes = [tomorrow_forecast.hour[x].condition.code for x in HOURS]
+    hourly_temps = [(day.hour[x]).temp for x in HOURS]
+    hourly_codes = [day.hour[x].condition.code for x in HOURS]
 
-    weather_card = pill.create_tomorrow_forecast(city.upper(), avg_temp, condition_code, date_formatted, hourly_temps, hourly_codes, transparent)
-    return weather_card
+    return {
+        "avg_temp":         avg_temp,
+        "condition_code":   condition_code,
+        "date":             date_formatted,
+        "forecast":         hourly_temps,
+        "forecast_codes":   hourly_codes,
+    }
+
+def tomorrow_inputs(city:str, transparent:bool) -> Dict:
+    '''Everything create_tomorrow_forecast draws on tomorrow's forecast card'''
+    wr = get_weather_report_data(city)
+
+    return {
+        "city":             city_name(city, wr),
+        **day_inputs(wr.forecast[1]),
+        "transparent":      transparent,
+    }
+
+def tomorrow(city:str, transparent:bool):
+    weather_card = render_card("tomorrow", tomorrow_inputs(city, transparent))
+    return BytesIO(weather_card)
+
+
+###############################
+def week_inputs(city:str, transparent:bool) -> Dict:
+    '''Everything create_week_forecast draws: every day weatherapi returned, from the one fetch and parse'''
+    wr = get_weather_report_data(city)
+
+    return {
+        "city":             city_name(city, wr),
+        "days":             [day_inputs(day) for day in wr.forecast],
+        "transparent":      transparent,
+    }
+
+def week(city:str, transparent:bool):
+    weather_card = render_card("week", week_inputs(city, transparent))
+    return BytesIO(weather_card)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,137 @@
+### ASSET PACK
+### The templates, marker and icons, already decoded to raw pixels and stored together in one file that is memory-mapped
+### instead of read. Images are created straight on top of the mapping (no copy), so every worker process shares the
+### same pages through the OS page cache and starts without decoding a single PNG.
+###
+### Build it from the backend folder after changing any asset (after the icons, see iconbuild.py): python -m wttr.assetpack
+### Without a pack (or for assets that changed since it was built) the PNGs are decoded like before.
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from PIL import Image
+
+
+### CONSTANTS
+PACK_PATH   = os.getenv('ASSET_PACK', './wttr/assets.pack')                # where the pack is written to and mapped from
+MAGIC       = b'WTTRPACK1\n'
+ALIGN       = 64                                                            # every image starts on a cache line
+STORAGE     = {'RGB': 'RGBX'}                                               # Pillow keeps RGB as 4 bytes a pixel, but can only map it as RGBX
+
+
+### HELPERS
+def file_hash(path:str) -> str:
+    '''Content hash of a source PNG, to tell if the packed copy is still current'''
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+def storage_mode(mode:str) -> str:
+    '''The mode an image of this mode is stored (and mapped) as'''
+    return STORAGE.get(mode, mode)
+
+def align(offset:int) -> int:
+    return offset + -offset % ALIGN
+
+def decode(source:str, mode:str) -> Image:
+    with Image.open(source) as image:
+        return image.convert(mode)
+
+
+### PACK
+class AssetPack:
+    def __init__(self, path:str=PACK_PATH) -> None:
+        '''
+        Maps the pack at path, if there is one.
+
+        path: Location of the pack built by build()
+        '''
+        self.path       = path
+        self.requested  = {}                                                # source -> mode of every image asked for, which is what build() packs
+        self._index     = {}                                                # source -> {mode, size, offset, length, hash}
+        self._map       = None
+        self._data_start = 0
+
+        try:
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            if self._map[:len(MAGIC)] != MAGIC:
+                raise ValueError('not an asset pack')
+
+            start = len(MAGIC) + 8
+            (index_length,) = struct.unpack('<Q', self._map[len(MAGIC):start])
+            self._index = json.loads(self._map[start:start + index_length])
+            self._data_start = align(start + index_length)
+
+        except (OSError, ValueError):                                       # no pack (or a broken one), every image gets decoded from its PNG
+            self._map, self._index = None, {}
+
+    def image(self, source:str, mode:str='RGBA') -> Image:
+        '''
+        The decoded image at source: mapped read-only from the pack when it's in there and up to date, otherwise decoded from the file.
+        RGB images come back as RGBX when mapped, so copy them with .convert('RGB') rather than .copy().
+
+        source: Path of the original image file
+        mode: Mode the image is used in
+        '''
+        self.requested[source] = mode
+        entry = self._index.get(source)
+
+        if entry is None or entry['mode'] != storage_mode(mode) or entry['hash'] != file_hash(source):
+            return decode(source, mode)
+
+        offset = self._data_start + entry['offset']
+        view = memoryview(self._map)[offset:offset + entry['length']]
+        return Image.frombuffer(entry['mode'], tuple(entry['size']), view, 'raw', entry['mode'], 0, 1)
+
+    def stats(self) -> dict:
+        return {'path': self.path, 'mapped': self._map is not None, 'entries': len(self._index)}
+
+
+### BUILD STEP
+def build(requested:dict, path:str=PACK_PATH) -> dict:
+    '''
+    Decodes every requested image and writes them with their index to path (atomically, so running processes keep their mapping).
+
+    requested: Dictionary of source path -> mode (see AssetPack.requested)
+    '''
+    index, blobs, offset = {}, [], 0
+    for source, mode in sorted(requested.items()):
+        image = decode(source, storage_mode(mode))
+        data = image.tobytes('raw', image.mode)
+
+        padding = align(offset) - offset
+        offset += padding
+        index[source] = {'mode': image.mode, 'size': image.size, 'offset': offset, 'length': len(data), 'hash': file_hash(source)}
+        blobs.append((padding, data))
+        offset += len(data)
+
+    index_json = json.dumps(index).encode()
+    data_start = align(len(MAGIC) + 8 + len(index_json))                  # offsets in the index are relative to here
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(index_json)))
+        f.write(index_json)
+        f.write(b'\0' * (data_start - f.tell()))
+        for padding, data in blobs:
+            f.write(b'\0' * padding)
+            f.write(data)
+
+    os.replace(tmp_path, path)
+    return index
+
+
+if __name__ == '__main__':
+    from wttr import pill                                                   # loading the cards records every image they use
+    from wttr.assetpack import ASSETS as loaded                             # (the instance pill used, not this __main__ module's)
+
+    index = build(loaded.requested)
+    size = os.path.getsize(PACK_PATH)
+    print(f'Packed {len(index)} images into {PACK_PATH} ({size / 1024 / 1024:.1f} MiB)')
+
+else:
+    ASSETS = AssetPack()
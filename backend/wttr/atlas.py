@@ -0,0 +1,68 @@
+### ICON ATLAS
+### Every weather icon decoded once at startup, plus the recoloured variants the cards use (loaded already tinted
+### when they've been built, see iconbuild.py), so drawing a card never touches the disk or NumPy
+
+from PIL import Image
+
+from . import recolour                          # My script to recolour imagines using PIL and NumPy to a new solid colour
+
+
+class IconAtlas:
+    def __init__(self, manifest, icon_colours:dict, load=None) -> None:
+        '''
+        Decodes every icon and pre-tinted icon in the manifest as RGBA.
+
+        manifest: iconbuild.Manifest listing the icon files
+        icon_colours: Dictionary of icon size -> the shade of white used by the mono icons of that size
+        load: Function(path, mode) returning a decoded image, e.g. from the asset pack (decodes the file by default)
+        '''
+        load = load or (lambda path, mode: Image.open(path).convert(mode))
+
+        self.icon_colours   = icon_colours
+        self._icons         = {}                                            # (size, name) -> RGBA image
+        self._tinted        = {}                                            # (size, name, colour) -> recoloured RGBA image
+        self._masks         = {}                                            # (size, name) -> recolour.RecolourMask, made on first tint
+
+        for size, name, path in manifest.icons():                           # not every condition has been drawn at every size (yet)
+            self._icons[(size, name)] = load(path, 'RGBA')
+
+        for size, name, colour, path, icon_colour in manifest.tinted():
+            if tuple(icon_colour) == tuple(icon_colours.get(size, ())):     # tinted from a different white than the one used now, it's redone
+                self._tinted[(size, name, colour)] = load(path, 'RGBA')
+
+    def prerender(self, size:int, colours:list) -> None:
+        '''Recolours every icon of the given size into each colour ahead of time (the ones that weren't loaded tinted), all in one batch'''
+        colours = [tuple(c) for c in dict.fromkeys(tuple(c) for c in colours)]        # without duplicates, keeping the order
+        names = [name for (icon_size, name) in self._icons
+                 if icon_size == size and any((size, name, colour) not in self._tinted for colour in colours)]
+
+        tinted = recolour.recolour_batch([self.mask(name, size) for name in names], colours)
+        for name, icons in zip(names, tinted):
+            for colour, icon in zip(colours, icons):
+                self._tinted.setdefault((size, name, colour), icon)
+
+    def get(self, name:str, size:int) -> Image:
+        '''The decoded icon, shared between requests so it must be treated as read-only'''
+        return self._icons[(size, name)]
+
+    def mask(self, name:str, size:int) -> recolour.RecolourMask:
+        '''How much of each pixel of the icon is its mono white, worked out once per icon'''
+        key = (size, name)
+        mask = self._masks.get(key)
+
+        if mask is None:
+            mask = recolour.RecolourMask(self.get(name, size), self.icon_colours[size])
+            self._masks[key] = mask
+
+        return mask
+
+    def tinted(self, name:str, size:int, colour:tuple) -> Image:
+        '''The icon with its mono white swapped for colour (recoloured on first use if it wasn't prerendered)'''
+        key = (size, name, tuple(colour))
+        icon = self._tinted.get(key)
+
+        if icon is None:
+            icon = self.mask(name, size).tint(colour)
+            self._tinted[key] = icon
+
+        return icon
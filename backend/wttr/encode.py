@@ -0,0 +1,54 @@
+### IMAGE ENCODING
+### The different ways a finished card can be saved to memory, from the plain PNG to smaller/faster ones
+
+import os
+from io import BytesIO                          # Used to store the output images in memory instead of saving them to disk
+from PIL import Image
+
+### CONSTANTS
+PNG_COMPRESS_LEVEL  = int(os.getenv('PNG_COMPRESS_LEVEL', 6))               # zlib level 0-9, lower is faster but bigger (6 is Pillow's default)
+PNG8_COLOURS        = int(os.getenv('PNG8_COLOURS', 64))                    # palette size for quantized PNGs, the cards only use a handful of colours
+WEBP_QUALITY        = int(os.getenv('WEBP_QUALITY', 90))                    # quality of lossy WebPs
+WEBP_METHOD         = int(os.getenv('WEBP_METHOD', 4))                      # WebP effort 0-6, lower is faster but bigger
+
+
+### HELPERS
+def quantize(canvas:Image) -> Image:
+    '''Reduces the card to a small palette (keeping transparency), which PNG compresses a lot better'''
+    return canvas.quantize(PNG8_COLOURS, method=Image.Quantize.FASTOCTREE)
+
+
+### Every supported format -> (mimetype, function that saves a canvas into a BytesIO)
+FORMATS = {
+    'png':          ('image/png',   lambda canvas, f: canvas.save(f, format='PNG', compress_level=PNG_COMPRESS_LEVEL)),
+    'png8':         ('image/png',   lambda canvas, f: quantize(canvas).save(f, format='PNG', compress_level=PNG_COMPRESS_LEVEL)),
+    'webp':         ('image/webp',  lambda canvas, f: canvas.save(f, format='WEBP', lossless=True, method=WEBP_METHOD)),
+    'webp-lossy':   ('image/webp',  lambda canvas, f: canvas.save(f, format='WEBP', quality=WEBP_QUALITY, method=WEBP_METHOD)),
+}
+
+
+### Formats written out directly instead of encoded from a canvas (see vector.py) -> mimetype
+VECTOR_FORMATS = {
+    'svg':          'image/svg+xml',
+}
+
+
+def encode_card(canvas:Image, image_format:str='png') -> BytesIO:
+    '''
+    Saves the created image to memory in BytesIO as a "file-like object" -> https://stackoverflow.com/questions/60006794/send-image-from-memory
+
+    canvas: The finished weather card
+    image_format: One of the FORMATS keys
+    '''
+    _, save = FORMATS[image_format]
+
+    weather_card = BytesIO()
+    save(canvas, weather_card)
+
+    return weather_card
+
+def mimetype(image_format:str) -> str:
+    '''The Content-Type to send a card encoded in image_format with'''
+    if image_format in VECTOR_FORMATS:
+        return VECTOR_FORMATS[image_format]
+    return FORMATS[image_format][0]
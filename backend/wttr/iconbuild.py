@@ -0,0 +1,290 @@
+### ICON BUILD
+### One command that turns the icon exports into every file the cards load: each size of each mono icon (the export
+### drawn at that size, or else the next larger export scaled down), the big 800px icons, and the tinted variants
+### pill prerenders at startup, all re-compressed losslessly into icons/build and listed in its manifest.json with
+### their content hash and the hash of the export they were made from. The files are made in a process pool, and
+### only the ones whose export, recipe or BUILD_VERSION changed since the last run are made again.
+###
+### Build from the backend folder after changing any icon, before the asset pack: python -m wttr.iconbuild [--jobs N] [--force]
+### Without a manifest (or for exports that changed since it was built) the exports are loaded like before, and tinted at startup.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+from . import weather_codes                     # Lookup dictionary to convert Weather Code into the appropriate icon
+from . import recolour                          # My script to recolour imagines using PIL and NumPy to a new solid colour
+from .assetpack import file_hash                # Same content hash the asset pack checks its images against
+
+
+### CONSTANTS
+SOURCE_DIR      = './wttr/icons'                                            # the exports, as drawn
+SOURCE_FOLDERS  = {                                                         # icon size -> folder of its exports, inside SOURCE_DIR
+    800: '',
+    256: '256',
+    128: '128',
+    64:  '64',
+}
+EXPORT_SUFFIX   = '-01'                                                     # Illustrator adds it to every exported artboard, the icon's name is what's before it
+BUILD_DIR       = os.getenv('ICON_BUILD', './wttr/icons/build')             # where the built icons and their manifest go
+MANIFEST        = 'manifest.json'
+BUILD_VERSION   = 1                                                         # bump to rebuild everything after changing how the files are made
+
+
+### HELPERS
+def colour_name(colour:tuple) -> str:
+    '''(254, 192, 22) -> "FEC016"'''
+    return '{:02X}{:02X}{:02X}'.format(*colour[:3])
+
+def find_exports(source_dir:str=SOURCE_DIR) -> dict:
+    '''Dictionary of (size, icon name) -> path of every PNG export of a WWO_CODE icon'''
+    names = set(weather_codes.WWO_CODE.values())
+    exports = {}
+    for size, folder in SOURCE_FOLDERS.items():
+        path = os.path.join(source_dir, folder)
+        for file in sorted(os.listdir(path)):
+            name, extension = os.path.splitext(file)
+            name = name.removesuffix(EXPORT_SUFFIX)
+            if extension == '.png' and name in names:
+                exports[(size, name)] = os.path.join(path, file)
+
+    return exports
+
+def pick_source(exports:dict, size:int, name:str) -> tuple:
+    '''
+    The export a size of an icon is made from, as (path, whether it has to be scaled down), or None if there's nothing to make it from.
+    The 800px icons are coloured tiles, not larger mono icons, so they're never scaled down to make the others.
+    '''
+    if (size, name) in exports:
+        return exports[(size, name)], False
+
+    larger = sorted(s for (s, n) in exports if n == name and size < s < 800)
+    if size == 800 or not larger:
+        return None
+    return exports[(larger[0], name)], True
+
+
+### MANIFEST
+class Manifest:
+    def __init__(self, icons:dict, tinted:dict) -> None:
+        '''
+        Where every icon file the cards load is.
+
+        icons: Dictionary of (size, name) -> path
+        tinted: Dictionary of (size, name, colour) -> (path, the mono white it was tinted from)
+        '''
+        self._icons     = icons
+        self._tinted    = tinted
+
+    @classmethod
+    def from_sources(cls, source_dir:str=SOURCE_DIR) -> 'Manifest':
+        '''The exports themselves, as they're used when nothing has been built'''
+        return cls(find_exports(source_dir), {})
+
+    @classmethod
+    def load(cls, build_dir:str=BUILD_DIR, source_dir:str=SOURCE_DIR) -> 'Manifest':
+        '''
+        The built icons listed in build_dir's manifest, leaving out any made from an export that has changed since
+        (the export itself is used instead). Without a manifest, the same as from_sources().
+        '''
+        exports = find_exports(source_dir)
+        try:
+            with open(os.path.join(build_dir, MANIFEST), encoding='utf-8') as f:
+                files = json.load(f)['files']
+        except (OSError, ValueError, KeyError):
+            return cls(exports, {})
+
+        hashes = {}
+        def current(entry:dict) -> bool:
+            source = entry['source']
+            if source not in hashes:
+                hashes[source] = file_hash(source) if os.path.exists(source) else None
+            return hashes[source] == entry['source_hash'] and os.path.exists(os.path.join(build_dir, entry['file']))
+
+        icons, tinted = dict(exports), {}
+        for entry in files.values():
+            if not current(entry):
+                continue
+
+            path = os.path.join(build_dir, entry['file'])
+            if entry['colour'] is None:
+                icons[(entry['size'], entry['name'])] = path
+            else:
+                tinted[(entry['size'], entry['name'], tuple(entry['colour']))] = (path, tuple(entry['icon_colour']))
+
+        return cls(icons, tinted)
+
+    def icons(self) -> list:
+        '''Every icon as (size, name, path)'''
+        return [(size, name, path) for (size, name), path in self._icons.items()]
+
+    def tinted(self) -> list:
+        '''Every pre-tinted icon as (size, name, colour, path, the mono white it was tinted from)'''
+        return [(size, name, colour, path, icon_colour) for (size, name, colour), (path, icon_colour) in self._tinted.items()]
+
+    def path(self, name:str, size:int) -> str:
+        '''Path of an icon, raises KeyError if it hasn't been drawn at that size'''
+        return self._icons[(size, name)]
+
+
+### BUILD STEP
+def exact_palette(image:Image) -> Image:
+    '''The RGBA image as a palette image with the very same pixels (alpha included), or None if it has more than 256 colours'''
+    pixels = np.ascontiguousarray(np.asarray(image)).view(np.uint32).ravel()            # one 32-bit word per RGBA pixel
+    colours, indexes = np.unique(pixels, return_inverse=True)
+    if len(colours) > 256:
+        return None
+
+    rgba = colours.view(np.uint8).reshape(-1, 4)
+    palette = Image.frombuffer('P', image.size, indexes.astype(np.uint8).tobytes(), 'raw', 'P', 0, 1)
+    palette.putpalette(rgba[:, :3].tobytes())
+    palette.info['transparency'] = rgba[:, 3].tobytes()                                # one alpha value per palette entry (a tRNS chunk)
+    return palette
+
+def optimise(image:Image, path:str) -> int:
+    '''
+    Saves image as whichever lossless PNG comes out smallest: truecolour or an exact palette, both with the strongest
+    compression and without any metadata. Returns its size in bytes.
+    '''
+    candidates = []
+    for candidate in (image, exact_palette(image)):
+        if candidate is None:
+            continue
+        encoded = BytesIO()
+        candidate.save(encoded, 'PNG', optimize=True, transparency=candidate.info.get('transparency'))
+        candidates.append(encoded.getvalue())
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(min(candidates, key=len))
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+def make_icon(job:dict) -> list:
+    '''
+    Makes one size of one icon and the tinted variants of it that are out of date (runs in a worker process).
+    Returns the manifest entries of the files written.
+
+    job: Dictionary with the recipe of the icon (see plan) and the outputs to write
+    '''
+    icon = Image.open(job['source']).convert('RGBA')
+    if job['resize']:
+        icon = icon.resize((job['size'], job['size']), Image.Resampling.LANCZOS)
+
+    written = []
+    for output in job['outputs']:
+        path = os.path.join(job['build_dir'], output['file'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if output['colour'] is None:
+            image = icon
+        else:
+            image = recolour.recolour(icon, output['icon_colour'], output['colour'])
+
+        output['bytes'] = optimise(image, path)
+        output['hash'] = file_hash(path)
+        written.append(output)
+
+    return written
+
+def plan(exports:dict, tints:dict, icon_colours:dict, build_dir:str) -> list:
+    '''
+    Every file to build, grouped into one job per (size, name) since the tinted variants start from the same icon.
+
+    tints: Dictionary of icon size -> the (R,G,B) colours the cards tint that size in
+    icon_colours: Dictionary of icon size -> the shade of white used by the mono icons of that size
+    '''
+    jobs = []
+    names = sorted({name for (_, name) in exports})
+    for size in SOURCE_FOLDERS:
+        for name in names:
+            picked = pick_source(exports, size, name)
+            if picked is None:
+                continue
+            source, resize = picked
+
+            recipe = {'version': BUILD_VERSION, 'size': size, 'name': name, 'source': source, 'resize': resize}
+            outputs = [{**recipe, 'file': f'{size}/{name}.png', 'colour': None, 'icon_colour': None}]
+            for colour in dict.fromkeys(tuple(c) for c in tints.get(size, [])):
+                outputs.append({**recipe, 'file': f'{size}/{name}-{colour_name(colour)}.png', 'colour': colour, 'icon_colour': tuple(icon_colours[size])})
+
+            jobs.append({'size': size, 'source': source, 'resize': resize, 'build_dir': build_dir, 'outputs': outputs})
+
+    return jobs
+
+def build(tints:dict, icon_colours:dict, source_dir:str=SOURCE_DIR, build_dir:str=BUILD_DIR, jobs:int=None, force:bool=False) -> dict:
+    '''
+    Builds every icon file that's missing or out of date in a pool of `jobs` processes, removes the ones nothing
+    needs any more, and writes the manifest (atomically, so running processes never read half of it). Returns the counts.
+
+    tints / icon_colours: See plan()
+    force: Rebuild everything, even what's up to date
+    '''
+    manifest_path = os.path.join(build_dir, MANIFEST)
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            previous = json.load(f)['files']
+    except (OSError, ValueError, KeyError):
+        previous = {}
+
+    hashes = {}
+    files, pending = {}, []
+    for job in plan(find_exports(source_dir), tints, icon_colours, build_dir):
+        source_hash = hashes.setdefault(job['source'], file_hash(job['source']))
+
+        stale = []
+        for output in job['outputs']:
+            output['source_hash'] = source_hash
+            output['colour'] = list(output['colour']) if output['colour'] else None                     # as it reads back from JSON
+            output['icon_colour'] = list(output['icon_colour']) if output['icon_colour'] else None
+
+            built = previous.get(output['file'])
+            recipe = {k: v for k, v in (built or {}).items() if k not in ('bytes', 'hash')}
+            if not force and recipe == output and os.path.exists(os.path.join(build_dir, output['file'])):
+                files[output['file']] = built                                                           # up to date, kept as it is
+            else:
+                stale.append(output)
+
+        if stale:
+            pending.append({**job, 'outputs': stale})
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for written in pool.map(make_icon, pending):
+            for output in written:
+                files[output['file']] = output
+
+    removed = 0
+    for file in set(previous) - set(files):                                                             # icons or colours that aren't used any more
+        try:
+            os.remove(os.path.join(build_dir, file))
+            removed += 1
+        except OSError:
+            pass
+
+    os.makedirs(build_dir, exist_ok=True)
+    tmp_path = f'{manifest_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': BUILD_VERSION, 'files': dict(sorted(files.items()))}, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+    return {'files': len(files), 'built': sum(len(job['outputs']) for job in pending), 'removed': removed,
+            'bytes': sum(entry['bytes'] for entry in files.values())}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build every icon size and tinted variant the cards use, and their manifest')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (defaults to one per CPU)')
+    parser.add_argument('--force', action='store_true', help='rebuild everything, even what is up to date')
+    args = parser.parse_args()
+
+    from wttr import pill                                                   # the colours the cards tint icons in, and the white they tint
+
+    start = time.perf_counter()
+    counts = build(pill.TINTED_ICONS, pill.ICON_COLOURS, jobs=args.jobs, force=args.force)
+    print(f"Built {counts['built']} of {counts['files']} icons into {BUILD_DIR} ({counts['bytes'] / 1024 / 1024:.1f} MiB), "
+          f"removed {counts['removed']}, in {time.perf_counter() - start:.1f}s")
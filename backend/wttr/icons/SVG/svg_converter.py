@@ -1,3 +0,0 @@
-# https://stackoverflow.com/questions/15130670/pil-and-vectorbased-graphics
-# https://stackoverflow.com/questions/6589358/convert-svg-to-png-in-python/6599172#6599172
-# https://stackoverflow.com/questions/51450134/how-to-convert-svg-to-png-or-jpeg-in-python
\ No newline at end of file
@@ -1,11 +1,14 @@
 ### IMPORTS
 from PIL import Image, ImageDraw, ImageFont     # Importing PIL to generate and manipulate  images
 from PIL import ImageColor                      # To convert #Hex colour to R,G,B
-from io import BytesIO                          # Used to store the output images in memory instead of saving them to disk
 
-from .text import Text, Font                     # My own script with a Text class and Enumerator of Fonts
+from .text import Text, Font, GLYPH_CACHE, TEMPERATURES    # My own script with a Text class, Enumerator of Fonts and cache of rasterized text
 from . import weather_codes                            # Lookup dictionary to convert Weather Code into the appropriate icon
-from . import recolour                                 # My script to recolour imagines using PIL and NumPy to a new solid colour
+from .atlas import IconAtlas                           # Every icon (and its recoloured variants) decoded once at startup
+from .encode import encode_card                        # Saves the finished card as PNG/WebP/etc
+from .assetpack import ASSETS                          # Templates and icons already decoded, memory-mapped and shared between processes
+from .iconbuild import Manifest                        # Where the built icons (or else the exports) are
+from . import timing                                   # Records how long each stage of drawing a card takes
 
 
 
@@ -29,15 +32,12 @@ def paste_forecast_icons(canvas:Image, forecast_codes:list, y_pos:int, coloured_
     '''
     for i, code in enumerate(forecast_codes):
         icon_name = weather_codes.WWO_CODE[code]                    # getting the image name
-        icon_path = ICONS_64.format(icon_name)                      # getting the full image path
 
-        icon = Image.open(icon_path)                                # opening the image
-        icon = icon.convert('RGBA')                                 # converting to transparent format
-        # icon = icon.resize((64, 64), Image.LANCZOS)
-
-        if coloured_icons:                                           # recolouring the icon if a colour has been specified (for dark mode)
+        if coloured_icons:                                           # using the recoloured icon if a colour has been specified (for dark mode)
             colour = DARK_FRCST_COLOURS[i]
-            icon = recolour.recolour(icon, ICON_COLOUR_64, colour)
+            icon = ICON_ATLAS.tinted(icon_name, 64, colour)
+        else:
+            icon = ICON_ATLAS.get(icon_name, 64)                    # already decoded as RGBA at startup
 
 
         position = (icons_pos_x[i], y_pos)                          # getting the icon position
@@ -45,6 +45,17 @@ def paste_forecast_icons(canvas:Image, forecast_codes:list, y_pos:int, coloured_
 
     return canvas
 
+# Creating the subtitle above the city name
+def create_datetime_text(datetime:str, accent:str, colour_headings=True) -> Text:
+    '''
+    The small text above the city name: the local time on the hourly card, the date on tomorrow's.
+
+    datetime: The time or date to show
+    accent: Colour to accent the main text (in #Hex code)
+    colour_headings: Whether it should be accent coloured
+    '''
+    return Text(datetime, (100, 80), Font.CONDENSED, accent if colour_headings else DARK_TXT_COLOUR)
+
 # Creating Text elements
 def create_text_elements(city:str, temp:str, datetime:str, forecast_temps:list, accent:str, y_pos:int, colours:list, colour_headings=True):
     '''
@@ -52,7 +63,7 @@ def create_text_elements(city:str, temp:str, datetime:str, forecast_temps:list,
 
     city: Name of the city in uppercase
     temp: The temperature to highlight in big numbers (current or average forcast)
-    datetime: Subtitle above city name (either current local time or forecast's local date)
+    datetime: Subtitle above city name (either current local time or forecast's local date), None to leave it out
     forecast_temps: List of hourly forecast temperatures
     accent: Colour to accent the main text (in #Hex code)
     y_pos: Position in the Y-axis for the forecast temperature text
@@ -62,9 +73,10 @@ def create_text_elements(city:str, temp:str, datetime:str, forecast_temps:list,
 
     # Main Text
     city = Text(city,           (100, 148), Font.BOLD_CONDENSED,    accent if colour_headings else DARK_TXT_COLOUR  )
-    datetime = Text(datetime,   (100, 80),  Font.CONDENSED,         accent if colour_headings else DARK_TXT_COLOUR  )
     temp = Text(temp,           (900, 132), Font.BOLD,              accent,                             anchor='rm' )
-    text_elements = [city, temp, datetime]
+    text_elements = [city, temp]
+    if datetime is not None:                                        # left out of the hourly card's base layer, it's drawn on every render
+        text_elements.append(create_datetime_text(datetime, accent, colour_headings))
 
     # Forecast temps
     for i, f in enumerate(forecast_temps):
@@ -84,7 +96,7 @@ def draw_text_elements(canvas:Image, text_elements:list):
     '''
     draw = ImageDraw.Draw(canvas)
     for t in text_elements:
-        draw.text(t.position, t.text, t.colour, t.font.value, t.anchor)
+        GLYPH_CACHE.draw(draw, t)                                   # same pixels as draw.text, without re-rasterizing known strings
     
     return canvas
 
@@ -107,7 +119,7 @@ def create_weather_card_simplified(city:str, temperature:str, time:str, weather_
 
     # LOADING AND PASTING WEATHER ICON
     icon_name =  weather_codes.WWO_CODE[weather_code]
-    icon_path = f'./wttr/icons/{icon_name}.png'
+    icon_path = ICON_MANIFEST.path(icon_name, 800)
     icon = Image.open(icon_path)
     canvas.paste(icon, ICON_POS)
 
@@ -131,16 +143,16 @@ def create_weather_card_simplified(city:str, temperature:str, time:str, weather_
 ###### REPORT 2.0 #################################################
 ### Constants
 import os
+import threading
+from collections import OrderedDict
 
 TEMPLATE        = './wttr/templates/template_current.png'               # path to the image template
-TEMPLATE_IMG    = Image.open(TEMPLATE)                                  # opens the template and stores it in memory
+TEMPLATE_IMG    = ASSETS.image(TEMPLATE, 'RGB')                         # the decoded template, mapped from the asset pack (RGBX) if it's been built
 
 MARKER          = './wttr/templates/marker.png'                         # path to the daily progress marker
-MARKER_IMG      = Image.open(MARKER).convert('RGBA')                    # opens the marker icon with alpha layer and stores it in memory
+MARKER_IMG      = ASSETS.image(MARKER, 'RGBA')                          # the marker icon with alpha layer
 marker_pos_y = 1051                                                     # position of the progress marker in the y-axis on top of the timeline
 
-ICONS_64 = './wttr/icons/64/{}.png'                                     # f-string path to the small 64x64 mono icons
-
 icons_pos_y = 1069                                                      # position of the 64px icons in the y-axis
 icons_pos_x = [134, 267, 400, 533, 666, 799]                            # positions of the 64px icons in the x-axis
 
@@ -148,10 +160,119 @@ forecast_pos_y = 1183                                                   # positi
 forecast_pos_x = [171, 306, 439, 572, 705, 839]                         # positions of the text in the x-axis
 forecast_colours = ['#A5C3C8', '#65ADC4', '#FCC017', '#E19525', '#863C3D', '#26202C']   # colours of the forecast text
 
+GLYPH_CACHE.prerender(Font.BOLD_SMALL, TEMPERATURES, 'mm')             # the six forecast temperatures
+GLYPH_CACHE.prerender(Font.BOLD, TEMPERATURES, 'rm')                   # the big current/average temperature
+
+
+BASE_LAYER_BYTES = TEMPLATE_IMG.width * TEMPLATE_IMG.height * len(MODE)  # one hourly base layer, ~3.8MB
+BASE_LAYER_MEMORY = int(os.getenv('BASE_LAYER_MEMORY', 64 * 1024 * 1024))   # hourly base layers kept, split between every process drawing cards
+OVERLAY_PADDING = 2                                                     # pixels around the time text's box, for its anti-aliasing
+
+_BASE_LAYERS = OrderedDict()                                            # (city, temp, code, forecast, codes) -> HourlyBase, least recently used first
+_BASE_LAYERS_LOCK = threading.Lock()
+_base_layer_limit = max(2, BASE_LAYER_MEMORY // BASE_LAYER_BYTES)
+
+def share_base_layers(processes:int) -> None:
+    '''
+    Sizes this process's base layer cache for its share of BASE_LAYER_MEMORY, called in every render worker.
+    Each worker keeps its own layers, so the more workers, the fewer each keeps (and the less often a forecast's layer is already there).
+    '''
+    global _base_layer_limit
+    _base_layer_limit = max(2, BASE_LAYER_MEMORY // (BASE_LAYER_BYTES * max(1, processes)))
+
+class HourlyBase:
+    '''
+    The hourly card for one forecast, without the local time and the progress marker, shared by every render of that forecast.
+    Renders draw those two straight onto it and put back the pixels they covered afterwards, holding lock all along.
+    '''
+    __slots__ = ('image', 'accent', 'lock')
+
+    def __init__(self, image:Image, accent:str) -> None:
+        self.image  = image
+        self.accent = accent
+        self.lock   = threading.Lock()
+
+def draw_hourly_base(city: str, current_temp:str, current_code:str, forecast:tuple, forecast_codes:tuple) -> Image:
+    '''
+    Draws everything on the hourly card that only changes with the forecast: the template, both sets of icons, the city and every temperature.
+    Only the local time and the progress marker are missing (see draw_hourly_overlay).
+
+    Arguments are the same as draw_weather_card_hourly's.
+    '''
+    with timing.stage('icons'):
+        # Copying the template image
+        canvas = TEMPLATE_IMG.convert(MODE)                                 # a copy, turning RGBX back into RGB if it came from the pack
+
+        # Pasting the weather icon
+        icon_name =  weather_codes.WWO_CODE[current_code]
+        icon = ICON_ATLAS.get(icon_name, 800)
+        canvas.paste(icon, ICON_POS)
+
+        # Pasting forecast icons
+        canvas = paste_forecast_icons(canvas, forecast_codes, icons_pos_y)
+    
+    # Getting accent colour
+    accent = weather_codes.ACCENT_COLOUR[weather_codes.WWO_CODE[current_code]]
+
+    with timing.stage('text'):
+        # Creating Text elements (all but the time)
+        text = create_text_elements(city, current_temp, None, forecast, accent, forecast_pos_y, forecast_colours)
+
+        # Adding Text elements to canvas
+        canvas = draw_text_elements(canvas, text)
+
+    return canvas
+
+def hourly_base(city: str, current_temp:str, current_code:str, forecast:list, forecast_codes:list) -> HourlyBase:
+    '''
+    The base layer for this forecast, drawn once and then reused until the forecast changes. Only draw on it holding its lock (see render_hourly).
+    '''
+    key = (city, current_temp, current_code, tuple(forecast), tuple(forecast_codes))
+
+    with _BASE_LAYERS_LOCK:
+        base = _BASE_LAYERS.get(key)
+        if base is not None:
+            _BASE_LAYERS.move_to_end(key)
+            return base
+
+    image = draw_hourly_base(*key)                                      # two threads may both draw a new forecast, they'd draw the same pixels
+    accent = weather_codes.ACCENT_COLOUR[weather_codes.WWO_CODE[current_code]]
+
+    with _BASE_LAYERS_LOCK:
+        base = _BASE_LAYERS.setdefault(key, HourlyBase(image, accent))      # the one every thread draws on
+        while len(_BASE_LAYERS) > _base_layer_limit:
+            _BASE_LAYERS.popitem(last=False)
+
+    return base
+
+def overlay_boxes(canvas:Image, time:str, accent:str, progress:int) -> list:
+    '''The boxes draw_hourly_overlay draws in: around the local time, and under the progress marker'''
+    t = create_datetime_text(time, accent)
+    left, top, right, bottom = ImageDraw.Draw(canvas).textbbox(t.position, t.text, t.font.value, t.anchor)
+    p = OVERLAY_PADDING
+
+    return [
+        (int(left) - p, int(top) - p, int(right) + p, int(bottom) + p),
+        (progress, marker_pos_y, progress + MARKER_IMG.width, marker_pos_y + MARKER_IMG.height),
+    ]
+
+def draw_hourly_overlay(canvas:Image, time:str, accent:str, progress:int) -> Image:
+    '''Draws the local time and the progress marker onto a base layer'''
+    with timing.stage('text'):
+        # Adding the local time (drawn after the city name, like it always was, in case their pixels touch)
+        canvas = draw_text_elements(canvas, [create_datetime_text(time, accent)])
+    
+    with timing.stage('icons'):
+        # Adding day progress marker
+        canvas.paste(MARKER_IMG, (progress, marker_pos_y), mask=MARKER_IMG)
 
-def create_weather_card_hourly(city: str, current_temp:str, current_code:str, time:str, forecast:list, forecast_codes:list, progress=int):
+    return canvas
+
+def draw_weather_card_hourly(city: str, current_temp:str, current_code:str, time:str, forecast:list, forecast_codes:list, progress=int) -> Image:
     '''
-    Creates a weather card with six tri-hourly forecasts. (from 9AM to midnight)
+    Draws a weather card with six tri-hourly forecasts. (from 9AM to midnight)
+    The forecast part comes from a cached base layer, and the time and the marker are drawn on a copy of it.
+    Use render_hourly to encode a card without copying the whole canvas.
 
     city: Name of the city to report on the weather
     current_temp: Current temperature there in Celsius
@@ -161,37 +282,41 @@ def create_weather_card_hourly(city: str, current_temp:str, current_code:str, ti
     forecast_codes: List of hourly forecasted conditions at [9AM, 12PM, 3PM, 6PM, 9PM, 12AM]
     progress: Amount of minutes elapsed into current day
     '''
-    
-    # Copying the template image
-    canvas = TEMPLATE_IMG.copy()
+    base = hourly_base(city, current_temp, current_code, forecast, forecast_codes)
 
-    # Loading and pasting the weather icon
-    icon_name =  weather_codes.WWO_CODE[current_code]
-    icon_path = f'./wttr/icons/{icon_name}.png'
-    icon = Image.open(icon_path)
-    canvas.paste(icon, ICON_POS)
+    with base.lock, timing.stage('icons'):
+        canvas = base.image.copy()
 
-    # Loading and pasting forecast icons
-    canvas = paste_forecast_icons(canvas, forecast_codes, icons_pos_y)
-    
-    # Getting accent colour
-    accent = weather_codes.ACCENT_COLOUR[weather_codes.WWO_CODE[current_code]]
+    return draw_hourly_overlay(canvas, time, base.accent, progress)
 
-    # Creating Text elements
-    text = create_text_elements(city, current_temp, time, forecast, accent, forecast_pos_y, forecast_colours)
+def render_hourly(base:HourlyBase, time:str, progress:int, image_format:str='png'):
+    '''
+    Encodes the hourly card straight from its shared base layer: draws the time and the marker on it, encodes it,
+    then puts back the few strips of pixels they covered, so only those strips are copied instead of the whole canvas.
+    '''
+    with base.lock:
+        boxes = overlay_boxes(base.image, time, base.accent, progress)
+        covered = [(box, base.image.crop(box)) for box in boxes]
 
-    # Adding Text elements to canvas
-    canvas = draw_text_elements(canvas, text)
-    
-    # Adding day progress marker
-    marker = MARKER_IMG.copy()
-    canvas.paste(marker, (progress, marker_pos_y), mask=marker)
+        try:
+            draw_hourly_overlay(base.image, time, base.accent, progress)
 
-    # Saving the created image to memory in BytesIO as a "file-like object" -> https://stackoverflow.com/questions/60006794/send-image-from-memory
-    weather_card = BytesIO()
-    canvas.save(weather_card, format='PNG')
+            # Saving the created image to memory in BytesIO as a "file-like object"
+            with timing.stage('encode'):
+                return encode_card(base.image, image_format)
 
-    return weather_card
+        finally:
+            for box, pixels in covered:
+                base.image.paste(pixels, box)
+
+def create_weather_card_hourly(city: str, current_temp:str, current_code:str, time:str, forecast:list, forecast_codes:list, progress=int, image_format='png'):
+    '''
+    Creates a weather card with six tri-hourly forecasts and saves it to memory. (see draw_weather_card_hourly and render_hourly)
+
+    image_format: How to encode the card (see encode.FORMATS)
+    '''
+    base = hourly_base(city, current_temp, current_code, forecast, forecast_codes)
+    return render_hourly(base, time, progress, image_format)
 
 
 
@@ -206,11 +331,11 @@ tomorrow_condition_pos = (540, 50)                                      # positi
 
 ### Light Mode Constants
 FORECAST        = './wttr/templates/template_tomorrow.png'              # path to the image template
-FORECAST_IMG    = Image.open(FORECAST)                                  # opens the template and stores it in memory
+FORECAST_IMG    = ASSETS.image(FORECAST, 'RGB')                         # the decoded template, mapped from the asset pack (RGBX) if it's been built
 
 ### Dark Mode Constants
 DARK_FORECAST       = './wttr/templates/template_tomorrow_dark_alt.png'
-DARK_FORECAST_IMG   = Image.open(DARK_FORECAST).convert('RGBA')
+DARK_FORECAST_IMG   = ASSETS.image(DARK_FORECAST, 'RGBA')
 DARK_TXT_COLOUR     = "#DFDEDC"
 dark_colours_hex    = ['#A5C3C8', '#65ADC4', '#FCC017', '#E19525', '#863C3D', '#AC97BE']
 DARK_FRCST_COLOURS  = [ImageColor.getcolor(x, 'RGB') for x in dark_colours_hex]
@@ -218,6 +343,7 @@ DARK_FRCST_COLOURS  = [ImageColor.getcolor(x, 'RGB') for x in dark_colours_hex]
 ### Dictionary of function arguments for each mode
 LIGHT_MODE_VARS = {
     "canvas": FORECAST_IMG,
+    "mode": 'RGB',
     "coloured_icons": False,
     "colours": forecast_colours,
     "colour_headings": True
@@ -225,14 +351,27 @@ LIGHT_MODE_VARS = {
 
 DARK_MODE_VARS = {
     "canvas": DARK_FORECAST_IMG,
+    "mode": 'RGBA',
     "coloured_icons": True,
     "colours": dark_colours_hex,
     "colour_headings": False
 }
 
-def create_tomorrow_forecast(city:str, avg_temp:str, condition_code:str, date:str, forecast:list, forecast_codes:list, transparent=False):
+### Icon atlas with every icon and every colour variant the cards need
+ICON_COLOURS = {128: ICON_COLOUR, 64: ICON_COLOUR_64}
+TINTED_ICONS = {                                                                                        # icon size -> the colours its mono icons are tinted in (built ahead by python -m wttr.iconbuild)
+    64:  DARK_FRCST_COLOURS,                                                                            # dark mode forecast icons
+    128: [ImageColor.getcolor(x, 'RGB') for x in weather_codes.ACCENT_COLOUR.values()],                 # tomorrow's condition icon
+}
+
+ICON_MANIFEST = Manifest.load()
+ICON_ATLAS = IconAtlas(ICON_MANIFEST, ICON_COLOURS, load=ASSETS.image)
+for size, colours in TINTED_ICONS.items():
+    ICON_ATLAS.prerender(size, colours)                                                                 # only the ones that weren't built
+
+def draw_tomorrow_forecast(city:str, avg_temp:str, condition_code:str, date:str, forecast:list, forecast_codes:list, transparent=False) -> Image:
     '''
-    Creates a weather card for tomorrow's conditions with six tri-hourly forecasts. (from 9AM to midnight)
+    Draws a weather card for tomorrow's conditions with six tri-hourly forecasts. (from 9AM to midnight)
 
     city: Name of the city to report on the weather
     avg_temp: Average forecasted temperature in Celsius
@@ -245,33 +384,81 @@ def create_tomorrow_forecast(city:str, avg_temp:str, condition_code:str, date:st
     # Getting all the default values of the correct mode at once instead of having a ton of ifs
     VARS = LIGHT_MODE_VARS if not transparent else DARK_MODE_VARS
 
-    # Copying the template image
-    canvas = VARS['canvas'].copy()
-
     # Getting accent colour
     accent = weather_codes.ACCENT_COLOUR[weather_codes.WWO_CODE[condition_code]]
     accent_rgb = ImageColor.getcolor(accent, 'RGB') # converting it to RGB for the recolour script
 
-    # Loading and pasting the weather icon
-    icon_name =  weather_codes.WWO_CODE[condition_code]
-    icon_path = f'./wttr/icons/128/{icon_name}.png'
-    icon = Image.open(icon_path)
+    with timing.stage('icons'):
+        # Copying the template image
+        canvas = VARS['canvas'].convert(VARS['mode'])                       # a copy, turning RGBX back into RGB if it came from the pack
 
-    # Colouring the icon to fit its accent colour
-    coloured_icon = recolour.recolour(icon, ICON_COLOUR, accent_rgb)
-    canvas.paste(coloured_icon, tomorrow_condition_pos, mask=coloured_icon)
+        # Pasting the weather icon, coloured to fit its accent colour
+        icon_name =  weather_codes.WWO_CODE[condition_code]
+        coloured_icon = ICON_ATLAS.tinted(icon_name, 128, accent_rgb)
+        canvas.paste(coloured_icon, tomorrow_condition_pos, mask=coloured_icon)
 
-    # Loading and pasting forecast icons
-    canvas = paste_forecast_icons(canvas, forecast_codes, tomorrow_icons_pos_y, coloured_icons=VARS['coloured_icons'])
+        # Loading and pasting forecast icons
+        canvas = paste_forecast_icons(canvas, forecast_codes, tomorrow_icons_pos_y, coloured_icons=VARS['coloured_icons'])
 
-    # CREATING TEXT ELEMENTS
-    text = create_text_elements(city, avg_temp, date, forecast, accent, tomorrow_text_pos_y, colours=VARS['colours'], colour_headings=VARS['colour_headings'])
+    with timing.stage('text'):
+        # CREATING TEXT ELEMENTS
+        text = create_text_elements(city, avg_temp, date, forecast, accent, tomorrow_text_pos_y, colours=VARS['colours'], colour_headings=VARS['colour_headings'])
+
+        # ADDING TEXT ELEMENTS TO CANVAS
+        canvas = draw_text_elements(canvas, text)
+
+    return canvas
+
+def create_tomorrow_forecast(city:str, avg_temp:str, condition_code:str, date:str, forecast:list, forecast_codes:list, transparent=False, image_format='png'):
+    '''
+    Creates a weather card for tomorrow's conditions and saves it to memory. (see draw_tomorrow_forecast)
 
-    # ADDING TEXT ELEMENTS TO CANVAS
-    canvas = draw_text_elements(canvas, text)
+    image_format: How to encode the card (see encode.FORMATS)
+    '''
+    canvas = draw_tomorrow_forecast(city, avg_temp, condition_code, date, forecast, forecast_codes, transparent)
+
+    # Saving the created image to memory in BytesIO as a "file-like object"
+    with timing.stage('encode'):
+        weather_card = encode_card(canvas, image_format)
+
+    return weather_card
+
+
+
+###### WHOLE FORECAST #################################################
+def draw_week_forecast(city:str, days:list, transparent=False) -> Image:
+    '''
+    Draws a tomorrow-style card for every forecasted day, stacked top to bottom in one strip.
+    The days share the work that repeats between them: icons come tinted from the atlas and the city name is only rasterized once.
+
+    city: Name of the city to report on the weather
+    days: List of dictionaries with the avg_temp, condition_code, date, forecast and forecast_codes of each day (see draw_tomorrow_forecast)
+    transparent: If the background should be transparent (dark mode). Otherwise light mode.
+    '''
+    VARS = LIGHT_MODE_VARS if not transparent else DARK_MODE_VARS
+    width, height = VARS['canvas'].size
+
+    with timing.stage('icons'):
+        strip = Image.new(VARS['mode'], (width, height * len(days)))
+
+    for i, day in enumerate(days):
+        card = draw_tomorrow_forecast(city, **day, transparent=transparent)
+
+        with timing.stage('icons'):
+            strip.paste(card, (0, i * height))
+
+    return strip
+
+def create_week_forecast(city:str, days:list, transparent=False, image_format='png'):
+    '''
+    Creates a strip with every forecasted day and saves it to memory. (see draw_week_forecast)
+
+    image_format: How to encode the card (see encode.FORMATS)
+    '''
+    canvas = draw_week_forecast(city, days, transparent)
 
-    # Saving the created image to memory in BytesIO as a "file-like object" -> https://stackoverflow.com/questions/60006794/send-image-from-memory
-    weather_card = BytesIO()
-    canvas.save(weather_card, format='PNG')
+    # Saving the created image to memory in BytesIO as a "file-like object"
+    with timing.stage('encode'):
+        weather_card = encode_card(canvas, image_format)
 
     return weather_card
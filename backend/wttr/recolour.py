@@ -1,25 +1,127 @@
 # recolouring an image using numpy
 ### Re-colouring an image using PIL and NumPy
 # from : https://stackoverflow.com/questions/3752476/python-pil-replace-a-single-rgba-color
+#
+# Instead of only swapping pixels that exactly match the old colour, every pixel gets a coverage weight for how close it is
+# to the old colour, so anti-aliased pixels that were blended into something else get tinted proportionally instead of
+# keeping a white fringe. The weights are worked out once per icon (RecolourMask), after which any tint is one
+# multiply-add, and many icons and colours can be tinted in the same NumPy operation (recolour_batch).
 
 from PIL import Image
 import numpy as np
+import sys
+import threading
 
 # re-colour SVG: https://stackoverflow.com/questions/61824128/python-change-color-in-svg-and-export-to-svg-png-pdf
 
 
+### CONSTANTS
+BYTE_SHIFTS = np.array([0, 8, 16, 24] if sys.byteorder == 'little' else [24, 16, 8, 0], dtype=np.uint32)[:, None]   # where R,G,B,A sit in a 32-bit pixel
+BATCH_PIXELS = 16384                                                                                    # recolour_batch works on about this many pixels at a time
+TOLERANCE = 48                                                                                          # pixels this far from the old colour (on their furthest channel) aren't recoloured at all
+
+
+class RecolourMask:
+    def __init__(self, image:Image, old_colour:tuple, tolerance:int=TOLERANCE) -> None:
+        '''
+        Works out once how much of each pixel of image is old_colour, so it can be tinted any colour cheaply.
+        Only the pixels that are (partly) old_colour are kept, the rest are copied from the original as they are.
+
+        image: RGBA image to recolour
+        old_colour: The (R,G,B) colour to replace
+        tolerance: How far from old_colour a pixel can be and still be (partly) recoloured
+        '''
+        data = np.asarray(image.convert('RGBA'))
+        visible = np.flatnonzero(data[..., 3])                                                          # transparent pixels are never recoloured
+        rgba = data.reshape(-1, 4)[visible].astype(np.float32)
+        old = np.array(old_colour, dtype=np.float32)
+
+        distance = np.abs(rgba[:, :3] - old).max(axis=-1)                                               # 0 for exact matches
+        weight = np.clip(1 - distance / tolerance, 0, 1)                                                # coverage of the old colour in each pixel
+        shade = np.clip(rgba[:, :3].mean(axis=-1) / old.mean(), 0, 1)                                   # darker pixels (shading, edges) stay darker once tinted
+        covered = weight > 0
+
+        self.size   = image.size
+        self.pixels = visible[covered]                                                                  # indexes of the pixels that get recoloured
+        self.scale  = (weight * shade)[None, covered]                                                   # (1, pixels): tinted = keep + scale * new colour
+
+        keep = rgba[covered]
+        keep[:, :3] *= 1 - weight[covered, None]                                                        # what's left of the original colour (alpha is kept as is)
+        keep += 0.5                                                                                     # +0.5 rounds when truncating, added after scaling so it stays a whole half
+        self.keep   = np.ascontiguousarray(keep.T)                                                      # (RGBA, pixels), channels first so every operation runs along one long row
+
+        self.original = np.ascontiguousarray(data).view(np.uint32).ravel()                             # one 32-bit word per RGBA pixel
+        self._buffer = np.empty(self.keep.shape, dtype=np.float32)                                      # reused by every tint() call
+        self._lock  = threading.Lock()
+
+    def apply(self, words:np.ndarray) -> Image:
+        '''
+        The whole RGBA image, given the new values of the recoloured pixels.
+
+        words: The recoloured pixels as packed RGBA words (see pack)
+        '''
+        data = self.original.copy()
+        data[self.pixels] = words
+        return Image.frombuffer('RGBA', self.size, data, 'raw', 'RGBA', 0, 1)
+
+    def tint(self, new_colour:tuple) -> Image:
+        '''The image with old_colour swapped for new_colour'''
+        with self._lock:
+            np.multiply(channels(new_colour), self.scale, out=self._buffer)
+            self._buffer += self.keep
+            return self.apply(pack(self._buffer))
+
+
+def pack(tinted:np.ndarray) -> np.ndarray:
+    '''Turns (..., RGBA, pixels) float values (already offset by 0.5) into (..., pixels) 32-bit RGBA words'''
+    channels = tinted.astype(np.uint32)                                                                 # truncates, i.e. rounds
+    channels <<= BYTE_SHIFTS
+    return channels[..., 0, :] | channels[..., 1, :] | channels[..., 2, :] | channels[..., 3, :]
+
+def channels(colour:tuple) -> np.ndarray:
+    '''An (R,G,B) colour as a (RGBA, 1) column with no alpha, to multiply a scale row by'''
+    return np.array(list(colour)[:3] + [0], dtype=np.float32)[:, None]
 
 def recolour(image:Image, old_colour:tuple, new_colour:tuple) -> Image:
-    data = np.array(image)                                                                              # "data" is a height x width 4-dimensional numpy array
-    r, g, b, a = data.T                                                                                 # temporarily unpack the colour channels for readability
+    '''Recolours a single image (use a RecolourMask or recolour_batch to tint the same image more than once)'''
+    return RecolourMask(image, old_colour).tint(new_colour)
+
+def recolour_batch(masks:list, new_colours:list) -> list:
+    '''
+    Tints every mask in every colour, doing the maths for all the masks at once.
+    Returns a list (one per mask) of lists of images (one per colour).
+
+    masks: List of RecolourMask
+    new_colours: List of (R,G,B) colours
+    '''
+    results = [[] for _ in masks]
+    if not new_colours:
+        return results
 
-    
-    replace = (r == old_colour[0]) & (g == old_colour[1]) & (b == old_colour[2])                        # replace current colour with desired colour, leaving alpha values alone
-    data[..., :-1][replace.T] = new_colour                                                              # replacing the values that match the current colour with the new desired colour
+    start = 0
+    while start < len(masks):                                                                           # a few masks at a time, so the arrays stay in the CPU cache
+        end, pixels = start + 1, len(masks[start].pixels)
+        while end < len(masks) and pixels + len(masks[end].pixels) <= BATCH_PIXELS:
+            pixels += len(masks[end].pixels)
+            end += 1
 
-    image_coloured = Image.fromarray(data)                                                              # converts the numpy array back into image format
+        batch = masks[start:end]
+        scale = np.concatenate([mask.scale for mask in batch], axis=1)                                  # (1, pixels of every mask)
+        keep = np.concatenate([mask.keep for mask in batch], axis=1)                                    # (RGBA, pixels of every mask)
+        buffer = np.empty(keep.shape, dtype=np.float32)
+        offsets = np.cumsum([0] + [len(mask.pixels) for mask in batch])
 
-    return image_coloured
+        for colour in new_colours:                                                                      # one multiply-add per colour for the whole batch
+            np.multiply(channels(colour), scale, out=buffer)
+            buffer += keep
+            words = pack(buffer)
+
+            for i, mask in enumerate(batch):
+                results[start + i].append(mask.apply(words[offsets[i]:offsets[i + 1]]))
+
+        start = end
+
+    return results
 
 
 
@@ -37,6 +139,6 @@ if __name__ == "__main__":
 
         new_img = recolour(img, colour_to_replace, new_colour)
         new_img.show()
-    
+
 else:
-    print('RECOLOUR IMPORTED')
\ No newline at end of file
+    print('RECOLOUR IMPORTED')
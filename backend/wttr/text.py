@@ -1,6 +1,8 @@
 ### ENUM OF AVAILABLE FONTS
+import threading
+from collections import OrderedDict
 from enum import Enum
-from PIL import ImageFont
+from PIL import ImageFont, ImageDraw, ImageColor
 
 class Font(Enum):
     BOLD            = ImageFont.truetype('wttr/fonts/MyriadPro-Bold.otf',       130)
@@ -16,4 +18,67 @@ class Text:
         self.position   = position
         self.font       = font
         self.colour     = colour
-        self.anchor     = anchor    # https://pillow.readthedocs.io/en/stable/handbook/text-anchors.html
\ No newline at end of file
+        self.anchor     = anchor    # https://pillow.readthedocs.io/en/stable/handbook/text-anchors.html
+
+
+### PRE-RASTERIZED TEXT ###
+TEMPERATURES = [f'{t}º' for t in range(-50, 51)]                    # every temperature a card is realistically going to show
+
+class GlyphCache:
+    '''
+    Keeps the rasterized coverage mask of each string so FreeType only lays out and renders it once.
+    The mask doesn't depend on the colour, which is only applied when compositing, so one entry serves every colour.
+    Pre-rendered strings are kept forever, anything else (like city names) goes into a bounded LRU.
+    Compositing goes through Pillow's internal drawing object (what draw.text uses), falling back on draw.text without it.
+
+    max_entries: How many non pre-rendered strings to keep
+    '''
+    def __init__(self, max_entries:int=1024) -> None:
+        self.max_entries    = max_entries
+        self._fixed         = {}                                        # (font, text, anchor, mode) -> (mask, offset), never evicted
+        self._recent        = OrderedDict()                             # same, least recently used first
+        self._lock          = threading.Lock()
+
+    @staticmethod
+    def rasterize(font:Font, text:str, anchor:str, mode:str='L'):
+        '''Exactly what ImageDraw.text does for a single line at an integer position'''
+        return font.value.getmask2(text, mode, anchor=anchor, start=(0.0, 0.0))
+
+    def prerender(self, font:Font, strings:list, anchor:str, mode:str='L') -> None:
+        for text in strings:
+            self._fixed[(font, text, anchor, mode)] = self.rasterize(font, text, anchor, mode)
+
+    def get(self, font:Font, text:str, anchor:str, mode:str='L'):
+        '''The (mask, offset) for text, rasterizing it on a miss'''
+        key = (font, text, anchor, mode)
+        glyphs = self._fixed.get(key)
+        if glyphs is not None:
+            return glyphs
+
+        with self._lock:
+            glyphs = self._recent.get(key)
+            if glyphs is not None:
+                self._recent.move_to_end(key)
+                return glyphs
+
+        glyphs = self.rasterize(font, text, anchor, mode)
+        with self._lock:
+            self._recent[key] = glyphs
+            if len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+
+        return glyphs
+
+    def draw(self, draw:ImageDraw.ImageDraw, t:Text) -> None:
+        '''Composites a Text element onto the canvas behind draw, pixel for pixel like draw.text would'''
+        core = getattr(draw, 'draw', None)                              # not public API, so it may change with Pillow
+        if '\n' in t.text or draw.palette or not (hasattr(core, 'draw_bitmap') and hasattr(core, 'draw_ink')):   # multiline layout isn't cached, palette canvases map colours themselves
+            draw.text(t.position, t.text, t.colour, t.font.value, t.anchor)
+            return
+
+        mask, offset = self.get(t.font, t.text, t.anchor, draw.fontmode)
+        colour = ImageColor.getcolor(t.colour, draw.mode) if isinstance(t.colour, str) else t.colour
+        x, y = int(t.position[0]) + offset[0], int(t.position[1]) + offset[1]
+        core.draw_bitmap((x, y), mask, core.draw_ink(colour))
+
+GLYPH_CACHE = GlyphCache()
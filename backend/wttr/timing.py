@@ -0,0 +1,64 @@
+### STAGE TIMING
+### Records how long each stage of building a card takes (fetching, parsing, icons, text, encoding...)
+### for whichever request is currently running. Nothing is recorded unless a request started collecting,
+### so the only cost outside of one is a context variable lookup.
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+_STAGES = ContextVar('stages', default=None)                        # list of (stage, seconds) for the running request, or None
+
+
+def start() -> list:
+    '''Starts collecting stage timings in the current context and returns the list they'll be added to'''
+    stages = []
+    _STAGES.set(stages)
+    return stages
+
+def stop() -> None:
+    '''Stops collecting in the current context'''
+    _STAGES.set(None)
+
+def record(name:str, seconds:float) -> None:
+    '''Adds a stage measured elsewhere (e.g. in a render worker process)'''
+    stages = _STAGES.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+def extend(measured:list) -> None:
+    '''Adds several (stage, seconds) pairs at once'''
+    stages = _STAGES.get()
+    if stages is not None:
+        stages.extend(measured)
+
+@contextmanager
+def stage(name:str):
+    '''Times the code inside the with block as one stage'''
+    stages = _STAGES.get()
+    if stages is None:
+        yield
+        return
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages.append((name, time.perf_counter() - start_time))
+
+@contextmanager
+def collect():
+    '''Collects the stages timed inside the with block into a fresh list (used where the caller isn't a request, like render workers)'''
+    token = _STAGES.set([])
+    try:
+        yield _STAGES.get()
+    finally:
+        _STAGES.reset(token)
+
+def totals(stages:list) -> dict:
+    '''Adds up repeated stages, keeping the order they first ran in'''
+    summed = {}
+    for name, seconds in stages:
+        summed[name] = summed.get(name, 0) + seconds
+    return summed
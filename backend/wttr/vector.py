@@ -0,0 +1,238 @@
+### VECTOR CARDS
+### The same cards pill.py draws, written out as SVG documents instead: the templates' timeline blocks are rectangles,
+### the text is <text> with the same positions, fonts and colours, and the mono icons from icons/SVG are inlined once
+### per card as <symbol>s and tinted with currentColor. Nothing is rasterized or encoded, it's all string formatting.
+
+import re
+from html import escape
+from io import BytesIO
+
+from . import pill                                     # Layout constants, colours and the Text elements of the raster cards
+from . import weather_codes                            # Lookup dictionary to convert Weather Code into the appropriate icon
+from . import timing                                   # Records how long each stage of drawing a card takes
+from .text import Font
+
+
+### CONSTANTS
+ICONS_SVG = './wttr/icons/SVG/{}.svg'                                  # f-string path to the vector mono icons (drawn on a 256x256 grid)
+ICON_WHITE = '#F8FCFF'                                                  # the mono icons' own shade of white
+
+# Conditions that haven't been drawn as vectors (yet) -> the closest one that has
+SVG_ICON_ALIASES = {
+    "LightRain":            "Rain",
+    "HeavyRain":            "Rain",
+    "HeavyShowers":         "LightShowers",
+    "LightSleet":           "Rain",
+    "LightSleetShowers":    "LightSnowShowers",
+    "HeavySnow":            "LightSnow",
+    "HeavySnowShowers":     "LightSnowShowers",
+    "ThunderyShowers":      "ThunderShowers",
+    "ThunderyHeavyRain":    "ThunderShowers",
+    "ThunderySnowShowers":  "ThunderShowers",
+}
+
+# Each Font as CSS (the Myriad Pro files can't be loaded by an SVG shown as an image, so similar system fonts stand in)
+FONT_CSS = {
+    Font.BOLD:              "font:700 130px 'Myriad Pro',Arial,sans-serif",
+    Font.CONDENSED:         "font:400 64px 'Myriad Pro Condensed','Myriad Pro',Arial Narrow,sans-serif;font-stretch:condensed",
+    Font.BOLD_CONDENSED:    "font:700 72px 'Myriad Pro Condensed','Myriad Pro',Arial Narrow,sans-serif;font-stretch:condensed",
+    Font.BOLD_SMALL:        "font:700 36px 'Myriad Pro',Arial,sans-serif",
+}
+FONT_CLASS = {font: f'f{i}' for i, font in enumerate(Font)}
+STYLE = ''.join(f'.{FONT_CLASS[font]}{{{css}}}' for font, css in FONT_CSS.items()) + 'text{dominant-baseline:central}'
+TEXT_ANCHOR = {'l': 'start', 'm': 'middle', 'r': 'end'}                # horizontal half of Pillow's anchors (the vertical one is always "m")
+
+# The templates, measured from the PNGs
+TIMELINE_X      = 100                                                   # left edge of the six coloured blocks (800px wide in total)
+TIMELINE_WIDTH  = 800
+TIMELINE_COLOURS = ['#A5C3C8', '#65ADC4', '#FEC016', '#E39625', '#873D3E', '#27202D']
+TIMELINE_HEIGHT = 100
+HOURLY_TIMELINE_Y   = 1051
+TOMORROW_TIMELINE_Y = 244
+DARK_TIMELINE       = (336, 9)                                          # y and height of the dark mode's thin gradient line
+DARK_TIMELINE_STOPS = [(0, '#A4C3C8'), (0.19, '#65ADC4'), (0.4, '#FCC017'), (0.6, '#E29626'), (0.78, '#863C3D'), (1, '#403649')]
+MARKER_PATH     = 'M{x} {y}h24l-12 100z'                                # the progress marker: a wedge from 24px wide down to a point
+
+HOURLY_SIZE     = pill.TEMPLATE_IMG.size
+TOMORROW_SIZE   = pill.FORECAST_IMG.size
+CURRENT_ICON    = 800                                                   # sizes the icons are drawn at, same as the PNGs pill pastes
+CONDITION_ICON  = 128
+FORECAST_ICON   = 64
+
+NUMBER          = re.compile(r'-?\d*\.\d+')
+
+
+### ICONS
+def short_number(match:re.Match) -> str:
+    '''A coordinate rounded to a tenth, without the zeros that don't change it ("-0.146" -> "-.1")'''
+    text = f'{float(match.group(0)):.1f}'.rstrip('0').rstrip('.')        # "-0" keeps its sign, it's what separates it from the number before
+    return text.replace('0.', '.', 1) if text.lstrip('-').startswith('0.') else text
+
+def minify_icon(svg:str) -> tuple:
+    '''
+    Strips an Illustrator export down to what's drawn, as (viewBox, inner markup): no prolog, comments or fills
+    (so the icon takes the colour of whatever uses it), and coordinates rounded to a tenth of a unit.
+    '''
+    view_box = re.search(r'viewBox="([^"]+)"', svg).group(1)
+    body = svg[svg.index('>', svg.index('<svg')) + 1:svg.rindex('</svg>')]
+
+    body = re.sub(r'<!--.*?-->', '', body, flags=re.S)
+    body = re.sub(r'\s(?:fill|clip-rule)="[^"]*"', '', body)
+    body = NUMBER.sub(short_number, body)
+    body = re.sub(r'\s+', ' ', body)
+    body = re.sub(r'>\s+<', '><', body).strip()
+
+    return view_box, body
+
+def load_icons(path:str=ICONS_SVG) -> dict:
+    '''Every WWO_CODE icon as (viewBox, markup), using SVG_ICON_ALIASES for the ones without a vector version'''
+    drawn = {}
+    icons = {}
+    for name in set(weather_codes.WWO_CODE.values()):
+        source = SVG_ICON_ALIASES.get(name, name)
+        if source not in drawn:
+            with open(path.format(source), encoding='utf-8') as f:
+                drawn[source] = minify_icon(f.read())
+        icons[name] = drawn[source]
+
+    return icons
+
+ICONS = load_icons()
+
+def tile_colours() -> dict:
+    '''The background of each big 800px icon (read just inside its rounded corner), which the vector version is drawn on instead'''
+    colours = {}
+    for name in ICONS:
+        try:
+            colours[name] = '#{:02X}{:02X}{:02X}'.format(*pill.ICON_ATLAS.get(name, CURRENT_ICON).getpixel((5, 5))[:3])
+        except KeyError:                                                # not drawn at 800px, the accent colour (or the sky's) is close enough
+            colours[name] = weather_codes.ACCENT_COLOUR.get(name, pill.forecast_colours[1])
+    return colours
+
+TILE_COLOURS = tile_colours()
+
+
+### DOCUMENT PIECES
+def definitions(names:list, gradient:bool=False) -> str:
+    '''
+    <defs> with one <symbol> per distinct icon, so a card that shows the same condition six times carries it once.
+
+    gradient: Whether to add dark mode's timeline gradient
+    '''
+    defs = ''.join(f'<symbol id="{name}" viewBox="{ICONS[name][0]}" fill="currentColor">{ICONS[name][1]}</symbol>' for name in dict.fromkeys(names))
+    if gradient:
+        stops = ''.join(f'<stop offset="{offset}" stop-color="{colour}"/>' for offset, colour in DARK_TIMELINE_STOPS)
+        defs += f'<linearGradient id="timeline">{stops}</linearGradient>'
+
+    return f'<defs><style>{STYLE}</style>{defs}</defs>'
+
+def use_icon(name:str, x:int, y:int, size:int, colour:str) -> str:
+    return f'<use href="#{name}" x="{x}" y="{y}" width="{size}" height="{size}" color="{colour}"/>'
+
+def text_element(t) -> str:
+    '''A pill Text as an SVG <text>'''
+    colour = t.colour if isinstance(t.colour, str) else '#{:02X}{:02X}{:02X}'.format(*t.colour)
+    anchor = TEXT_ANCHOR[t.anchor[0]]
+    return f'<text x="{t.position[0]}" y="{t.position[1]}" class="{FONT_CLASS[t.font]}" fill="{colour}" text-anchor="{anchor}">{escape(t.text)}</text>'
+
+def timeline(y:int) -> str:
+    '''The six coloured blocks the forecast sits on'''
+    width = TIMELINE_WIDTH / len(TIMELINE_COLOURS)
+    return ''.join(f'<rect x="{TIMELINE_X + i * width:.2f}" y="{y}" width="{width:.2f}" height="{TIMELINE_HEIGHT}" fill="{colour}"/>'
+                   for i, colour in enumerate(TIMELINE_COLOURS))
+
+def dark_timeline() -> str:
+    '''Dark mode's thin gradient line instead of the blocks'''
+    y, height = DARK_TIMELINE
+    return f'<rect x="{TIMELINE_X}" y="{y}" width="{TIMELINE_WIDTH}" height="{height}" fill="url(#timeline)"/>'
+
+def background(size:tuple) -> str:
+    return f'<rect width="{size[0]}" height="{size[1]}" fill="#FFFFFF"/>'
+
+def document(size:tuple, body:str, names:list, gradient:bool=False) -> bytes:
+    width, height = size
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+            f'{definitions(names, gradient)}{body}</svg>').encode()
+
+
+### HOURLY CARD
+def draw_weather_card_hourly(city: str, current_temp:str, current_code:str, time:str, forecast:list, forecast_codes:list, progress=int) -> bytes:
+    '''
+    The hourly card as SVG, laid out like pill.draw_weather_card_hourly. The big icon is the mono icon on its tile's colour.
+
+    Arguments are the same as pill.draw_weather_card_hourly's.
+    '''
+    icon_name = weather_codes.WWO_CODE[current_code]
+    accent = weather_codes.ACCENT_COLOUR[icon_name]
+    names = [weather_codes.WWO_CODE[code] for code in forecast_codes]
+
+    x, y = pill.ICON_POS
+    body = [
+        background(HOURLY_SIZE),
+        f'<rect x="{x}" y="{y}" width="{CURRENT_ICON}" height="{CURRENT_ICON}" fill="{TILE_COLOURS[icon_name]}"/>',
+        use_icon(icon_name, x, y, CURRENT_ICON, ICON_WHITE),
+        timeline(HOURLY_TIMELINE_Y),
+    ]
+    body += [use_icon(name, pill.icons_pos_x[i], pill.icons_pos_y, FORECAST_ICON, ICON_WHITE) for i, name in enumerate(names)]
+    body += [text_element(t) for t in pill.create_text_elements(city, current_temp, time, forecast, accent, pill.forecast_pos_y, pill.forecast_colours)]
+    body.append(f'<path d="{MARKER_PATH.format(x=progress, y=pill.marker_pos_y)}" fill="#FFFFFF"/>')
+
+    return document(HOURLY_SIZE, ''.join(body), [icon_name] + names)
+
+def create_weather_card_hourly(city: str, current_temp:str, current_code:str, time:str, forecast:list, forecast_codes:list, progress=int, image_format='svg'):
+    '''The hourly card as an SVG document in memory (image_format is only there to match pill's builders)'''
+    with timing.stage('svg'):
+        return BytesIO(draw_weather_card_hourly(city, current_temp, current_code, time, forecast, forecast_codes, progress))
+
+
+### TOMORROW'S FORECAST
+def tomorrow_body(city:str, avg_temp:str, condition_code:str, date:str, forecast:list, forecast_codes:list, transparent=False) -> tuple:
+    '''Everything drawn on tomorrow's card (without the document around it), and the icons it uses'''
+    VARS = pill.LIGHT_MODE_VARS if not transparent else pill.DARK_MODE_VARS
+
+    icon_name = weather_codes.WWO_CODE[condition_code]
+    accent = weather_codes.ACCENT_COLOUR[icon_name]
+    names = [weather_codes.WWO_CODE[code] for code in forecast_codes]
+    icon_colours = pill.dark_colours_hex if VARS['coloured_icons'] else [ICON_WHITE] * len(names)
+
+    x, y = pill.tomorrow_condition_pos
+    body = [dark_timeline()] if transparent else [background(TOMORROW_SIZE), timeline(TOMORROW_TIMELINE_Y)]
+    body.append(use_icon(icon_name, x, y, CONDITION_ICON, accent))
+    body += [use_icon(name, pill.icons_pos_x[i], pill.tomorrow_icons_pos_y, FORECAST_ICON, icon_colours[i]) for i, name in enumerate(names)]
+    body += [text_element(t) for t in pill.create_text_elements(city, avg_temp, date, forecast, accent, pill.tomorrow_text_pos_y,
+                                                                colours=VARS['colours'], colour_headings=VARS['colour_headings'])]
+
+    return ''.join(body), [icon_name] + names
+
+def draw_tomorrow_forecast(city:str, avg_temp:str, condition_code:str, date:str, forecast:list, forecast_codes:list, transparent=False) -> bytes:
+    '''
+    Tomorrow's card as SVG, laid out like pill.draw_tomorrow_forecast.
+
+    Arguments are the same as pill.draw_tomorrow_forecast's.
+    '''
+    body, names = tomorrow_body(city, avg_temp, condition_code, date, forecast, forecast_codes, transparent)
+    return document(TOMORROW_SIZE, body, names, gradient=transparent)
+
+def create_tomorrow_forecast(city:str, avg_temp:str, condition_code:str, date:str, forecast:list, forecast_codes:list, transparent=False, image_format='svg'):
+    '''Tomorrow's card as an SVG document in memory (image_format is only there to match pill's builders)'''
+    with timing.stage('svg'):
+        return BytesIO(draw_tomorrow_forecast(city, avg_temp, condition_code, date, forecast, forecast_codes, transparent))
+
+
+### WHOLE FORECAST
+def draw_week_forecast(city:str, days:list, transparent=False) -> bytes:
+    '''Every forecasted day's card stacked top to bottom, like pill.draw_week_forecast, sharing one set of icon symbols'''
+    width, height = TOMORROW_SIZE
+    body, names = [], []
+
+    for i, day in enumerate(days):
+        day_body, day_names = tomorrow_body(city, **day, transparent=transparent)
+        body.append(f'<g transform="translate(0 {i * height})">{day_body}</g>')
+        names += day_names
+
+    return document((width, height * len(days)), ''.join(body), names, gradient=transparent)
+
+def create_week_forecast(city:str, days:list, transparent=False, image_format='svg'):
+    '''The strip with every forecasted day as an SVG document in memory (image_format is only there to match pill's builders)'''
+    with timing.stage('svg'):
+        return BytesIO(draw_week_forecast(city, days, transparent))